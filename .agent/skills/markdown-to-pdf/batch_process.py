@@ -5,14 +5,23 @@ Batch convert Markdown files in a directory to PDF using converter.py.
 
 import argparse
 import sys
+import time
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 SKILL_DIR = Path(__file__).resolve().parent
 if str(SKILL_DIR) not in sys.path:
     sys.path.insert(0, str(SKILL_DIR))
 
-from converter import Processor, DEFAULT_STYLE, DEFAULT_LANDSCAPE  # noqa: E402
+from converter import (  # noqa: E402
+    BuildManifest,
+    Processor,
+    DEFAULT_JOBS,
+    DEFAULT_LANDSCAPE,
+    DEFAULT_STYLE,
+    manifest_path_for,
+    resolve_jobs,
+)
 
 DEFAULT_INPUT_DIR = "/Users/originrock/dev/World_Travel/destinations/Australia"
 DEFAULT_OUTPUT_DIR = "/Users/originrock/dev/WorldTravel/pdf/intermediate/Australia"
@@ -29,6 +38,66 @@ def collect_markdown_files(input_dir: Path, pattern: str, recursive: bool) -> Li
     return sorted([p for p in candidates if p.is_file()])
 
 
+def batch_convert(
+    input_dir: Path,
+    output_dir: Path,
+    processor: Optional[Processor] = None,
+    pattern: str = DEFAULT_PATTERN,
+    recursive: bool = DEFAULT_RECURSIVE,
+    theme: str = DEFAULT_STYLE,
+    landscape: bool = DEFAULT_LANDSCAPE,
+    header_left: Optional[str] = None,
+    jobs: Optional[int] = None,
+    force: bool = False,
+) -> Tuple[int, List[Tuple[Path, str]]]:
+    """Convert every matching Markdown file under input_dir into output_dir, in process.
+
+    Pass a Processor to reuse its warm caches across calls. Returns the number
+    of files found and the (path, error) pairs of those that failed.
+    """
+    markdown_files = collect_markdown_files(input_dir, pattern, recursive)
+    if not markdown_files:
+        print(f"No Markdown files found in {input_dir} (pattern: {pattern}).")
+        return 0, []
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if processor is None:
+        processor = Processor(SKILL_DIR / "styles")
+    final_jobs = resolve_jobs(jobs if jobs is not None else DEFAULT_JOBS, len(markdown_files))
+
+    tasks = []
+    for md_path in markdown_files:
+        rel_path = md_path.relative_to(input_dir)
+        out_path = output_dir / rel_path.with_suffix(".pdf")
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tasks.append((md_path, out_path))
+
+    # The manifest belongs to this output directory, not to the (possibly shared) Processor
+    previous_manifest = processor.manifest
+    processor.manifest = BuildManifest(manifest_path_for(output_dir))
+    start = time.perf_counter()
+    try:
+        failures = processor.process_many(
+            tasks,
+            theme=theme,
+            jobs=final_jobs,
+            landscape=landscape,
+            header_left=header_left,
+            force=force,
+        )
+    finally:
+        processor.manifest = previous_manifest
+    elapsed = time.perf_counter() - start
+    for md_path, error in failures:
+        print(f"[ERROR] Failed to convert {md_path}: {error}")
+
+    total = len(markdown_files)
+    errors = len(failures)
+    print(f"Batch complete: {total - errors}/{total} succeeded in {elapsed:.1f}s (jobs={final_jobs}). Output: {output_dir}")
+    processor.report_cache_stats()
+    return total, failures
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Batch convert Markdown files in a directory to PDF."
@@ -71,6 +140,17 @@ def main() -> None:
         "--header-left",
         help="Text for the top-left header",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help=f"Parallel worker processes, 0 = all CPU cores (default in script: {DEFAULT_JOBS})",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every PDF even if the build manifest says it is up to date",
+    )
 
     args = parser.parse_args()
 
@@ -92,27 +172,17 @@ def main() -> None:
     if not final_input_dir.exists() or not final_input_dir.is_dir():
         parser.error(f"Input directory not found: {final_input_dir}")
 
-    markdown_files = collect_markdown_files(final_input_dir, final_pattern, final_recursive)
-    if not markdown_files:
-        print(f"No Markdown files found in {final_input_dir} (pattern: {final_pattern}).")
-        return
-
-    final_output_dir.mkdir(parents=True, exist_ok=True)
-    processor = Processor(SKILL_DIR / "styles")
-
-    errors = 0
-    for md_path in markdown_files:
-        rel_path = md_path.relative_to(final_input_dir)
-        out_path = final_output_dir / rel_path.with_suffix(".pdf")
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        try:
-            processor.process(md_path, out_path, theme=final_style, landscape=final_landscape, header_left=args.header_left)
-        except Exception as exc:
-            errors += 1
-            print(f"[ERROR] Failed to convert {md_path}: {exc}")
-
-    total = len(markdown_files)
-    print(f"Batch complete: {total - errors}/{total} succeeded. Output: {final_output_dir}")
+    batch_convert(
+        final_input_dir,
+        final_output_dir,
+        pattern=final_pattern,
+        recursive=final_recursive,
+        theme=final_style,
+        landscape=final_landscape,
+        header_left=args.header_left,
+        jobs=args.jobs,
+        force=args.force,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Reproducible conversion benchmark: Processor.process / batch / merge and merge.py
+over the destinations tree and synthetic stress documents.
+
+Every scenario runs in a fresh interpreter with its own empty cache directory,
+so peak RSS is per scenario and results do not depend on earlier runs. Mermaid
+is replaced by a stub mmdc (via MMDC_PATH) that writes placeholder SVGs, so the
+suite runs offline and measures this code rather than headless Chromium.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SKILL_DIR = Path(__file__).resolve().parent
+if str(SKILL_DIR) not in sys.path:
+    sys.path.insert(0, str(SKILL_DIR))
+
+DEFAULT_DESTINATIONS = SKILL_DIR.parents[2] / "destinations"
+DEFAULT_RUNS = 3
+DEFAULT_THRESHOLD = 0.20  # Allowed slowdown / memory growth vs baseline (0.20 = +20%)
+
+OPERATIONS = ["process", "batch", "merge", "merge.py"]
+CORPORA = ["destinations", "synthetic"]
+
+# Size of the synthetic stress documents
+STRESS_TABLE_ROWS = 2000
+STRESS_MERMAID_BLOCKS = 150
+STRESS_FORMULAS = 600
+
+RESULT_MARKER = "BENCHMARK_RESULT "
+
+STUB_MMDC = '''\
+import re
+import sys
+from pathlib import Path
+
+SVG = (\'<svg xmlns="http://www.w3.org/2000/svg" width="200" height="80" viewBox="0 0 200 80">\'
+       \'<rect width="200" height="80" fill="#eeeeee"/><text x="10" y="45">{label}</text></svg>\')
+
+args = sys.argv[1:]
+if "--version" in args:
+    print("stub-mmdc 0.0")
+    sys.exit(0)
+source = Path(args[args.index("-i") + 1])
+output = Path(args[args.index("-o") + 1])
+if source.suffix == ".md":
+    # Markdown input mode: one out-N.svg per mermaid block
+    blocks = re.findall(r"^```mermaid\\n", source.read_text(encoding="utf-8"), re.MULTILINE)
+    for index in range(1, len(blocks) + 1):
+        (output.parent / f"{output.stem}-{index}.svg").write_text(SVG.format(label=f"diagram {index}"), encoding="utf-8")
+else:
+    output.write_text(SVG.format(label="diagram"), encoding="utf-8")
+'''
+
+
+def write_stub_mmdc(directory: Path) -> Path:
+    script = directory / "mmdc"
+    script.write_text(f"#!{sys.executable}\n{STUB_MMDC}", encoding="utf-8")
+    script.chmod(0o755)
+    return script
+
+
+def write_synthetic_corpus(directory: Path) -> Path:
+    """Write the stress documents (deterministic content) and return their directory."""
+    directory.mkdir(parents=True, exist_ok=True)
+
+    rows = ["| # | City | Item | Cost (USD) | Notes |", "| :--- | :--- | :--- | ---: | :--- |"]
+    rows += [f"| {i} | City {i % 97} | Item {i} | ${i * 7 % 900 + 15} | Row {i} of the stress table |"
+             for i in range(1, STRESS_TABLE_ROWS + 1)]
+    (directory / "huge_table.md").write_text("# Huge Table\n\n" + "\n".join(rows) + "\n", encoding="utf-8")
+
+    blocks = [f"## Diagram {i}\n\n```mermaid\ngraph TD\n    A{i}[Start {i}] --> B{i}[Step {i}]\n    B{i} --> C{i}[End {i}]\n```\n"
+              for i in range(1, STRESS_MERMAID_BLOCKS + 1)]
+    (directory / "many_mermaid.md").write_text("# Many Diagrams\n\n" + "\n".join(blocks), encoding="utf-8")
+
+    formulas = []
+    for i in range(1, STRESS_FORMULAS + 1):
+        if i % 5 == 0:
+            formulas.append(f"$$\n\\sum_{{k=1}}^{{{i}}} \\frac{{k^2}}{{{i} + k}}\n$$\n")
+        else:
+            formulas.append(f"Budget line {i}: $x_{{{i}}} = \\frac{{a + {i}}}{{b}}$ per day.\n")
+    (directory / "many_formulas.md").write_text("# Many Formulas\n\n" + "\n".join(formulas), encoding="utf-8")
+    return directory
+
+
+def markdown_files(corpus_dir: Path) -> List[Path]:
+    return sorted(corpus_dir.rglob("*.md"))
+
+
+class StageTimer:
+    """Instrumentation listener summing the wall time of each conversion stage."""
+
+    def __init__(self, processor):
+        from converter import ProfileRecorder
+
+        self.names = set(ProfileRecorder.STAGES)
+        self.stages: Dict[str, float] = {}
+        processor.instrumentation.add_listener(self)
+
+    def __call__(self, event: Dict) -> None:
+        if event["name"] in self.names:
+            self.stages[event["name"]] = self.stages.get(event["name"], 0.0) + event["duration"]
+
+
+def merge_input_dir(work_dir: Path) -> Path:
+    return work_dir.parent / "merge-input"
+
+
+def output_mb(out_dir: Path) -> float:
+    return sum(p.stat().st_size for p in out_dir.rglob("*.pdf")) / (1024 * 1024) if out_dir.exists() else 0.0
+
+
+def run_scenario(operation: str, corpus_dir: Path, work_dir: Path, font_subset: Optional[str] = None) -> Dict:
+    """Run one scenario in this process and return its measurements."""
+    from converter import DEFAULT_FONT_SUBSET, DEFAULT_STYLE, Processor, peak_rss_mb
+
+    files = markdown_files(corpus_dir)
+    out_dir = work_dir / "out"
+    stages: Dict[str, float] = {}
+    failures = []
+
+    if operation == "merge.py":
+        from merge import merge_directory
+
+        # Intermediate PDFs written beforehand by a separate (untimed) batch run
+        pdf_dir = merge_input_dir(work_dir) / "out"
+        start = time.perf_counter()
+        merged = merge_directory(pdf_dir, out_dir / "merged.pdf", sort_order="asc")
+        wall = time.perf_counter() - start
+        return {"wall_s": wall, "stages": stages, "files": len(merged), "failures": 0, "peak_rss_mb": peak_rss_mb(),
+                "output_mb": output_mb(out_dir)}
+
+    start = time.perf_counter()
+    processor = Processor(SKILL_DIR / "styles", font_subset=font_subset or DEFAULT_FONT_SUBSET)
+    timer = StageTimer(processor)
+    if operation == "process":
+        for md_path in files:
+            target = out_dir / md_path.relative_to(corpus_dir).with_suffix(".pdf")
+            try:
+                processor.process(md_path, target, DEFAULT_STYLE)
+            except Exception as e:
+                failures.append((str(md_path), str(e)))
+    elif operation == "batch":
+        processor.batch(corpus_dir, out_dir, "**/*.md", DEFAULT_STYLE)
+    elif operation == "merge":
+        failures = processor.merge(files, out_dir / "merged.pdf", DEFAULT_STYLE)
+    else:
+        raise ValueError(f"Unknown operation: {operation}")
+    wall = time.perf_counter() - start
+
+    return {
+        "wall_s": wall,
+        "stages": timer.stages,
+        "files": len(files),
+        "failures": len(failures),
+        "peak_rss_mb": peak_rss_mb(),
+        "output_mb": output_mb(out_dir),
+        "cache": processor.cache_stats(),
+    }
+
+
+def run_in_subprocess(operation: str, corpus_dir: Path, work_dir: Path,
+                      stub_mmdc: Path, cache_dir: Path, verbose: bool, font_subset: Optional[str] = None) -> Dict:
+    env = dict(os.environ, MMDC_PATH=str(stub_mmdc), XDG_CACHE_HOME=str(cache_dir))
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--child", operation,
+           "--corpus-dir", str(corpus_dir), "--work-dir", str(work_dir)]
+    if font_subset:
+        cmd += ["--font-subset", font_subset]
+    result = subprocess.run(cmd, cwd=SKILL_DIR, env=env, capture_output=True, text=True)
+    if verbose:
+        print(result.stdout)
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    tail = (result.stderr or result.stdout).strip().splitlines()[-1:] or ["no output"]
+    return {"error": tail[0]}
+
+
+def summarize(samples: List[Dict]) -> Dict:
+    """Median wall time over runs, stage times from the median run, worst peak RSS."""
+    ok = [s for s in samples if "error" not in s]
+    if not ok:
+        return {"error": samples[-1]["error"]}
+    median_run = sorted(ok, key=lambda s: s["wall_s"])[len(ok) // 2]
+    return {
+        "wall_s": round(statistics.median(s["wall_s"] for s in ok), 3),
+        "min_wall_s": round(min(s["wall_s"] for s in ok), 3),
+        "peak_rss_mb": round(max(s["peak_rss_mb"] for s in ok), 1),
+        "output_mb": round(median_run.get("output_mb", 0.0), 2),
+        "stages": {name: round(seconds, 3) for name, seconds in sorted(median_run["stages"].items())},
+        "files": median_run["files"],
+        "failures": median_run["failures"],
+        "runs": len(ok),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name, {})
+        for metric, unit in (("wall_s", "s"), ("peak_rss_mb", " MB")):
+            if metric not in current or metric not in previous:
+                continue
+            if current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {previous[metric]}{unit} -> {current[metric]}{unit}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark Markdown-to-PDF conversion over the destinations tree and synthetic stress documents."
+    )
+    parser.add_argument(
+        "--destinations",
+        default=str(DEFAULT_DESTINATIONS),
+        help="Real corpus directory (default: the repository's destinations/)",
+    )
+    parser.add_argument(
+        "--countries",
+        help="Comma-separated subset of destination folders, e.g. Japan,Australia",
+    )
+    parser.add_argument(
+        "--operations",
+        default=",".join(OPERATIONS),
+        help=f"Comma-separated operations to run (default: {','.join(OPERATIONS)})",
+    )
+    parser.add_argument(
+        "--corpora",
+        default=",".join(CORPORA),
+        help=f"Comma-separated corpora to run (default: {','.join(CORPORA)})",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=DEFAULT_RUNS,
+        help=f"Fresh-process runs per scenario (default: {DEFAULT_RUNS})",
+    )
+    parser.add_argument(
+        "--json",
+        help="Write results to this JSON file",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="Compare against a previous --json result and exit 1 on regression",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Allowed relative slowdown or memory growth vs baseline (default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--font-subset",
+        help="Processor font subset mode for the process/batch/merge runs (weasyprint, document, batch)",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Show the converter output of every run",
+    )
+    # Internal: run a single scenario in this process (used by the parent run)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_scenario(args.child, Path(args.corpus_dir), Path(args.work_dir), args.font_subset)
+        print(RESULT_MARKER + json.dumps(result))
+        return
+
+    operations = [o for o in args.operations.split(",") if o]
+    corpora = [c for c in args.corpora.split(",") if c]
+    for name in operations:
+        if name not in OPERATIONS:
+            parser.error(f"Unknown operation: {name}")
+    for name in corpora:
+        if name not in CORPORA:
+            parser.error(f"Unknown corpus: {name}")
+
+    with tempfile.TemporaryDirectory(prefix="md2pdf_bench_") as tmp:
+        tmp_dir = Path(tmp)
+        stub_mmdc = write_stub_mmdc(tmp_dir)
+        corpus_dirs: Dict[str, Path] = {}
+        if "destinations" in corpora:
+            source = Path(args.destinations)
+            if not source.is_dir():
+                parser.error(f"Destinations directory not found: {source}")
+            if args.countries:
+                # Copy the selected countries so every operation sees the same subset
+                subset = tmp_dir / "destinations"
+                for country in args.countries.split(","):
+                    shutil.copytree(source / country, subset / country)
+                source = subset
+            corpus_dirs["destinations"] = source
+        if "synthetic" in corpora:
+            corpus_dirs["synthetic"] = write_synthetic_corpus(tmp_dir / "synthetic")
+
+        results: Dict[str, Dict] = {}
+        for corpus, corpus_dir in corpus_dirs.items():
+            for operation in operations:
+                name = f"{operation}:{corpus}"
+                samples = []
+                if operation == "merge.py":
+                    setup_dir = merge_input_dir(tmp_dir / "work" / corpus / "merge.py")
+                    run_in_subprocess("batch", corpus_dir, setup_dir, stub_mmdc,
+                                      tmp_dir / "cache" / "merge-input", args.verbose, args.font_subset)
+                for run in range(max(1, args.runs)):
+                    # Cold caches and fresh outputs for every run; merge.py reuses the batch PDFs
+                    work_dir = tmp_dir / "work" / corpus / f"{operation}-{run}"
+                    cache_dir = tmp_dir / "cache" / name.replace(":", "_") / str(run)
+                    samples.append(run_in_subprocess(operation, corpus_dir, work_dir,
+                                                     stub_mmdc, cache_dir, args.verbose, args.font_subset))
+                results[name] = summarize(samples)
+                outcome = results[name]
+                if "error" in outcome:
+                    print(f"{name:<24} failed: {outcome['error']}")
+                    continue
+                stages = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in outcome["stages"].items())
+                print(f"{name:<24} median {outcome['wall_s']:>8.2f}s   peak {outcome['peak_rss_mb']:>7.1f} MB   "
+                      f"output {outcome['output_mb']:>7.2f} MB   {outcome['files']} files" + (f", {outcome['failures']} failed" if outcome["failures"] else ""))
+                if stages:
+                    print(f"{'':<24} {stages}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {args.json}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the Markdown -> HTML stage: a fresh markdown.markdown() call
+per document versus MarkdownPipeline's reused, reset-between-documents parser.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+SKILL_DIR = Path(__file__).resolve().parent
+if str(SKILL_DIR) not in sys.path:
+    sys.path.insert(0, str(SKILL_DIR))
+
+from converter import MarkdownPipeline  # noqa: E402
+
+DEFAULT_CORPUS = SKILL_DIR.parents[2] / "destinations"
+DEFAULT_RUNS = 5
+
+
+def time_corpus(convert: Callable[[str], str], texts: List[str], runs: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for text in texts:
+            convert(text)
+        samples.append(time.perf_counter() - start)
+    return {
+        "median_s": round(statistics.median(samples), 4),
+        "min_s": round(min(samples), 4),
+        "per_doc_ms": round(statistics.median(samples) / len(texts) * 1000, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare per-document Markdown parser construction with the reused pipeline parser."
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        default=str(DEFAULT_CORPUS),
+        help="Directory of Markdown files (default: the repository's destinations/)",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=DEFAULT_RUNS,
+        help=f"Passes over the corpus per variant (default: {DEFAULT_RUNS})",
+    )
+    parser.add_argument(
+        "--json",
+        help="Write results to this JSON file",
+    )
+
+    args = parser.parse_args()
+
+    import markdown
+
+    files = sorted(Path(args.input).rglob("*.md"))
+    if not files:
+        parser.error(f"No Markdown files found in {args.input}")
+    texts = [f.read_text(encoding="utf-8") for f in files]
+    pipeline = MarkdownPipeline()
+
+    def fresh(text: str) -> str:
+        return markdown.markdown(text, extensions=pipeline.extensions, extension_configs=pipeline.extension_configs)
+
+    # Both variants must produce identical HTML, or the comparison is meaningless
+    mismatched = [f.name for f, text in zip(files, texts) if pipeline.convert(text) != fresh(text)]
+    if mismatched:
+        print(f"[WARN] Reused parser output differs for: {', '.join(mismatched)}")
+
+    runs = max(1, args.runs)
+    results = {
+        "documents": len(texts),
+        "fresh": time_corpus(fresh, texts, runs),
+        "reused": time_corpus(pipeline.convert, texts, runs),
+    }
+    saved = results["fresh"]["median_s"] - results["reused"]["median_s"]
+    results["saved_per_doc_ms"] = round(saved / len(texts) * 1000, 3)
+
+    print(f"{len(texts)} documents, {runs} runs")
+    for name in ("fresh", "reused"):
+        outcome = results[name]
+        print(f"  {name:<7} median {outcome['median_s'] * 1000:>8.1f}ms   {outcome['per_doc_ms']:>7.3f}ms/doc")
+    print(f"  Saved {saved * 1000:.1f}ms per corpus pass ({results['saved_per_doc_ms']:.3f}ms per document)")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Measure the startup cost of each entry point (import and --help) in fresh interpreters.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+SKILL_DIR = Path(__file__).resolve().parent
+
+DEFAULT_RUNS = 5
+DEFAULT_THRESHOLD = 0.25  # Allowed slowdown vs baseline (0.25 = +25%)
+
+ENTRY_POINTS = {
+    "import converter": ["-c", "import converter"],
+    "import batch_process": ["-c", "import batch_process"],
+    "import merge": ["-c", "import merge"],
+    "import pipeline": ["-c", "import pipeline"],
+    "converter.py --help": [str(SKILL_DIR / "converter.py"), "--help"],
+    "batch_process.py --help": [str(SKILL_DIR / "batch_process.py"), "--help"],
+    "merge.py --help": [str(SKILL_DIR / "merge.py"), "--help"],
+    "pipeline.py --help": [str(SKILL_DIR / "pipeline.py"), "--help"],
+}
+
+# Heavy dependencies that converter.py now loads only when a stage needs them
+DEPENDENCIES = {
+    "import markdown+pymdownx": ["-c", "import markdown, pymdownx.superfences, pymdownx.arithmatex"],
+    "import bs4": ["-c", "import bs4"],
+    "import matplotlib.pyplot": ["-c", "import matplotlib; matplotlib.use('Agg'); import matplotlib.pyplot"],
+    "import weasyprint": ["-c", "import weasyprint"],
+}
+
+
+def time_command(args: List[str], runs: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *args],
+            cwd=SKILL_DIR,
+            capture_output=True,
+        )
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            return {"error": result.stderr.decode("utf-8", "replace").strip().splitlines()[-1:] or ["failed"]}
+        samples.append(elapsed)
+    return {
+        "min_ms": round(min(samples), 1),
+        "median_ms": round(statistics.median(samples), 1),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name, {})
+        if "median_ms" not in current or "median_ms" not in previous:
+            continue
+        if current["median_ms"] > previous["median_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: {previous['median_ms']}ms -> {current['median_ms']}ms"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark import and --help startup time of the converter entry points."
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=DEFAULT_RUNS,
+        help=f"Fresh interpreter runs per entry point (default: {DEFAULT_RUNS})",
+    )
+    parser.add_argument(
+        "--include-deps",
+        action="store_true",
+        help="Also time importing the heavy dependencies on their own",
+    )
+    parser.add_argument(
+        "--json",
+        help="Write results to this JSON file",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="Compare against a previous --json result and exit 1 on regression",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Allowed relative slowdown vs baseline (default: {DEFAULT_THRESHOLD})",
+    )
+
+    args = parser.parse_args()
+
+    commands = dict(ENTRY_POINTS)
+    if args.include_deps:
+        commands.update(DEPENDENCIES)
+
+    results = {}
+    for name, command in commands.items():
+        results[name] = time_command(command, max(1, args.runs))
+        outcome = results[name]
+        if "error" in outcome:
+            print(f"{name:<28} failed: {outcome['error'][0]}")
+        else:
+            print(f"{name:<28} median {outcome['median_ms']:>8.1f}ms   min {outcome['min_ms']:>8.1f}ms")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {args.json}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Startup regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No startup regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Extract the budget tables of destinations/*/6_budget.md into columnar arrays
+and compute whole-trip totals per tier (economy / comfort / luxury).
+
+Tables are read from the same HTML the PDFs are built from (MarkdownPipeline).
+Cells such as `~$3,800`, `$1,500+`, `¥12,000 - ¥20,000` or `~1.9万` are
+normalized to low/high amounts with approximate/open-ended flags. Each file's
+parsed records are cached by content hash, so after an edit only that file is
+parsed again. Currency conversion and the per-tier aggregation run over whole
+columns at once with NumPy when it is installed, and fall back to plain arrays
+and loops otherwise.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SKILL_DIR = Path(__file__).resolve().parent
+if str(SKILL_DIR) not in sys.path:
+    sys.path.insert(0, str(SKILL_DIR))
+
+from converter import DEFAULT_HTML_PARSER, DiskCache, MarkdownPipeline, default_cache_root, make_soup  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:  # Column math falls back to array('d') and loops
+    np = None
+
+DEFAULT_CORPUS = SKILL_DIR.parents[2] / "destinations"
+DEFAULT_BUDGET_FILE = "6_budget.md"
+DEFAULT_TARGET_CURRENCY = "CNY"
+
+# Bump when parsing rules change so cached records are not reused
+EXTRACTOR_VERSION = "1"
+
+TIERS = ("economy", "comfort", "luxury")
+
+# Approximate CNY value of one unit; override with --rates rates.json
+DEFAULT_RATES = {
+    "CNY": 1.0,
+    "USD": 7.2,
+    "EUR": 7.8,
+    "GBP": 9.1,
+    "AUD": 4.7,
+    "NZD": 4.3,
+    "CAD": 5.2,
+    "JPY": 0.048,
+    "KRW": 0.0052,
+    "INR": 0.086,
+    "THB": 0.2,
+}
+
+# Currency a bare "$" (or no symbol at all) means in each destination folder
+COUNTRY_CURRENCY = {
+    "Australia": "AUD",
+    "Canada": "CAD",
+    "England": "GBP",
+    "France": "EUR",
+    "India": "INR",
+    "Italy": "EUR",
+    "Japan": "JPY",
+    "New_Zealand": "NZD",
+    "Portugal": "EUR",
+    "South_Korea": "KRW",
+    "Spain": "EUR",
+    "Thailand": "THB",
+    "USA": "USD",
+}
+
+CURRENCY_NAMES = {
+    "人民币": "CNY", "美元": "USD", "欧元": "EUR", "英镑": "GBP", "澳元": "AUD", "纽币": "NZD",
+    "新西兰元": "NZD", "加元": "CAD", "日元": "JPY", "韩元": "KRW", "卢比": "INR", "泰铢": "THB",
+}
+CURRENCY_SYMBOLS = {"₩": "KRW", "€": "EUR", "£": "GBP", "₹": "INR", "฿": "THB", "￥": "CNY"}
+
+TIER_PATTERNS = {
+    "economy": re.compile(r"经济|economy|backpacker", re.IGNORECASE),
+    "comfort": re.compile(r"舒适|comfort|mid-range", re.IGNORECASE),
+    "luxury": re.compile(r"奢华|豪华|luxury", re.IGNORECASE),
+}
+TOTAL_PATTERN = re.compile(r"总计|合计|总预算|总费用|grand total|\btotal\b", re.IGNORECASE)
+PARTIAL_PATTERN = re.compile(r"小计|subtotal|每日|每天|每周|daily|per day|weekly", re.IGNORECASE)
+
+_AMOUNT = r"(?P<sym{n}>[$¥￥₩€£₹฿])?\s*(?P<num{n}>\d[\d,]*(?:\.\d+)?)\s*(?P<unit{n}>万|千|[kK])?\s*(?P<plus{n}>\+)?"
+CELL_PATTERN = re.compile(
+    r"^\s*(?P<approx>[~≈约])?\s*" + _AMOUNT.format(n=1)
+    + r"(?:\s*(?:-|–|—|~|至|to)\s*[~≈约]?\s*" + _AMOUNT.format(n=2) + r")?"
+    + r"\s*(?P<code>[A-Z]{3})?\s*$"
+)
+UNIT_FACTORS = {"万": 10000.0, "千": 1000.0, "k": 1000.0, "K": 1000.0}
+
+FIELDS = ("country", "table", "row", "column", "tier", "currency", "low", "high", "approx", "open_ended", "total")
+
+
+def parse_amount(text: str) -> Optional[Dict]:
+    """Normalize one table cell to {low, high, approx, open_ended, symbol}, or None if it is not money."""
+    match = CELL_PATTERN.match(text.replace("\u00a0", " "))
+    if not match:
+        return None
+
+    def value(n: int) -> float:
+        number = float(match.group(f"num{n}").replace(",", ""))
+        return number * UNIT_FACTORS.get(match.group(f"unit{n}") or "", 1.0)
+
+    low = value(1)
+    high = value(2) if match.group("num2") else low
+    return {
+        "low": low,
+        "high": high,
+        "approx": bool(match.group("approx")),
+        "open_ended": bool(match.group("plus1") or match.group("plus2")),
+        "symbol": match.group("sym1") or match.group("sym2") or match.group("code") or "",
+    }
+
+
+def detect_currency(text: str) -> Optional[str]:
+    """Currency named in a header or cell: ISO code, Chinese name or unambiguous symbol."""
+    for code in DEFAULT_RATES:
+        if re.search(rf"\b{code}\b", text):
+            return code
+    for name, code in CURRENCY_NAMES.items():
+        if name in text:
+            return code
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in text:
+            return code
+    return None
+
+
+def detect_tier(text: str) -> Optional[str]:
+    for tier, pattern in TIER_PATTERNS.items():
+        if pattern.search(text):
+            return tier
+    return None
+
+
+def country_currency(country: str) -> str:
+    """Currency a destination folder's bare amounts are in; DEFAULT_TARGET_CURRENCY if it is not mapped."""
+    return COUNTRY_CURRENCY.get(country, DEFAULT_TARGET_CURRENCY)
+
+
+def extract_records(html: str, country: str) -> List[Dict]:
+    """One record per money cell of every table in an HTML body."""
+    default_currency = country_currency(country)
+    soup = make_soup(html, DEFAULT_HTML_PARSER)
+    records = []
+    for table_index, table in enumerate(soup.find_all("table")):
+        rows = [[cell.get_text(" ", strip=True) for cell in tr.find_all(["th", "td"])] for tr in table.find_all("tr")]
+        if len(rows) < 2:
+            continue
+        header, body = rows[0], rows[1:]
+        for col in range(1, len(header)):
+            cells = [row[col] for row in body if col < len(row)]
+            parsed = [parse_amount(cell) for cell in cells]
+            filled = [cell for cell in cells if cell and cell not in ("-", "—")]
+            # A money column: most filled cells parse as amounts (skips notes and percentages)
+            if not filled or sum(p is not None for p in parsed) * 2 < len(filled):
+                continue
+            column_currency = detect_currency(header[col])
+            column_tier = detect_tier(header[col])
+            total_column = bool(TOTAL_PATTERN.search(header[col])) and not PARTIAL_PATTERN.search(header[col])
+            for row, amount in zip(body, parsed):
+                if amount is None:
+                    continue
+                label = row[0]
+                symbol_currency = CURRENCY_SYMBOLS.get(amount["symbol"]) or (
+                    amount["symbol"] if amount["symbol"] in DEFAULT_RATES else None)
+                row_tier = detect_tier(label)
+                is_total = (bool(TOTAL_PATTERN.search(label)) or (row_tier is not None and total_column)) \
+                    and not PARTIAL_PATTERN.search(label)
+                records.append({
+                    "country": country,
+                    "table": table_index,
+                    "row": label,
+                    "column": header[col],
+                    "tier": column_tier or row_tier or "all",
+                    "currency": column_currency or symbol_currency or default_currency,
+                    "low": amount["low"],
+                    "high": amount["high"],
+                    "approx": amount["approx"],
+                    "open_ended": amount["open_ended"],
+                    "total": is_total,
+                })
+    return records
+
+
+class BudgetColumns:
+    """Columnar view of budget records: one array per field."""
+
+    def __init__(self, records: List[Dict]):
+        self.size = len(records)
+        for field in FIELDS:
+            values = [record[field] for record in records]
+            if field in ("low", "high"):
+                column = np.asarray(values, dtype=float) if np is not None else array("d", values)
+            elif field in ("approx", "open_ended", "total") and np is not None:
+                column = np.asarray(values, dtype=bool)
+            else:
+                column = np.asarray(values, dtype=object) if np is not None else values
+            setattr(self, field, column)
+        # Index of each record's (table, column) money column, for per-column sums
+        groups: Dict[Tuple, int] = {}
+        keys = [groups.setdefault((record["table"], record["column"]), len(groups)) for record in records]
+        self.group = np.asarray(keys, dtype=np.intp) if np is not None else keys
+        self.groups = len(groups)
+
+    def converted(self, rates: Dict[str, float], target: str) -> Tuple:
+        """(low, high) of every record in `target` currency, converted in one pass."""
+        factors = [rates[currency] / rates[target] for currency in self.currency]
+        if np is not None:
+            factor_array = np.asarray(factors, dtype=float)
+            return self.low * factor_array, self.high * factor_array
+        return (array("d", (v * f for v, f in zip(self.low, factors))),
+                array("d", (v * f for v, f in zip(self.high, factors))))
+
+    def tier_values(self, low, high) -> Dict:
+        """Per-tier value of each record: tier-specific cells count for their tier (range midpoint);
+        untiered ranges give economy=low, comfort=midpoint, luxury=high. NaN where a record does not count."""
+        if np is not None:
+            middle = (low + high) / 2
+            untiered = self.tier == "all"
+            return {name: np.where(untiered, bound, np.where(self.tier == name, middle, np.nan))
+                    for name, bound in zip(TIERS, (low, middle, high))}
+        values = {tier: [] for tier in TIERS}
+        for i in range(self.size):
+            tier = self.tier[i]
+            middle = (low[i] + high[i]) / 2
+            for name, bound in zip(TIERS, (low[i], middle, high[i])):
+                if tier == "all":
+                    values[name].append(bound)
+                else:
+                    values[name].append(middle if tier == name else float("nan"))
+        return values
+
+
+def trip_totals(columns: BudgetColumns, low, high) -> Tuple[Dict[str, float], str]:
+    """Whole-trip amount per tier for one country, and how it was derived.
+
+    Uses the largest grand-total cell per tier (daily/weekly totals and
+    subtotals are excluded by label); without any, sums the line items of the
+    largest money column.
+    """
+    tier_values = columns.tier_values(low, high)
+    totals = {}
+    use_totals = bool(any(columns.total))
+    for tier in TIERS:
+        if np is not None:
+            values = tier_values[tier]
+            counted = ~np.isnan(values)
+            if use_totals:
+                candidates = values[counted & columns.total]
+                totals[tier] = float(candidates.max()) if candidates.size else float("nan")
+            else:
+                sums = np.bincount(columns.group, weights=np.where(counted, values, 0.0), minlength=columns.groups)
+                filled = np.bincount(columns.group, weights=counted, minlength=columns.groups) > 0
+                totals[tier] = float(sums[filled].max()) if filled.any() else float("nan")
+        elif use_totals:
+            candidates = [v for v, flag in zip(tier_values[tier], columns.total) if flag and v == v]
+            totals[tier] = max(candidates) if candidates else float("nan")
+        else:
+            sums: Dict[int, float] = {}
+            for group, v in zip(columns.group, tier_values[tier]):
+                if v == v:
+                    sums[group] = sums.get(group, 0.0) + v
+            totals[tier] = max(sums.values()) if sums else float("nan")
+    return totals, "total rows" if use_totals else "line items"
+
+
+class BudgetExtractor:
+    """Parses budget files to records, cached by file hash."""
+
+    def __init__(self, cache: Optional[DiskCache] = None):
+        self.cache = cache or DiskCache(default_cache_root() / "budget", "json", memory_items=256)
+        self._pipeline: Optional[MarkdownPipeline] = None
+
+    def records_for(self, md_path: Path, country: str) -> List[Dict]:
+        data = md_path.read_bytes()
+        key = self.cache.make_key(hashlib.sha256(data).hexdigest(), country, EXTRACTOR_VERSION)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
+        if self._pipeline is None:
+            self._pipeline = MarkdownPipeline()
+        records = extract_records(self._pipeline.convert(data.decode("utf-8")), country)
+        self.cache.put(key, json.dumps(records, ensure_ascii=False))
+        return records
+
+    def summarize(self, corpus_dir: Path, rates: Dict[str, float], target: str = DEFAULT_TARGET_CURRENCY,
+                  filename: str = DEFAULT_BUDGET_FILE, countries: Optional[List[str]] = None) -> Dict:
+        """Per-country and world totals per tier, in local and target currency."""
+        report = {"currency": target, "countries": {}, "world": {tier: 0.0 for tier in TIERS}}
+        for md_path in sorted(Path(corpus_dir).glob(f"*/{filename}")):
+            country = md_path.parent.name
+            if countries and country not in countries:
+                continue
+            records = self.records_for(md_path, country)
+            if country not in COUNTRY_CURRENCY:
+                print(f"[WARN] No currency mapped for {country}; assuming {DEFAULT_TARGET_CURRENCY}. "
+                      f"Add it to COUNTRY_CURRENCY.")
+            local_currency = country_currency(country)
+            # Only amounts in the country's own currency; "≈ CNY" helper columns would double count
+            own = [r for r in records if r["currency"] == local_currency]
+            if not own:
+                report["countries"][country] = {"currency": local_currency, "source": "no budget table"}
+                continue
+            columns = BudgetColumns(own)
+            local, source = trip_totals(columns, columns.low, columns.high)
+            low, high = columns.converted(rates, target)
+            converted, _ = trip_totals(columns, low, high)
+            report["countries"][country] = {
+                "currency": local_currency,
+                "source": source,
+                "cells": columns.size,
+                "approximate": bool(any(columns.approx)),
+                "open_ended": bool(any(columns.open_ended)),
+                "local": local,
+                target: converted,
+            }
+            for tier in TIERS:
+                if converted[tier] == converted[tier]:
+                    report["world"][tier] += converted[tier]
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Extract budget tables from destinations/*/6_budget.md and total them per tier."
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        default=str(DEFAULT_CORPUS),
+        help="Destinations directory (default: the repository's destinations/)",
+    )
+    parser.add_argument(
+        "--currency",
+        default=DEFAULT_TARGET_CURRENCY,
+        help=f"Currency for converted and world totals (default: {DEFAULT_TARGET_CURRENCY})",
+    )
+    parser.add_argument(
+        "--rates",
+        help="JSON file of currency -> value in CNY, overriding the built-in approximate rates",
+    )
+    parser.add_argument(
+        "--countries",
+        help="Comma-separated destination folders to include (default: all)",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the report as JSON",
+    )
+
+    args = parser.parse_args()
+
+    rates = dict(DEFAULT_RATES)
+    if args.rates:
+        rates.update(json.loads(Path(args.rates).read_text(encoding="utf-8")))
+    target = args.currency.upper()
+    if target not in rates:
+        parser.error(f"No exchange rate for {target}; add it with --rates")
+
+    countries = args.countries.split(",") if args.countries else None
+    report = BudgetExtractor().summarize(Path(args.input), rates, target, countries=countries)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'Country':<14}{'Local':>6}  " + "".join(f"{tier:>16}" for tier in TIERS) + f"   ({target})")
+    for country, entry in report["countries"].items():
+        if "local" not in entry:
+            print(f"{country:<14}{entry['currency']:>6}  {entry['source']}")
+            continue
+        flags = ("~" if entry["approximate"] else "") + ("+" if entry["open_ended"] else "")
+        print(f"{country:<14}{entry['currency']:>6}  "
+              + "".join(f"{entry['local'][tier]:>16,.0f}" for tier in TIERS) + f"   {entry['source']} {flags}")
+        print(f"{'':<22}" + "".join(f"{entry[target][tier]:>16,.0f}" for tier in TIERS))
+    print(f"{'World total':<22}" + "".join(f"{report['world'][tier]:>16,.0f}" for tier in TIERS) + f"   ({target})")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,18 +12,26 @@ Supports:
 import io
 import os
 import re
+import html as html_lib
+import importlib.util
+import shutil
 import sys
 import hashlib
 import tempfile
+import textwrap
 import argparse
+import gc
 import subprocess
 import json
-import markdown
+import time
+import threading
 
-from bs4 import BeautifulSoup
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import Callable, List, Optional, Dict, Tuple
+from urllib.parse import quote, unquote, urlparse
 from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
 
 
 # ==========================================
@@ -38,20 +46,58 @@ DEFAULT_STYLE = 'odoo_doc'
 DEFAULT_LANDSCAPE = False  # 是否默认横版 (True 为横版, False 为竖版)
 DEFAULT_HEADER_LEFT = "World_Travel"
 DEFAULT_HEADER_RIGHT = "https://github.com/originrock/WorldTravel"
+DEFAULT_JOBS = 1  # 并行进程数 (1 为串行, 0 为使用全部 CPU 核心)
 
-# ==========================================
+# Mermaid 批量渲染: 一次 mmdc 调用 (一个无头浏览器会话) 渲染多个图表
+DEFAULT_MERMAID_BATCH = True   # False 则回退到逐图渲染
+DEFAULT_MERMAID_BATCH_SIZE = 50  # 每个 mmdc 会话最多渲染的图表数
+DEFAULT_MERMAID_POOL_SIZE = 2    # 同时运行的 mmdc 会话数
+
+# 合并模式: 每次排版的文件数, 以及超过后自动减小分块的内存上限 (MB)
+DEFAULT_MERGE_CHUNK_SIZE = 8
+DEFAULT_MERGE_MAX_MEMORY_MB = 1024
+DEFAULT_MERGE_OUTLINE = True  # 合并后的 PDF 是否生成 国家 -> 文件 -> H1 -> H2 书签目录
+
+# 数学公式 SVG 的进程内缓存条目数 (磁盘缓存同样受上面的容量/过期限制)
+DEFAULT_MATH_MEMORY_ITEMS = 1024
+
+# HTML 解析器: 优先使用更快的 lxml, 未安装时回退到标准库 html.parser
+DEFAULT_HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# CJK 字体子集: 'weasyprint' 由 WeasyPrint 逐文档从完整字体子集化;
+# 'document' 使用按 (字体, 字形集合) 缓存的子集; 'batch' 同一批次/合并共用一个子集
+DEFAULT_FONT_SUBSET = 'weasyprint'
+FONT_SUBSET_MODES = ('weasyprint', 'document', 'batch')
+# 预解析 (fontconfig) 并子集化的 CJK 字体族, 按优先级; 主题 CSS 的 font-family 需包含其中之一
+DEFAULT_CJK_FONT_FAMILIES = ['Source Han Sans CN', 'Noto Sans CJK SC', 'Microsoft YaHei', 'PingFang SC', 'Hiragino Sans GB']
+
+# 图片: 按页面可用宽度缩放到的目标 DPI (0 为只解析路径, 不缩放/重新压缩), 以及 JPEG 质量
+DEFAULT_IMAGE_DPI = 150
+DEFAULT_IMAGE_QUALITY = 82
+# A4 版心宽度 (英寸): 竖版 210mm / 横版 297mm 减去 default.css 的左右页边距
+PAGE_CONTENT_WIDTH_IN = {False: 6.3, True: 9.7}
 
-# Try importing Matplotlib for Math rendering
-try:
-    import matplotlib
-    matplotlib.use('Agg') # Force headless backend
-    import matplotlib.pyplot as plt
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    MATPLOTLIB_AVAILABLE = False
-    print("[WARN] Matplotlib not found. Math formulas will be rendered as text.")
+# 输出格式: 'pdf', 'html' (浏览器预览, 不经过 WeasyPrint 排版) 或 'both' (一次解析同时写出两者)
+DEFAULT_OUTPUT_FORMAT = 'pdf'
+OUTPUT_FORMATS = ('pdf', 'html', 'both')
+# HTML 输出中的本地图片: 'copy' 复制到 <文件名>_files/ (可整体移动/分享), 'link' 以相对路径引用原图或缓存副本
+DEFAULT_HTML_ASSETS = 'copy'
+HTML_ASSET_MODES = ('copy', 'link')
 
+# 资源获取: WeasyPrint 读取的本地文件 (图片/字体/SVG) 在进程内按 (路径, mtime) 做 LRU 缓存, 批次/合并内所有文档共用
+DEFAULT_FETCH_CACHE_MB = 64
+# 远程 http(s) 资源默认禁止 (构建需离线可用, 且不因网络超时卡住); 可改为从本地镜像目录 <镜像>/<主机>/<路径> 读取
+DEFAULT_ALLOW_REMOTE = False
+DEFAULT_MIRROR_DIR = None  # 示例: "/Users/originrock/dev/WorldTravel/mirror"
 
+# 渲染缓存 (Mermaid SVG 等) 的容量上限与过期时间, 超出后按 LRU 淘汰
+DEFAULT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_CACHE_MAX_AGE_DAYS = 30
+
+# 转换器版本: 任何影响 PDF 输出的改动都应提升此版本, 以使构建清单 (manifest) 失效
+CONVERTER_VERSION = "1.3.0"
+
+# ==========================================
 
 # --- macOS Library Path Fix (Self-Healing) ---
 # 解决在 PyCharm 或其他 IDE 中运行无法找到 Homebrew 安装库的问题
@@ -63,22 +109,57 @@ if sys.platform == 'darwin':
         os.environ['DYLD_LIBRARY_PATH'] = ":".join(new_paths) + (f":{existing_dyld}" if existing_dyld else "")
 # ---------------------------------------------
 
-try:
-    from weasyprint import HTML, CSS
-    from weasyprint.text.fonts import FontConfiguration
-except OSError as e:
-    print(f"\n[ERROR] WeasyPrint 核心库加载失败: {e}")
-    print("\n这是由于系统无法找到所需的图形及排版库导致的。")
-    print("如果您已使用 Homebrew 安装了相关软件，请确保执行以下操作:")
-    print("1. 终端运行: export DYLD_LIBRARY_PATH=\"/opt/homebrew/lib:$DYLD_LIBRARY_PATH\"")
-    print("2. 如果是在 PyCharm 中运行，请在 Run Configuration -> Environment Variables 中添加上述变量。")
-    print("\n安装命令: brew install pango gdk-pixbuf libffi")
-    sys.exit(1)
+# --- Lazy heavy dependencies ---
+# Markdown, BeautifulSoup, Matplotlib and WeasyPrint are imported on first use,
+# so `--help`, `import converter` and documents without math stay cheap.
+
+_PYPLOT = None
+_PYPLOT_LOADED = False
+
+def load_pyplot():
+    """Import Matplotlib (headless Agg backend) on first use; None if it is not installed."""
+    global _PYPLOT, _PYPLOT_LOADED
+    if not _PYPLOT_LOADED:
+        _PYPLOT_LOADED = True
+        try:
+            import matplotlib
+            matplotlib.use('Agg') # Force headless backend
+            import matplotlib.pyplot as plt
+            _PYPLOT = plt
+        except ImportError:
+            print("[WARN] Matplotlib not found. Math formulas will be rendered as text.")
+    return _PYPLOT
+
+def load_weasyprint():
+    """Import WeasyPrint on first use and return the module."""
+    try:
+        import weasyprint
+        import weasyprint.text.fonts  # noqa: F401  (FontConfiguration)
+    except OSError as e:
+        print(f"\n[ERROR] WeasyPrint 核心库加载失败: {e}")
+        print("\n这是由于系统无法找到所需的图形及排版库导致的。")
+        print("如果您已使用 Homebrew 安装了相关软件，请确保执行以下操作:")
+        print("1. 终端运行: export DYLD_LIBRARY_PATH=\"/opt/homebrew/lib:$DYLD_LIBRARY_PATH\"")
+        print("2. 如果是在 PyCharm 中运行，请在 Run Configuration -> Environment Variables 中添加上述变量。")
+        print("\n安装命令: brew install pango gdk-pixbuf libffi")
+        sys.exit(1)
+    return weasyprint
+
+def make_soup(markup: str, parser: str):
+    """BeautifulSoup constructor, importing bs4 on first use."""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(markup, parser)
 
 class MarkdownPipeline:
-    """Handles Markdown to HTML conversion with advanced extensions."""
+    """Handles Markdown to HTML conversion with advanced extensions.
+
+    Building a `markdown.Markdown` sets up every extension (Pygments,
+    superfences, arithmatex, ...), so each thread keeps one instance and
+    resets it between documents instead of constructing a new one per call.
+    """
     
     def __init__(self):
+        self._local = threading.local()
         self.extensions = [
             'extra',
             'tables',
@@ -118,34 +199,353 @@ class MarkdownPipeline:
 
     def _mermaid_format(self, source, language, class_name, options, md, **kwargs):
         """Preserve mermaid source in a special div for post-processing."""
-        return f'<div class="mermaid-container" data-mermaid-source="{source.strip()}"></div>'
+        return f'<div class="mermaid-container" data-mermaid-source="{html_lib.escape(source.strip(), quote=True)}"></div>'
+
+    def parser(self):
+        """This thread's reusable Markdown instance, created on first use."""
+        md = getattr(self._local, 'md', None)
+        if md is None:
+            import markdown
+
+            md = markdown.Markdown(
+                extensions=self.extensions,
+                extension_configs=self.extension_configs
+            )
+            self._local.md = md
+        return md
 
     def convert(self, md_text: str) -> str:
         """Convert Markdown text to HTML body content."""
-        html = markdown.markdown(
-            md_text, 
-            extensions=self.extensions,
-            extension_configs=self.extension_configs
-        )
-        return html
+        md = self.parser()
+        try:
+            return md.convert(md_text)
+        finally:
+            # Clears per-document state (toc, footnotes, stashed HTML) for the next call
+            md.reset()
+
+def default_cache_root() -> Path:
+    """Per-user cache directory for rendered assets (honours XDG_CACHE_HOME)."""
+    base = os.environ.get('XDG_CACHE_HOME') or (Path.home() / '.cache')
+    return Path(base) / 'markdown-to-pdf'
+
+class DiskCache:
+    """Content-addressed file cache with atomic writes and LRU eviction.
+
+    Entries are `<sha256>.<suffix>` files. Writes go through a temp file and
+    `os.replace`, so concurrent workers never observe partial entries. Hits
+    refresh the file mtime, which eviction uses as the LRU clock. With
+    `memory_items > 0`, an in-process LRU of that many entries sits in front
+    of the disk so repeated lookups cost a dictionary access.
+    """
+
+    EVICT_EVERY = 32  # writes between automatic eviction passes
+
+    def __init__(self, root: Path, suffix: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+                 max_age_days: float = DEFAULT_CACHE_MAX_AGE_DAYS, memory_items: int = 0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.memory_items = memory_items
+        self._memory: 'OrderedDict[str, str]' = OrderedDict()
+        # Guards the counters and the memory layer; Mermaid batches and server workers share caches across threads
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / f"{key}.{self.suffix}"
+
+    def contains(self, key: str) -> bool:
+        return self.path_for(key).exists()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._memory[key]
+        path = self.path_for(key)
+        try:
+            data = path.read_text(encoding='utf-8')
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except UnicodeDecodeError:
+            # A corrupt entry (e.g. disk damage): drop it so the caller re-renders and rewrites it
+            with self._lock:
+                self.misses += 1
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        with self._lock:
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._remember(key, data)
+        return data
+
+    def _remember(self, key: str, data: str):
+        if self.memory_items <= 0:
+            return
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, data: str):
+        self._remember(key, data)
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+                handle.write(data)
+        except Exception:
+            os.unlink(tmp_name)
+            raise
+        self.put_file(key, Path(tmp_name))
+
+    def put_file(self, key: str, produced: Path):
+        """Move an already-written file into the cache atomically."""
+        os.replace(produced, self.path_for(key))
+        with self._lock:
+            self.writes += 1
+            due = self.writes % self.EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop entries older than max_age, then least-recently-used ones until under max_bytes.
+
+        Other threads and processes may evict the same directory concurrently,
+        so entries that vanish mid-pass are skipped.
+        """
+        now = time.time()
+        entries = []
+        for path in self.root.glob(f"*.{self.suffix}"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if total <= self.max_bytes and now - mtime <= self.max_age:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                total -= size  # Already removed by a concurrent eviction
+                continue
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'memory_hits': self.memory_hits, 'misses': self.misses,
+                    'writes': self.writes, 'evictions': self.evictions}
+
+class Instrumentation:
+    """Hooks around conversion stages for profiling.
+
+    Components wrap units of work in `span(name, **args)`; the span yields its
+    args dict so the caller can add details such as `cache='hit'`. Every
+    finished span is passed to each listener as an event dict with name,
+    start/duration (perf_counter seconds), resident memory, pid/tid and args.
+    Spans inherit the `file` arg of the span enclosing them. With no listeners
+    registered, spans are no-ops.
+    """
+
+    def __init__(self):
+        self.listeners: List[Callable[[Dict], None]] = []
+        self._local = threading.local()
+
+    def add_listener(self, listener: Callable[[Dict], None]):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Dict], None]):
+        self.listeners.remove(listener)
+
+    def emit(self, event: Dict):
+        for listener in self.listeners:
+            listener(event)
+
+    @contextmanager
+    def span(self, name: str, **args):
+        if not self.listeners:
+            yield args
+            return
+        stack = self._local.__dict__.setdefault('stack', [])
+        if 'file' not in args and stack and 'file' in stack[-1]:
+            args['file'] = stack[-1]['file']
+        stack.append(args)
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            rss_after = current_rss_mb()
+            self.emit({
+                'name': name,
+                'start': start,
+                'duration': duration,
+                'rss_mb': round(rss_after, 1),
+                'rss_delta_mb': round(rss_after - rss_before, 1),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args,
+            })
+
+class ProfileRecorder:
+    """Instrumentation listener that keeps every event and writes it as a profile.
+
+    `write` produces either a JSON report (events plus per-stage, per-file and
+    cache summaries) or a Chrome trace viewable in chrome://tracing / Perfetto.
+    """
+
+    # Spans that make up a document conversion (see Processor.build_html_from_text)
+    STAGES = ('markdown', 'transform.parse', 'mermaid', 'alerts', 'math', 'images', 'transform.serialize', 'html', 'pdf')
+
+    def __init__(self):
+        self.events: List[Dict] = []
+
+    def __call__(self, event: Dict):
+        self.events.append(event)
+
+    def clear(self):
+        self.events = []
+
+    def summary(self) -> Dict:
+        stages: Dict[str, Dict] = {}
+        files: Dict[str, Dict[str, float]] = {}
+        caches: Dict[str, Dict[str, int]] = {}
+        for event in self.events:
+            name, args = event['name'], event['args']
+            if 'cache' in args:
+                counts = caches.setdefault(name, {'hit': 0, 'miss': 0})
+                counts[args['cache']] = counts.get(args['cache'], 0) + 1
+            if name not in self.STAGES:
+                continue
+            stage = stages.setdefault(name, {'count': 0, 'total_s': 0.0, 'max_rss_delta_mb': 0.0})
+            stage['count'] += 1
+            stage['total_s'] += event['duration']
+            stage['max_rss_delta_mb'] = max(stage['max_rss_delta_mb'], event['rss_delta_mb'])
+            if 'file' in args:
+                per_file = files.setdefault(args['file'], {})
+                per_file[name] = per_file.get(name, 0.0) + event['duration']
+        ranked = sorted(files.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        return {
+            'stages': stages,
+            'files': {name: dict(per_file, total_s=sum(per_file.values())) for name, per_file in ranked},
+            'caches': caches,
+        }
+
+    def chrome_trace(self) -> Dict:
+        origin = min((event['start'] for event in self.events), default=0.0)
+        trace = []
+        for event in self.events:
+            trace.append({
+                'name': event['name'],
+                'cat': event['name'].split('.')[0],
+                'ph': 'X',
+                'ts': round((event['start'] - origin) * 1e6, 1),
+                'dur': round(event['duration'] * 1e6, 1),
+                'pid': event['pid'],
+                'tid': event['tid'],
+                'args': dict(event['args'], rss_mb=event['rss_mb'], rss_delta_mb=event['rss_delta_mb']),
+            })
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: Path, fmt: str = 'json'):
+        """Write the profile; `fmt` is 'json' (report) or 'chrome' (trace events)."""
+        payload = self.chrome_trace() if fmt == 'chrome' else {'summary': self.summary(), 'events': self.events}
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(payload, indent=1, ensure_ascii=False, default=str), encoding='utf-8')
+        print(f"Profile written to {path} ({len(self.events)} events)")
 
 class MermaidRenderer:
-    """Renders Mermaid diagrams using mmdc."""
+    """Renders Mermaid diagrams using mmdc.
+
+    In batch mode, uncached diagrams are first rendered together through a
+    single mmdc invocation per chunk (one headless browser session), using
+    mmdc's Markdown input mode. Anything the batch does not produce falls back
+    to the per-diagram path in `_render_diagram`.
+
+    Rendered SVGs live in a DiskCache keyed on the diagram source, the render
+    options (theme, background, scale, config) and the mmdc version.
+    """
+
+    FENCE_PATTERN = re.compile(r'^[ \t]*```mermaid[^\n]*\n(.*?)^[ \t]*```', re.MULTILINE | re.DOTALL)
+
+    # Config that forces darker text in every diagram
+    CONFIG_DATA = {
+        "themeVariables": {
+            "primaryTextColor": "#333333",
+            "secondaryTextColor": "#333333",
+            "tertiaryTextColor": "#333333",
+            "textColor": "#333333",
+            "lineColor": "#666666"
+        },
+        "mindmap": {
+            "padding": 20
+        }
+    }
     
-    def __init__(self, cache_dir: Optional[Path] = None):
-        self.cache_dir = cache_dir or Path(tempfile.gettempdir()) / "mermaid_cache"
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.mmdc_path = self._find_mmdc()
+    def __init__(self, cache_dir: Optional[Path] = None, mmdc_path: Optional[str] = None,
+                 batch_mode: bool = DEFAULT_MERMAID_BATCH, batch_size: int = DEFAULT_MERMAID_BATCH_SIZE,
+                 pool_size: int = DEFAULT_MERMAID_POOL_SIZE, theme: str = 'neutral',
+                 background: str = 'white', scale: int = 2):
+        self.cache = DiskCache(cache_dir or default_cache_root() / 'mermaid', 'svg')
+        self.cache_dir = self.cache.root
+        self._mmdc_path = mmdc_path
+        self.batch_mode = batch_mode
+        self.batch_size = max(1, batch_size)
+        self.pool_size = max(1, pool_size)
+        self.theme = theme
+        self.background = background
+        self.scale = scale
+        self._mmdc_version: Optional[str] = None
+        self._config_file: Optional[Path] = None
+        self.instrumentation = Instrumentation()
+        self.cache.evict()
+
+    @property
+    def mmdc_path(self) -> str:
+        """mermaid-cli executable, resolved on first use."""
+        if self._mmdc_path is None:
+            self._mmdc_path = self._find_mmdc()
+        return self._mmdc_path
 
     def _find_mmdc(self) -> str:
-        """Find the mermaid-cli executable."""
-        try:
-            result = subprocess.run(['which', 'mmdc'], capture_output=True, text=True)
-            if result.returncode == 0:
-                return result.stdout.strip()
-        except Exception:
-            pass
-        return "mmdc"
+        """Find the mermaid-cli executable (MMDC_PATH overrides the PATH lookup)."""
+        if os.environ.get('MMDC_PATH'):
+            return os.environ['MMDC_PATH']
+        return shutil.which('mmdc') or "mmdc"
 
     def render_all(self, html_content: str) -> str:
         """Find all mermaid containers and replace them with rendered SVGs.
@@ -153,11 +553,20 @@ class MermaidRenderer:
         Also handles WeasyPrint compatibility by converting foreignObject text
         to native SVG text elements.
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
+        if 'mermaid-container' not in html_content:
+            return html_content
+        soup = parse_fragment(html_content)
+        self.render_tree(soup)
+        return serialize_fragment(soup)
+
+    def render_tree(self, soup):
+        """In-place variant of `render_all` operating on an already parsed tree."""
         containers = soup.find_all('div', class_='mermaid-container')
         
         if not containers:
-            return html_content
+            return
+
+        self.prefetch(container.get('data-mermaid-source', '') for container in containers)
 
         for container in containers:
             source = container.get('data-mermaid-source', '')
@@ -167,7 +576,7 @@ class MermaidRenderer:
             svg_content = self._render_diagram(source)
             if svg_content:
                 # Inject SVG directly into HTML
-                svg_soup = BeautifulSoup(svg_content, 'xml')
+                svg_soup = make_soup(svg_content, 'xml')
                 svg_tag = svg_soup.find('svg')
                 if svg_tag:
                     # FIX: Convert foreignObject text to native SVG text for WeasyPrint
@@ -188,8 +597,6 @@ class MermaidRenderer:
                     container.replace_with(svg_tag)
             else:
                 container.string = "[Error rendering Mermaid diagram]"
-        
-        return str(soup)
     
     def _convert_foreign_objects_to_text(self, svg_soup, svg_tag):
         """Convert foreignObject elements to native SVG text elements.
@@ -253,66 +660,174 @@ class MermaidRenderer:
             # Replace foreignObject with text element
             fo.replace_with(text_elem)
 
+    @classmethod
+    def extract_sources(cls, md_text: str) -> List[str]:
+        """Find mermaid fence bodies in raw Markdown, normalized like MarkdownPipeline does."""
+        # superfences hands the formatter indented fences (e.g. inside lists) without their indentation
+        return [textwrap.dedent(m.group(1)).strip() for m in cls.FENCE_PATTERN.finditer(md_text)]
+
+    @property
+    def mmdc_version(self) -> str:
+        """mmdc version string, queried once; part of every cache key."""
+        if self._mmdc_version is None:
+            try:
+                result = subprocess.run([self.mmdc_path, '--version'], capture_output=True, text=True, timeout=60)
+                self._mmdc_version = result.stdout.strip() if result.returncode == 0 else "unknown"
+            except Exception:
+                self._mmdc_version = "unknown"
+        return self._mmdc_version
+
+    def cache_key(self, source: str) -> str:
+        return self.cache.make_key(source, self.theme, self.background, self.scale,
+                                   self.CONFIG_DATA, self.mmdc_version)
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+    def _render_args(self) -> List[str]:
+        return ['-t', self.theme, '-b', self.background, '--scale', str(self.scale),
+                '-c', str(self._config_path())]
+
+    def prefetch(self, sources) -> int:
+        """Render every uncached diagram in `sources` through batched mmdc sessions.
+
+        Returns the number of diagrams rendered. A no-op when batch mode is off;
+        diagrams that fail here are retried individually by `_render_diagram`.
+        """
+        if not self.batch_mode:
+            return 0
+        pending = []
+        seen = set()
+        for source in sources:
+            # A diagram containing a fence marker cannot be embedded in the batch document
+            if not source or source in seen or '```' in source:
+                continue
+            seen.add(source)
+            if not self.cache.contains(self.cache_key(source)):
+                pending.append(source)
+        if not pending:
+            return 0
+
+        chunks = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        if len(chunks) == 1 or self.pool_size == 1:
+            return sum(self._render_batch(chunk) for chunk in chunks)
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(self.pool_size, len(chunks))) as pool:
+            return sum(pool.map(self._render_batch, chunks))
+
+    def _render_batch(self, sources: List[str]) -> int:
+        """Render several diagrams with one mmdc process using its Markdown input mode.
+
+        mmdc writes the n-th mermaid block of `batch.md` to `out-n.svg`; each
+        result is moved into the cache under its own key.
+        """
+        with self.instrumentation.span('mermaid.batch', diagrams=len(sources)) as info:
+            info['rendered'] = self._run_batch(sources)
+            return info['rendered']
+
+    def _run_batch(self, sources: List[str]) -> int:
+        work_dir = Path(tempfile.mkdtemp(prefix=".batch_", dir=self.cache_dir))
+        try:
+            batch_md = work_dir / "batch.md"
+            batch_md.write_text(
+                "\n\n".join(f"```mermaid\n{source}\n```" for source in sources) + "\n",
+                encoding='utf-8'
+            )
+            cmd = [self.mmdc_path, '-i', str(batch_md), '-o', str(work_dir / "out.md"), '-e', 'svg'] + self._render_args()
+            try:
+                result = subprocess.run(cmd, capture_output=True, text=True)
+            except Exception as e:
+                print(f"Failed to call mmdc for batch: {e}")
+                return 0
+            if result.returncode != 0:
+                print(f"Mermaid batch error (falling back to per-diagram rendering): {result.stderr}")
+
+            rendered = 0
+            for index, source in enumerate(sources, start=1):
+                produced = work_dir / f"out-{index}.svg"
+                if produced.exists():
+                    self.cache.put_file(self.cache_key(source), produced)
+                    rendered += 1
+            return rendered
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _config_path(self) -> Path:
+        """Content-addressed mermaid config, written once and never rewritten in place."""
+        if self._config_file is None:
+            payload = json.dumps(self.CONFIG_DATA, sort_keys=True)
+            digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+            config_file = self.cache_dir / f"mermaid_config_{digest}.json"
+            if not config_file.exists():
+                fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp_')
+                with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+                    handle.write(payload)
+                os.replace(tmp_name, config_file)
+            self._config_file = config_file
+        return self._config_file
+
     def _render_diagram(self, source: str) -> Optional[str]:
         """Render a single mermaid diagram to SVG."""
-        content_hash = hashlib.md5(source.encode()).hexdigest()
-        mmd_file = self.cache_dir / f"{content_hash}.mmd"
-        svg_file = self.cache_dir / f"{content_hash}.svg"
-        
-        # Create a temporary config file for Mermaid to force darker text
-        config_file = self.cache_dir / "mermaid_config.json"
-        config_data = {
-            "themeVariables": {
-                "primaryTextColor": "#333333",
-                "secondaryTextColor": "#333333",
-                "tertiaryTextColor": "#333333",
-                "textColor": "#333333",
-                "lineColor": "#666666"
-            },
-            "mindmap": {
-                "padding": 20
-            }
-        }
-        config_file.write_text(json.dumps(config_data), encoding='utf-8')
-
-        if svg_file.exists():
-            return svg_file.read_text(encoding='utf-8')
+        with self.instrumentation.span('mermaid.diagram') as info:
+            key = self.cache_key(source)
+            cached = self.cache.get(key)
+            info['cache'] = 'hit' if cached is not None else 'miss'
+            if cached is not None:
+                return cached
+            return self._run_mmdc(source, key)
 
+    def _run_mmdc(self, source: str, key: str) -> Optional[str]:
+        work_dir = Path(tempfile.mkdtemp(prefix=".single_", dir=self.cache_dir))
+        mmd_file = work_dir / "diagram.mmd"
+        svg_file = work_dir / "diagram.svg"
         mmd_file.write_text(source, encoding='utf-8')
         
         try:
             # Use neutral theme + custom config + white bg
-            cmd = [
-                self.mmdc_path, 
-                '-i', str(mmd_file), 
-                '-o', str(svg_file), 
-                '-t', 'neutral', 
-                '-b', 'white', 
-                '--scale', '2',
-                '-c', str(config_file)
-            ]
+            cmd = [self.mmdc_path, '-i', str(mmd_file), '-o', str(svg_file)] + self._render_args()
             result = subprocess.run(cmd, capture_output=True, text=True)
             if result.returncode != 0:
                 print(f"Mermaid error: {result.stderr}")
                 return None
+            if not svg_file.exists():
+                return None
+            svg_content = svg_file.read_text(encoding='utf-8')
+            self.cache.put_file(key, svg_file)
+            return svg_content
         except Exception as e:
             print(f"Failed to call mmdc: {e}")
             return None
         finally:
-            if mmd_file.exists():
-                mmd_file.unlink()
-
-        return svg_file.read_text(encoding='utf-8') if svg_file.exists() else None
+            shutil.rmtree(work_dir, ignore_errors=True)
 
 class ThemeManager:
     """Manages CSS themes and HTML wrapping."""
     
-    def __init__(self, style_dir: Path):
+    MATH_FONT_SIZE = 14
+
+    def __init__(self, style_dir: Path, cache_dir: Optional[Path] = None):
         self.style_dir = style_dir
+        # (theme, landscape, header_left) -> (theme file mtime, stylesheet text)
+        self._css_cache: Dict[Tuple[str, bool, str], Tuple[Optional[float], str]] = {}
+        # Rendered formula SVGs, keyed on TeX, color, font size and Matplotlib version
+        self.math_cache = DiskCache(cache_dir or default_cache_root() / 'math', 'svg',
+                                    memory_items=DEFAULT_MATH_MEMORY_ITEMS)
+        self.instrumentation = Instrumentation()
+
+    def get_css(self, theme_name: str = 'default', landscape: bool = False, header_left: str = "") -> str:
+        """Complete stylesheet text for a (theme, orientation, header) combination.
 
-    def get_full_html(self, body_content: str, title: str, theme_name: str = 'default', landscape: bool = False, header_left: str = "") -> str:
+        Built once per combination; the theme file is re-read only when its mtime changes.
+        """
         css_path = self.style_dir / f"{theme_name}.css"
-        css_content = css_path.read_text(encoding='utf-8') if css_path.exists() else ""
+        mtime = css_path.stat().st_mtime if css_path.exists() else None
+        key = (theme_name, bool(landscape), header_left or "")
+        cached = self._css_cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        css_content = css_path.read_text(encoding='utf-8') if mtime is not None else ""
         
         # Header configuration
         final_header_left = header_left or DEFAULT_HEADER_LEFT
@@ -348,34 +863,57 @@ class ThemeManager:
         .alert-warning { background: #fff3e0; border-color: #ff9800; color: #e65100; }
         .alert-caution { background: #ffebee; border-color: #f44336; color: #b71c1c; }
         """
+
+        css = f"""
+        {alert_css}
+        {css_content}
+        {header_css}
+        {orientation_css}
+"""
+        self._css_cache[key] = (mtime, css)
+        return css
+
+    def get_full_html(self, body_content: str, title: str, theme_name: str = 'default', landscape: bool = False, header_left: str = "", process_body: bool = True, inline_css: bool = True) -> str:
+        """Wrap body HTML in the themed document.
+
+        Pass `process_body=False` when alerts and math were already rewritten
+        (e.g. by `HtmlTransformer`), and `inline_css=False` when the stylesheet
+        is supplied separately (see `Processor.stylesheets_for`).
+        """
+        if process_body:
+            body_content = self._process_math(self._process_alerts(body_content), theme_name)
+
+        style_block = f"<style>{self.get_css(theme_name, landscape, header_left)}</style>" if inline_css else ""
         
         return f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
     <title>{title}</title>
-    <style>
-        {alert_css}
-        {css_content}
-        {header_css}
-        {orientation_css}
-    </style>
+    {style_block}
 </head>
 <body>
     <div class="container">
-        {self._process_math(self._process_alerts(body_content), theme_name)}
+        {body_content}
     </div>
 </body>
 </html>"""
 
     def _process_alerts(self, html: str) -> str:
         """Convert standard blockquote alerts to styled divs while preserving internal structure."""
+        if '<blockquote' not in html:
+            return html
+        soup = parse_fragment(html)
+        self.process_alerts_tree(soup)
+        return serialize_fragment(soup)
+
+    def process_alerts_tree(self, soup):
+        """In-place variant of `_process_alerts` operating on an already parsed tree."""
         ALERT_TYPES = {
             'NOTE': 'note', 'TIP': 'tip', 'IMPORTANT': 'important',
             'WARNING': 'warning', 'CAUTION': 'caution'
         }
         
-        soup = BeautifulSoup(html, 'html.parser')
         for bq in soup.find_all('blockquote'):
             # Check if it starts with [!TYPE]
             # Use find(text=True) to look for the marker in the first content node
@@ -412,11 +950,17 @@ class ThemeManager:
                     new_div.append(child)
                 
                 bq.replace_with(new_div)
-        
-        return str(soup)
 
     def _process_math(self, html: str, theme_name: str = 'default') -> str:
         """Improve math formula appearance using Matplotlib (SVG) or text beautification."""
+        if 'arithmatex' not in html:
+            return html
+        soup = parse_fragment(html)
+        self.process_math_tree(soup, theme_name)
+        return serialize_fragment(soup)
+
+    def process_math_tree(self, soup, theme_name: str = 'default'):
+        """In-place variant of `_process_math` operating on an already parsed tree."""
         
         # Theme colors for Math
         THEME_COLORS = {
@@ -426,7 +970,6 @@ class ThemeManager:
         }
         text_color = THEME_COLORS.get(theme_name, '#333333')
 
-        soup = BeautifulSoup(html, 'html.parser')
         
         for math_tag in soup.find_all(class_='arithmatex'):
             content = math_tag.get_text()
@@ -444,12 +987,12 @@ class ThemeManager:
             rendered = False
             
             # 3. Try Rendering via Matplotlib
-            if MATPLOTLIB_AVAILABLE and clean_tex:
+            if clean_tex and load_pyplot() is not None:
                 try:
                     svg_data = self._render_latex_to_svg(clean_tex, text_color)
                     if svg_data:
                         # Parse SVG and insert
-                        svg_soup = BeautifulSoup(svg_data, 'xml')
+                        svg_soup = make_soup(svg_data, 'xml')
                         svg_element = svg_soup.find('svg')
                         if svg_element:
                             # Add class for sizing
@@ -477,116 +1020,1313 @@ class ThemeManager:
                     display_text = display_text.replace(tex, uni)
                 
                 math_tag.string = display_text
-            
-        return str(soup)
 
     def _render_latex_to_svg(self, latex: str, color: str) -> Optional[str]:
-        """Render TeX string to SVG using Matplotlib."""
+        """Render TeX string to SVG using Matplotlib, memoized in memory and on disk."""
+        import matplotlib
+
+        with self.instrumentation.span('math.formula') as info:
+            key = self.math_cache.make_key(latex, color, self.MATH_FONT_SIZE, matplotlib.__version__)
+            cached = self.math_cache.get(key)
+            info['cache'] = 'hit' if cached is not None else 'miss'
+            if cached is not None:
+                return cached
+            svg_data = self._draw_latex_svg(latex, color)
+            if svg_data:
+                self.math_cache.put(key, svg_data)
+            return svg_data
+
+    def _draw_latex_svg(self, latex: str, color: str) -> Optional[str]:
+        # A standalone Figure with its own SVG canvas never touches pyplot's global
+        # figure manager, so server worker threads can render math concurrently
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_svg import FigureCanvasSVG
+
+        fig = Figure(figsize=(0.01, 0.01))
+        FigureCanvasSVG(fig)
+        fig.patch.set_alpha(0)  # Transparent bg
+
+        # Setup text
+        # We wrap in $...$ for MathText
+        fig.text(0, 0, f"${latex}$", fontsize=self.MATH_FONT_SIZE, color=color)
+
+        # Save to buffer (no date metadata, so identical formulas give identical bytes)
+        output = io.BytesIO()
+        fig.savefig(output, format='svg', bbox_inches='tight', pad_inches=0.1, metadata={'Date': None})
+        return output.getvalue().decode('utf-8')
+        # Add a simple client-side MathJax script if we were in browser, 
+        # but since we are in WeasyPrint, we add a placeholder CSS for math center alignment
+
+FRAGMENT_ROOT_ID = '__md_root'
+
+def parse_fragment(html: str, parser: str = DEFAULT_HTML_PARSER):
+    """Parse an HTML body fragment inside a container element.
+
+    lxml would otherwise hoist leading <style>/<link>/<meta>/<title> into
+    <head> and leave leading comments outside <body>; inside the container
+    they stay where they are (see serialize_fragment).
+    """
+    return make_soup(f'<div id="{FRAGMENT_ROOT_ID}">{html}</div>', parser)
+
+def serialize_fragment(soup) -> str:
+    """Serialize a fragment parsed by parse_fragment, without the container or the <html><body> lxml adds."""
+    root = soup.find(id=FRAGMENT_ROOT_ID)
+    if root is not None:
+        return root.decode_contents()
+    if soup.body is not None:
+        return soup.body.decode_contents()
+    return str(soup)
+
+class HtmlTransformer:
+    """Parses the Markdown output once and runs every rewriting pass on that tree.
+
+    Passes: mermaid -> alerts -> math -> images. The tree is serialized a
+    single time and per-pass wall times (seconds) are kept in `last_timings`;
+    each step is also reported as an instrumentation span.
+    """
+
+    def __init__(self, mermaid: 'MermaidRenderer', themes: 'ThemeManager', parser: Optional[str] = None,
+                 instrumentation: Optional[Instrumentation] = None, assets: Optional['ImageAssets'] = None):
+        self.mermaid = mermaid
+        self.themes = themes
+        self.assets = assets
+        self.parser = parser or DEFAULT_HTML_PARSER
+        self.instrumentation = instrumentation or Instrumentation()
+        self.last_timings: Dict[str, float] = {}
+
+    def transform(self, html_body: str, theme_name: str = 'default', base_dir: Optional[Path] = None,
+                  landscape: bool = False) -> str:
+        """Rewrite one HTML body; relative image paths resolve against base_dir (the Markdown file's folder)."""
+        timings = {}
+        soup = None
+
+        def parse():
+            nonlocal soup
+            soup = parse_fragment(html_body, self.parser)
+
+        steps = [
+            ('parse', 'transform.parse', parse),
+            ('mermaid', 'mermaid', lambda: self.mermaid.render_tree(soup)),
+            ('alerts', 'alerts', lambda: self.themes.process_alerts_tree(soup)),
+            ('math', 'math', lambda: self.themes.process_math_tree(soup, theme_name)),
+        ]
+        if self.assets is not None:
+            steps.append(('images', 'images', lambda: self.assets.process_tree(soup, base_dir, landscape)))
+        for name, span_name, run in steps:
+            start = time.perf_counter()
+            with self.instrumentation.span(span_name):
+                run()
+            timings[name] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with self.instrumentation.span('transform.serialize'):
+            html = serialize_fragment(soup)
+        timings['serialize'] = time.perf_counter() - start
+        self.last_timings = timings
+        return html
+
+class FontSubsetter:
+    """Pre-resolved CJK font files and a disk cache of their glyph subsets.
+
+    The configured families are looked up with fontconfig once and the result
+    is kept in `fonts/resolved.json`, so later runs skip the lookup. Subsets
+    are built with fontTools and stored content-addressed by (font file,
+    weight, glyph set); `font_face_css` then maps every configured family name
+    onto the subset through @font-face, so WeasyPrint loads a small font
+    instead of a 10-20 MB CJK collection.
+    """
+
+    # fontconfig weights: 80 = regular, 200 = bold
+    WEIGHTS = {'normal': 80, 'bold': 200}
+    # Always in the glyph set: ASCII, typographic punctuation and CJK punctuation
+    BASE_GLYPHS = ''.join(chr(c) for c in range(0x20, 0x7f)) + '\u00a0\u00b7\u2013\u2014\u2018\u2019\u201c\u201d\u2022\u2026\u00b6' + \
+        ''.join(chr(c) for c in range(0x3000, 0x3040)) + ''.join(chr(c) for c in range(0xff01, 0xff5f))
+    # The theme's body font stack, and the generic families the subset is inserted before
+    BODY_FONT_PATTERN = re.compile(r'^body\s*\{[^}]*?font-family:\s*([^;}]+)', re.MULTILINE)
+    GENERIC_FAMILIES = ('serif', 'sans-serif', 'monospace', 'cursive', 'fantasy', 'system-ui')
+
+    def __init__(self, families: Optional[List[str]] = None, cache_dir: Optional[Path] = None):
+        self.families = list(families or DEFAULT_CJK_FONT_FAMILIES)
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_root() / 'fonts'
+        self.cache = DiskCache(self.cache_dir / 'subsets', 'otf')
+        self._resolved: Optional[Dict] = None
+        self._css: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.cache.hits, 'memory_hits': self.cache.memory_hits, 'misses': self.cache.misses,
+                'writes': self.cache.writes, 'evictions': self.cache.evictions}
+
+    @staticmethod
+    def _fc_list(family: str) -> List[Tuple[str, int, int]]:
+        """(file, face index, fontconfig weight) of the upright faces of a family."""
         try:
-            fig = plt.figure(figsize=(0.01, 0.01))
-            fig.patch.set_alpha(0)  # Transparent bg
-            
-            # Setup text
-            # We wrap in $...$ for MathText
-            text = fig.text(0, 0, f"${latex}$", fontsize=14, color=color)
-            
-            # Save to buffer
-            output = io.BytesIO()
-            fig.savefig(output, format='svg', bbox_inches='tight', pad_inches=0.1)
-            plt.close(fig)
-            
-            return output.getvalue().decode('utf-8')
-        except Exception:
+            result = subprocess.run(['fc-list', '--format', '%{file}\t%{index}\t%{weight}\t%{slant}\n', f':family={family}'],
+                                    capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            return []
+        faces = []
+        for line in result.stdout.splitlines():
+            parts = line.split('\t')
+            if len(parts) == 4 and parts[3].split()[0] in ('0', ''):
+                try:
+                    faces.append((parts[0], int(parts[1].split()[0]), int(float(parts[2].split()[0]))))
+                except ValueError:
+                    continue
+        return faces
+
+    def resolve(self) -> Dict:
+        """{'family', 'faces': {weight name: [file, index]}} of the first installed family, {} if none."""
+        if self._resolved is not None:
+            return self._resolved
+        record_path = self.cache_dir / 'resolved.json'
+        try:
+            record = json.loads(record_path.read_text(encoding='utf-8'))
+            faces = record.get('faces', {})
+            if record.get('families') == self.families and all(
+                    os.path.exists(path) and os.path.getmtime(path) == mtime for path, _, mtime in faces.values()):
+                self._resolved = {'family': record.get('family'), 'faces': {k: v[:2] for k, v in faces.items()}}
+                return self._resolved
+        except (OSError, ValueError, TypeError):
+            pass
+
+        resolved: Dict = {}
+        for family in self.families:
+            faces = self._fc_list(family)
+            if not faces:
+                continue
+            chosen = {}
+            for name, target in self.WEIGHTS.items():
+                path, index, _ = min(faces, key=lambda face: abs(face[2] - target))
+                chosen[name] = [path, index]
+            resolved = {'family': family, 'faces': chosen}
+            break
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        record_faces = {k: [path, index, os.path.getmtime(path)] for k, (path, index) in resolved.get('faces', {}).items()}
+        record_path.write_text(json.dumps({'families': self.families, 'family': resolved.get('family'),
+                                           'faces': record_faces}, ensure_ascii=False), encoding='utf-8')
+        self._resolved = resolved
+        return resolved
+
+    @classmethod
+    def glyph_set(cls, text: str) -> str:
+        """Sorted distinct characters of text plus BASE_GLYPHS (the subset key)."""
+        return ''.join(sorted(set(text) | set(cls.BASE_GLYPHS)))
+
+    def subset(self, font_path: str, font_index: int, glyphs: str) -> Path:
+        """Cached subset of one face covering `glyphs`; built with fontTools on a miss."""
+        st = os.stat(font_path)
+        key = DiskCache.make_key('font-subset', font_path, font_index, st.st_size, st.st_mtime, glyphs)
+        path = self.cache.path_for(key)
+        if self.cache.contains(key):
+            self.cache.hits += 1
             try:
-                plt.close(fig)
-            except:
+                os.utime(path)
+            except OSError:
                 pass
+            return path
+        self.cache.misses += 1
+
+        from fontTools import subset as ft_subset
+
+        options = ft_subset.Options()
+        options.font_number = font_index
+        options.layout_features = ['*']
+        options.name_IDs = ['*']
+        options.notdef_outline = True
+        font = ft_subset.load_font(font_path, options, dontLoadGlyphNames=True)
+        subsetter = ft_subset.Subsetter(options)
+        subsetter.populate(unicodes=[ord(ch) for ch in glyphs])
+        subsetter.subset(font)
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache.root, prefix='.tmp_')
+        os.close(fd)
+        try:
+            ft_subset.save_font(font, tmp_name, options)
+        except Exception:
+            os.unlink(tmp_name)
             raise
-        # Add a simple client-side MathJax script if we were in browser, 
-        # but since we are in WeasyPrint, we add a placeholder CSS for math center alignment
+        finally:
+            font.close()
+        self.cache.put_file(key, Path(tmp_name))
+        return path
+
+    def font_face_css(self, text: str) -> str:
+        """@font-face rules pointing every configured family at a subset covering `text` ('' without CJK fonts)."""
+        resolved = self.resolve()
+        if not resolved:
+            return ""
+        glyphs = self.glyph_set(text)
+        digest = hashlib.sha256(glyphs.encode('utf-8')).hexdigest()
+        with self._lock:
+            if digest in self._css:
+                return self._css[digest]
+        rules = []
+        for weight, (font_path, font_index) in resolved['faces'].items():
+            url = self.subset(font_path, font_index, glyphs).as_uri()
+            rules.extend(f"@font-face {{ font-family: '{family}'; font-weight: {weight}; src: url('{url}'); }}"
+                         for family in self.families)
+        css = "\n".join(rules)
+        with self._lock:
+            self._css[digest] = css
+        return css
+
+    def body_font_css(self, theme_css: str) -> str:
+        """A body rule adding the configured families to the theme's font stack ('' if it already has them).
+
+        The families go after the theme's own fonts and before its generic
+        family, so Latin text keeps the theme font and only characters it
+        lacks fall back to the subset. Themes are left untouched, which keeps
+        the default 'weasyprint' mode rendering exactly as before.
+        """
+        match = self.BODY_FONT_PATTERN.search(theme_css)
+        stack = [name.strip() for name in match.group(1).split(',')] if match else ['sans-serif']
+        listed = {name.strip('\'"').lower() for name in stack}
+        missing = [f"'{family}'" for family in self.families if family.lower() not in listed]
+        if not missing:
+            return ""
+        cut = len(stack)
+        while cut and stack[cut - 1].strip('\'"').lower() in self.GENERIC_FAMILIES:
+            cut -= 1
+        return f"body {{ font-family: {', '.join(stack[:cut] + missing + stack[cut:])}; }}"
+
+def is_within(path: Path, roots: Optional[List[Path]]) -> bool:
+    """True when `roots` is None (no confinement) or the resolved `path` lies inside one of them."""
+    return roots is None or any(path == root or root in path.parents for root in roots)
+
+class ImageAssets:
+    """Resolves <img> sources against the Markdown file and serves downscaled copies.
+
+    Images wider than the page's content width at `dpi` are resized and
+    recompressed (JPEG for opaque images, optimized PNG otherwise) into a
+    content-addressed cache keyed by the original bytes and target size, so
+    later builds read the small copy instead of decoding the original. When
+    re-encoding does not make an image smaller, the original bytes are cached
+    instead. SVGs are only resolved. Without Pillow, or with `dpi=0`, paths are
+    resolved and originals used as they are.
+    """
+
+    def __init__(self, dpi: int = DEFAULT_IMAGE_DPI, quality: int = DEFAULT_IMAGE_QUALITY, cache_root: Optional[Path] = None):
+        self.dpi = dpi
+        self.quality = quality
+        root = (cache_root or default_cache_root()) / 'images'
+        self.caches = {'jpg': DiskCache(root, 'jpg'), 'png': DiskCache(root, 'png')}
+        # (path, size, mtime, max width) -> served file, so a batch hashes each image once
+        self._memo: Dict[Tuple[str, int, int, int], Path] = {}
+        self._lock = threading.Lock()
+        self._pillow = None
+        # When set (see Processor.confine), only images inside these folders are served
+        self.roots: Optional[List[Path]] = None
+
+    def stats(self) -> Dict[str, int]:
+        return {name: sum(getattr(cache, name) for cache in self.caches.values())
+                for name in ('hits', 'memory_hits', 'misses', 'writes', 'evictions')}
+
+    def max_width(self, landscape: bool = False) -> int:
+        return int(PAGE_CONTENT_WIDTH_IN[bool(landscape)] * self.dpi)
+
+    @staticmethod
+    def resolve(src: str, base_dir: Optional[Path] = None) -> Optional[Path]:
+        """Local file an <img src> points at, or None (remote, data: URI, missing file)."""
+        parsed = urlparse(src or '')
+        if parsed.scheme == 'file':
+            from urllib.request import url2pathname  # pulls in http.client/ssl; keep it off the import path
+            path = Path(url2pathname(parsed.path))
+        elif parsed.scheme or not parsed.path:
+            return None  # http(s), data:, ... and bare fragments
+        else:
+            path = Path(unquote(parsed.path))
+            if not path.is_absolute():
+                if base_dir is None:
+                    return None
+                path = Path(base_dir) / path
+        return path.resolve() if path.is_file() else None
+
+    # Image references in raw Markdown: ![alt](src), <img src="...">, and ![alt][ref] with a [ref]: src definition
+    INLINE_IMAGE = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)')
+    HTML_IMAGE = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)', re.IGNORECASE)
+    REF_IMAGE = re.compile(r'!\[([^\]]*)\]\[([^\]]*)\]')
+    REF_DEFINITION = re.compile(r'^ {0,3}\[([^\]]+)\]:\s*<?(\S+?)>?(?:\s|$)', re.MULTILINE)
+
+    @classmethod
+    def local_sources(cls, md_text: str, base_dir: Optional[Path] = None) -> List[Path]:
+        """Local image files a Markdown document references, resolved like `process_tree` does."""
+        sources = cls.INLINE_IMAGE.findall(md_text) + cls.HTML_IMAGE.findall(md_text)
+        labels = {(ref or alt).strip().lower() for alt, ref in cls.REF_IMAGE.findall(md_text)}
+        if labels:
+            sources += [src for label, src in cls.REF_DEFINITION.findall(md_text) if label.strip().lower() in labels]
+        paths = {cls.resolve(html_lib.unescape(src), base_dir) for src in sources}
+        return sorted(path for path in paths if path is not None)
+
+    def _load_pillow(self):
+        if self._pillow is None:
+            try:
+                from PIL import Image, ImageOps
+                self._pillow = (Image, ImageOps)
+            except ImportError:
+                print("[WARN] Pillow not found. Images are embedded at full resolution.")
+                self._pillow = False
+        return self._pillow
+
+    def optimized(self, path: Path, landscape: bool = False) -> Path:
+        """File to embed for an image: a cached downscaled copy, or the original."""
+        max_width = self.max_width(landscape)
+        st = path.stat()
+        memo_key = (str(path), st.st_size, st.st_mtime_ns, max_width)
+        with self._lock:
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+        served = path
+        if self.dpi > 0 and path.suffix.lower() != '.svg' and self._load_pillow():
+            data = path.read_bytes()
+            key = DiskCache.make_key('image', hashlib.sha256(data).hexdigest(), max_width, self.quality)
+            cached = next((cache for cache in self.caches.values() if cache.contains(key)), None)
+            if cached is not None:
+                cached.hits += 1
+                served = cached.path_for(key)
+                try:
+                    os.utime(served)
+                except OSError:
+                    pass
+            else:
+                self.caches['jpg'].misses += 1
+                try:
+                    served = self._encode(data, key, max_width)
+                except Exception as e:
+                    print(f"[WARN] Could not optimize image {path}: {e}")
+        with self._lock:
+            self._memo[memo_key] = served
+        return served
+
+    def _encode(self, data: bytes, key: str, max_width: int) -> Path:
+        Image, ImageOps = self._pillow
+        with Image.open(io.BytesIO(data)) as original:
+            source_format = original.format
+            image = ImageOps.exif_transpose(original)
+            resized = image.width > max_width
+            if resized:
+                image = image.resize((max_width, max(1, round(image.height * max_width / image.width))), Image.LANCZOS)
+            opaque = image.mode not in ('RGBA', 'LA', 'PA') and 'transparency' not in image.info
+            buffer = io.BytesIO()
+            if opaque and (source_format == 'JPEG' or image.mode in ('RGB', 'CMYK', 'YCbCr')):
+                suffix = 'jpg'
+                image.convert('RGB').save(buffer, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+            else:
+                suffix = 'png'
+                image.save(buffer, 'PNG', optimize=True)
+        encoded = buffer.getvalue()
+        # Keep the original when re-encoding a small image does not pay off
+        original_suffix = {'JPEG': 'jpg', 'PNG': 'png'}.get(source_format)
+        if not resized and original_suffix and len(data) <= len(encoded):
+            suffix, encoded = original_suffix, data
+        cache = self.caches[suffix]
+        fd, tmp_name = tempfile.mkstemp(dir=cache.root, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(encoded)
+        except Exception:
+            os.unlink(tmp_name)
+            raise
+        cache.put_file(key, Path(tmp_name))
+        return cache.path_for(key)
+
+    def process_tree(self, soup, base_dir: Optional[Path] = None, landscape: bool = False) -> int:
+        """Point every local <img> at its served file (absolute file: URI); returns how many were rewritten.
+
+        Merged sections carry their own folder in `data-base-dir`, which wins over base_dir.
+        """
+        rewritten = 0
+        for img in soup.find_all('img', src=True):
+            section = img.find_parent(attrs={'data-base-dir': True})
+            path = self.resolve(img['src'], Path(section['data-base-dir']) if section else base_dir)
+            if path is None or not is_within(path, self.roots):
+                continue
+            img['src'] = self.optimized(path, landscape).as_uri()
+            rewritten += 1
+        return rewritten
+
+class ResourceFetcher:
+    """URL fetcher for WeasyPrint shared by every document a Processor renders.
+
+    `file:` resources are read once and kept in an in-memory LRU keyed by
+    (resolved path, mtime, size) under a byte budget, so a batch or merge does
+    not re-read the same images, font subsets and SVGs per document; editing a
+    file changes its key. `http(s)` URLs are answered from `mirror_dir`
+    (`<mirror>/<host>/<path>`) when one is set, refused unless `allow_remote`,
+    and otherwise handed to WeasyPrint's own fetcher, as are `data:` and other
+    schemes.
+    """
+
+    def __init__(self, allow_remote: bool = DEFAULT_ALLOW_REMOTE, mirror_dir: Optional[Path] = None,
+                 max_bytes: int = DEFAULT_FETCH_CACHE_MB * 1024 * 1024):
+        self.allow_remote = allow_remote
+        self.mirror_dir = Path(mirror_dir).resolve() if mirror_dir else None
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, int, int], Tuple[bytes, Optional[str]]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._warned: set = set()
+        self._adapter = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.blocked = 0
+        self.mirrored = 0
+        # When set (see Processor.confine), file: URLs outside these folders are refused
+        self.roots: Optional[List[Path]] = None
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'blocked': self.blocked, 'mirrored': self.mirrored}
+
+    def local_path(self, url: str) -> Optional[Path]:
+        """File a URL is served from (file: URL or mirrored http(s) URL); None to delegate.
+
+        Raises ValueError for a remote URL that is neither mirrored nor allowed.
+        """
+        parsed = urlparse(url)
+        scheme = parsed.scheme.lower()
+        if scheme == 'file':
+            from urllib.request import url2pathname  # pulls in http.client/ssl; keep it off the import path
+            path = Path(url2pathname(unquote(parsed.path))).resolve()
+            if not is_within(path, self.roots):
+                with self._lock:
+                    self.blocked += 1
+                print(f"[WARN] Local resource outside the allowed folders skipped: {path}")
+                raise ValueError(f"Local file outside the allowed folders: {path}")
+            return path
+        if scheme not in ('http', 'https'):
+            return None
+        if self.mirror_dir is not None:
+            path = (self.mirror_dir / parsed.netloc / unquote(parsed.path).lstrip('/')).resolve()
+            if path.is_dir():
+                path = path / 'index.html'
+            if self.mirror_dir in path.parents and path.is_file():
+                with self._lock:
+                    self.mirrored += 1
+                return path
+        if self.allow_remote:
+            return None
+        with self._lock:
+            self.blocked += 1
+            first = url not in self._warned
+            self._warned.add(url)
+        if first:
+            where = f" (not in mirror {self.mirror_dir})" if self.mirror_dir else ""
+            print(f"[WARN] Remote resource skipped{where}: {url}. Pass --allow-remote or --mirror-dir to include it.")
+        raise ValueError(f"Remote fetching is disabled: {url}")
+
+    def read(self, path: Path) -> Tuple[bytes, Optional[str]]:
+        """(bytes, MIME type) of a local file, from the LRU while its mtime and size are unchanged."""
+        st = path.stat()
+        key = (str(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        import mimetypes
+        entry = (path.read_bytes(), mimetypes.guess_type(path.name)[0])
+        if len(entry[0]) <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = entry
+                    self._bytes += len(entry[0])
+                while self._bytes > self.max_bytes:
+                    _, (data, _) = self._entries.popitem(last=False)
+                    self._bytes -= len(data)
+                    self.evictions += 1
+        return entry
+
+    def __call__(self, url: str) -> Optional[Dict]:
+        """WeasyPrint fetcher dict for `url`, or None when WeasyPrint's default fetcher should handle it."""
+        path = self.local_path(url)
+        if path is None:
+            return None
+        data, mime_type = self.read(path)
+        return {'string': data, 'mime_type': mime_type, 'redirected_url': path.as_uri(), 'filename': path.name}
+
+    def url_fetcher(self):
+        """This fetcher in the form the installed WeasyPrint expects.
+
+        WeasyPrint 66+ takes a `weasyprint.urls.URLFetcher` subclass returning
+        URLFetcherResponse objects; older releases take a function returning a dict.
+        """
+        if self._adapter is None:
+            weasyprint = load_weasyprint()
+            base = getattr(weasyprint.urls, 'URLFetcher', None)
+            owner = self
+            if isinstance(base, type):
+                response_class = weasyprint.urls.URLFetcherResponse
+
+                class CachedURLFetcher(base):
+                    def fetch(self, url, headers=None):
+                        result = owner(url)
+                        if result is None:
+                            return super().fetch(url, headers)
+                        content_type = {'Content-Type': result['mime_type']} if result['mime_type'] else None
+                        return response_class(result['redirected_url'], result['string'], content_type)
+
+                self._adapter = CachedURLFetcher()
+            else:
+                def fetch(url):
+                    return owner(url) or weasyprint.default_url_fetcher(url)
+
+                self._adapter = fetch
+        return self._adapter
 
 class PDFEngine:
-    """Generates PDF using WeasyPrint."""
+    """Generates PDF using WeasyPrint.
+
+    One FontConfiguration lives for the whole engine, and stylesheets are
+    parsed once per distinct CSS text, so a batch does not rebuild font state
+    or re-parse the theme for every document. Resources referenced by the
+    HTML and CSS are loaded through `fetcher` (a ResourceFetcher) when given.
+    """
+
+    def __init__(self, fetcher: Optional[ResourceFetcher] = None):
+        self._font_config = None
+        self._stylesheets: Dict[str, object] = {}
+        self.fetcher = fetcher
+
+    @property
+    def url_fetcher(self):
+        return self.fetcher.url_fetcher() if self.fetcher is not None else None
+
+    @property
+    def font_config(self):
+        if self._font_config is None:
+            weasyprint = load_weasyprint()
+            self._font_config = weasyprint.text.fonts.FontConfiguration()
+        return self._font_config
+
+    def stylesheet(self, css_text: str):
+        """Parsed weasyprint.CSS for `css_text`, shared across documents."""
+        key = hashlib.sha256(css_text.encode('utf-8')).hexdigest()
+        if key not in self._stylesheets:
+            weasyprint = load_weasyprint()
+            self._stylesheets[key] = weasyprint.CSS(string=css_text, font_config=self.font_config,
+                                                     url_fetcher=self.url_fetcher)
+        return self._stylesheets[key]
     
-    def generate(self, html_content: str, output_path: Path):
-        font_config = FontConfiguration()
-        html = HTML(string=html_content)
-        html.write_pdf(str(output_path), font_config=font_config)
+    def generate(self, html_content: str, output_path: Optional[Path], stylesheets: Optional[List] = None,
+                 full_fonts: bool = False) -> Optional[bytes]:
+        """Write the PDF to output_path, or return its bytes when output_path is None.
+
+        `full_fonts` embeds fonts as loaded instead of subsetting them again;
+        used when the fonts are already a shared subset (FontSubsetter).
+        """
+        weasyprint = load_weasyprint()
+        html = weasyprint.HTML(string=html_content, url_fetcher=self.url_fetcher)
+        target = str(output_path) if output_path is not None else None
+        options = {'full_fonts': True} if full_fonts else {}
+        return html.write_pdf(target, stylesheets=stylesheets, font_config=self.font_config, **options)
+
+    def render(self, html_content: str, stylesheets: Optional[List] = None):
+        """Lay out HTML into an in-memory WeasyPrint Document without writing a PDF."""
+        weasyprint = load_weasyprint()
+        return weasyprint.HTML(string=html_content, url_fetcher=self.url_fetcher).render(stylesheets=stylesheets, font_config=self.font_config)
+
+    @staticmethod
+    def heading_index(document, max_level: int = 2) -> List[Tuple[int, str, int]]:
+        """(level, label, page index) of the heading bookmarks laid out in a rendered Document."""
+        return [(level, label, index) for index, page in enumerate(document.pages)
+                for level, label, *_ in page.bookmarks if level <= max_level]
+
+    def write_documents(self, documents: List, output_path: Path, full_fonts: bool = False):
+        """Concatenate the pages of rendered Documents into a single PDF."""
+        pages = [page for document in documents for page in document.pages]
+        options = {'full_fonts': True} if full_fonts else {}
+        documents[0].copy(pages).write_pdf(str(output_path), **options)
+
+class BuildManifest:
+    """Persistent record of the inputs each output PDF was built from.
+
+    Maps every output PDF to a fingerprint of its Markdown source, theme CSS,
+    layout options and converter version, so unchanged files can be skipped.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if path.exists():
+            try:
+                self.entries = json.loads(path.read_text(encoding='utf-8')).get('outputs', {})
+            except (ValueError, OSError) as e:
+                print(f"[WARN] Ignoring unreadable build manifest {path}: {e}")
+
+    @staticmethod
+    def _key(output_path: Path) -> str:
+        return str(output_path.resolve())
+
+    def is_current(self, output_path: Path, fingerprint: Dict) -> bool:
+        return output_path.exists() and self.entries.get(self._key(output_path)) == fingerprint
+
+    def record(self, output_path: Path, fingerprint: Dict):
+        self.entries[self._key(output_path)] = fingerprint
+        self.save()
+
+    def forget(self, output_path: Path):
+        """Drop an output's entry (its source was deleted)."""
+        if self.entries.pop(self._key(output_path), None) is not None:
+            self.save()
+
+    def save(self):
+        """Write the manifest atomically so an interrupted run never leaves it half-written."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = json.dumps({'version': CONVERTER_VERSION, 'outputs': self.entries}, indent=1, ensure_ascii=False)
+        fd, tmp_name = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+                handle.write(payload)
+            os.replace(tmp_name, self.path)
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+
+def merged_output_path(output_path: Path) -> Path:
+    """Merged PDF location: a directory argument means `<dir>/merged.pdf`."""
+    output_path = Path(output_path)
+    return output_path / "merged.pdf" if output_path.is_dir() else output_path
+
+def manifest_path_for(output_dir: Path) -> Path:
+    """Location of the build manifest kept next to an output/intermediate directory."""
+    output_dir = Path(output_dir)
+    return output_dir.parent / f"{output_dir.name}.manifest.json"
+
+def output_targets(output_path: Path, output_format: str = DEFAULT_OUTPUT_FORMAT) -> Dict[str, Path]:
+    """Files written for one document: {'pdf': ..., 'html': ...} per output format, sharing output_path's stem."""
+    formats = ('pdf', 'html') if output_format == 'both' else (output_format,)
+    return {fmt: output_path.with_suffix(f'.{fmt}') for fmt in formats}
+
+_FILE_URL_SRC = re.compile(r'(<img\b[^>]*?\bsrc=")(file:[^"]+)(")')
+
+def _file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest() if path.exists() else ""
 
 class Processor:
     """Orchestrates the conversion process."""
     
-    def __init__(self, style_dir: Path):
+    def __init__(self, style_dir: Path, manifest: Optional[BuildManifest] = None,
+                 mermaid_batch: bool = DEFAULT_MERMAID_BATCH, font_subset: str = DEFAULT_FONT_SUBSET,
+                 image_dpi: int = DEFAULT_IMAGE_DPI, allow_remote: bool = DEFAULT_ALLOW_REMOTE,
+                 mirror_dir: Optional[Path] = DEFAULT_MIRROR_DIR):
         self.pipeline = MarkdownPipeline()
-        self.mermaid = MermaidRenderer()
+        self.mermaid = MermaidRenderer(batch_mode=mermaid_batch)
         self.themes = ThemeManager(style_dir)
-        self.engine = PDFEngine()
+        # One set of stage hooks shared by every component (see enable_profile)
+        self.instrumentation = Instrumentation()
+        self.mermaid.instrumentation = self.instrumentation
+        self.themes.instrumentation = self.instrumentation
+        self.assets = ImageAssets(image_dpi)
+        self.transformer = HtmlTransformer(self.mermaid, self.themes, instrumentation=self.instrumentation,
+                                           assets=self.assets)
+        # One resource cache for every document this Processor (or pool worker) renders
+        self.fetcher = ResourceFetcher(allow_remote, mirror_dir)
+        self.engine = PDFEngine(self.fetcher)
+        self.fonts = FontSubsetter()
+        self.font_subset = font_subset
+        self.manifest = manifest
+        # (path, size, mtime_ns) -> sha256 of images referenced by fingerprinted sources
+        self._image_digests: Dict[Tuple[str, int, int], str] = {}
+        # Constructor options replayed in pool workers (the manifest stays in this process)
+        self.worker_options = {'mermaid_batch': mermaid_batch, 'font_subset': font_subset, 'image_dpi': image_dpi,
+                               'allow_remote': allow_remote, 'mirror_dir': mirror_dir}
 
-    def process(self, input_path: Path, output_path: Path, theme: str = 'default', **kwargs):
-        # Resolve output path if it's a directory
-        if output_path.is_dir():
-            output_path = output_path / input_path.with_suffix('.pdf').name
-        
-        # Ensure parent directory exists
-        output_path.parent.mkdir(parents=True, exist_ok=True)
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters of the render caches owned by this Processor."""
+        return {'mermaid': self.mermaid.cache_stats(), 'math': self.themes.math_cache.stats(), 'font subset': self.fonts.stats(), 'image': self.assets.stats(),
+                'resource': self.fetcher.stats()}
 
-        print(f"Processing {input_path.name}...")
+    def confine(self, root: Path):
+        """Read local images and resources only from inside `root` (and this Processor's own caches)."""
+        root = Path(root).resolve()
+        self.assets.roots = [root]
+        caches = [self.assets.caches['jpg'].root, self.fonts.cache.root]
+        self.fetcher.roots = [root] + [cache.resolve() for cache in caches]
+
+    def enable_profile(self) -> ProfileRecorder:
+        """Attach a ProfileRecorder to this Processor's stage hooks and return it."""
+        recorder = ProfileRecorder()
+        self.instrumentation.add_listener(recorder)
+        return recorder
+
+    def report_cache_stats(self):
+        # Each cache reports its own counters (the resource fetcher has no writes, but blocked/mirrored)
+        for name, stats in self.cache_stats().items():
+            if any(stats.values()):
+                counts = ", ".join(f"{value} {key.replace('_', ' ')}" for key, value in stats.items())
+                print(f"{name.title()} cache: {counts}")
+        if self.fetcher.blocked:
+            print(f"Skipped {self.fetcher.blocked} resource requests (remote fetching is off, or outside the allowed folders)")
+
+    def prefetch_mermaid(self, input_paths: List[Path]) -> int:
+        """Render the uncached diagrams of several files together before converting them."""
+        if not self.mermaid.batch_mode:
+            return 0
+        sources = []
+        for p in input_paths:
+            try:
+                sources.extend(self.mermaid.extract_sources(p.read_text(encoding='utf-8')))
+            except OSError:
+                continue
+        rendered = self.mermaid.prefetch(sources)
+        if rendered:
+            print(f"Pre-rendered {rendered} Mermaid diagrams in batch")
+        return rendered
+
+    def fingerprint(self, input_path: Path, theme: str = 'default', **kwargs) -> Dict:
+        """Everything that determines the bytes of an output PDF."""
+        # In 'batch' font mode every PDF embeds the batch's shared subset, so a new
+        # character anywhere in the batch makes all of its outputs stale
+        glyphs = self.fonts.glyph_set(kwargs['font_glyphs']) if kwargs.get('font_glyphs') else ""
+        return {
+            'source': _file_digest(input_path),
+            'style': _file_digest(self.themes.style_dir / f"{theme}.css"),
+            'theme': theme,
+            'landscape': bool(kwargs.get('landscape', False)),
+            'header_left': kwargs.get('header_left') or DEFAULT_HEADER_LEFT,
+            'header_right': DEFAULT_HEADER_RIGHT,
+            'font_subset': self.font_subset,
+            'font_glyphs': hashlib.sha256(glyphs.encode('utf-8')).hexdigest() if glyphs else "",
+            'image_dpi': self.assets.dpi,
+            'remote': str(self.fetcher.mirror_dir or self.fetcher.allow_remote),
+            'images': self.image_digests(input_path),
+            'converter': CONVERTER_VERSION,
+        }
+
+    def image_dependencies(self, input_path: Path) -> List[Path]:
+        """Local images a Markdown file embeds (see ImageAssets.local_sources)."""
+        try:
+            md_text = input_path.read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError):
+            return []
+        return ImageAssets.local_sources(md_text, input_path.parent)
+
+    def image_digests(self, input_path: Path) -> Dict[str, str]:
+        """sha256 of every embedded local image, rehashed only when its size or mtime changes."""
+        digests = {}
+        for path in self.image_dependencies(input_path):
+            st = path.stat()
+            key = (str(path), st.st_size, st.st_mtime_ns)
+            if key not in self._image_digests:
+                self._image_digests[key] = _file_digest(path)
+            digests[str(path)] = self._image_digests[key]
+        return digests
+
+    def _target_fingerprint(self, fmt: str, fingerprint: Dict, **kwargs) -> Dict:
+        if fmt == 'html':
+            return dict(fingerprint, html_assets=kwargs.get('html_assets', DEFAULT_HTML_ASSETS))
+        return fingerprint
+
+    def is_up_to_date(self, input_path: Path, output_path: Path, theme: str = 'default', **kwargs) -> bool:
+        if self.manifest is None or kwargs.get('force'):
+            return False
+        fingerprint = self.fingerprint(input_path, theme, **kwargs)
+        targets = output_targets(output_path, kwargs.get('output_format', DEFAULT_OUTPUT_FORMAT))
+        return all(self.manifest.is_current(path, self._target_fingerprint(fmt, fingerprint, **kwargs))
+                   for fmt, path in targets.items())
+
+    def record_outputs(self, input_path: Path, output_path: Path, theme: str = 'default', **kwargs):
+        """Record every output file of a converted document in the build manifest."""
+        if self.manifest is None:
+            return
+        fingerprint = self.fingerprint(input_path, theme, **kwargs)
+        for fmt, path in output_targets(output_path, kwargs.get('output_format', DEFAULT_OUTPUT_FORMAT)).items():
+            self.manifest.record(path, self._target_fingerprint(fmt, fingerprint, **kwargs))
+
+    def stylesheets_for(self, theme: str = 'default', glyphs: str = "", **kwargs) -> List:
+        """Shared parsed stylesheets for a theme/orientation/header combination.
+
+        With a font subset mode, a second small stylesheet maps the CJK
+        families onto a cached subset: the batch's shared glyph set
+        (`font_glyphs`), or in 'document' mode the characters of `glyphs`.
+        It also adds those families to the theme's body font stack.
+        """
+        css = self.themes.get_css(theme, kwargs.get('landscape', False), kwargs.get('header_left') or "")
+        sheets = [self.engine.stylesheet(css)]
+        font_css = ""
+        if kwargs.get('font_glyphs'):
+            font_css = self.fonts.font_face_css(kwargs['font_glyphs'])
+        elif self.font_subset == 'document' and glyphs:
+            font_css = self.fonts.font_face_css(css + glyphs)
+        if font_css:
+            sheets.append(self.engine.stylesheet(font_css + "\n" + self.fonts.body_font_css(css)))
+        return sheets
+
+    def batch_glyphs(self, input_paths: List[Path], theme: str = 'default', **kwargs) -> Optional[str]:
+        """Shared glyph set for every file of a batch/merge in 'batch' font mode, else None.
+
+        Covers the Markdown sources, the theme CSS and the header/title text,
+        so each PDF embeds the same subset (which merge.py then stores once).
+        None when no configured CJK family is installed.
+        """
+        if self.font_subset != 'batch' or not self.fonts.resolve():
+            return None
+        parts = [self.themes.get_css(theme, kwargs.get('landscape', False), kwargs.get('header_left') or ""),
+                 kwargs.get('header_left') or DEFAULT_HEADER_LEFT, DEFAULT_HEADER_RIGHT, "Merged Document"]
+        for p in input_paths:
+            parts.append(p.stem.title())
+            try:
+                parts.append(p.read_text(encoding='utf-8'))
+            except OSError:
+                continue
+        return self.fonts.glyph_set("".join(parts))
+
+    def build_html(self, input_path: Path, title: str, theme: str = 'default', inline_css: bool = True, **kwargs) -> str:
+        """Markdown file -> complete themed HTML document (stages 1-3)."""
         md_text = input_path.read_text(encoding='utf-8')
-        
+        return self.build_html_from_text(md_text, title, theme, inline_css=inline_css,
+                                         base_dir=input_path.resolve().parent, **kwargs)
+
+    def build_html_from_text(self, md_text: str, title: str, theme: str = 'default', inline_css: bool = True,
+                             base_dir: Optional[Path] = None, **kwargs) -> str:
+        """Markdown text -> complete themed HTML document (stages 1-3).
+
+        Relative image paths resolve against base_dir; without it only absolute
+        and file: image sources are picked up by the image stage.
+        """
         # 1. MD -> HTML
-        html_body = self.pipeline.convert(md_text)
-        
-        # 2. Render Mermaid
-        html_body = self.mermaid.render_all(html_body)
+        with self.instrumentation.span('markdown'):
+            html_body = self.pipeline.convert(md_text)
         
-        # 3. Wrap with Theme
-        title = input_path.stem.replace('_', ' ').title()
-        header_left = kwargs.get('header_left', "")
-        full_html = self.themes.get_full_html(
+        # 2-3. Mermaid, alerts and math over a single parsed tree, then wrap with theme
+        html_body = self.transformer.transform(html_body, theme, base_dir, kwargs.get('landscape', False))
+        if kwargs.get('timings'):
+            print(format_timings(self.transformer.last_timings))
+        return self.themes.get_full_html(
             html_body, 
-            output_path.stem.title(), 
+            title, 
             theme, 
             kwargs.get('landscape', False),
-            header_left=header_left
+            header_left=kwargs.get('header_left', ""),
+            process_body=False,
+            inline_css=inline_css
         )
+
+    def convert_text(self, md_text: str, title: str = "Document", theme: str = 'default', **kwargs) -> bytes:
+        """Convert Markdown text straight to PDF bytes (no files involved)."""
+        with self.instrumentation.span('document', file=title):
+            self.mermaid.prefetch(self.mermaid.extract_sources(md_text))
+            full_html = self.build_html_from_text(md_text, title, theme, inline_css=False, **kwargs)
+            with self.instrumentation.span('pdf'):
+                return self.engine.generate(full_html, None, self.stylesheets_for(theme, full_html, **kwargs),
+                                            full_fonts=bool(kwargs.get('font_glyphs')))
+
+    def process(self, input_path: Path, output_path: Path, theme: str = 'default', **kwargs):
+        # Resolve output path if it's a directory
+        if output_path.is_dir():
+            output_path = output_path / input_path.with_suffix('.pdf').name
+
+        if self.is_up_to_date(input_path, output_path, theme, **kwargs):
+            print(f"Up to date: {output_path}")
+            return
         
-        # 4. Generate PDF
-        self.engine.generate(full_html, output_path)
-        print(f"Created: {output_path}")
+        # Ensure parent directory exists
+        output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    def batch(self, input_dir: Path, output_dir: Path, pattern: str = "*.md", theme: str = 'default', **kwargs):
+        print(f"Processing {input_path.name}...")
+        targets = output_targets(output_path, kwargs.get('output_format', DEFAULT_OUTPUT_FORMAT))
+        with self.instrumentation.span('document', file=str(input_path)):
+            # One Markdown parse and transform feeds every requested format
+            full_html = self.build_html(input_path, output_path.stem.title(), theme, inline_css=False, **kwargs)
+
+            if 'html' in targets:
+                with self.instrumentation.span('html'):
+                    self.write_html(full_html, targets['html'], theme, **kwargs)
+
+            # 4. Generate PDF
+            if 'pdf' in targets:
+                with self.instrumentation.span('pdf'):
+                    self.engine.generate(full_html, targets['pdf'], self.stylesheets_for(theme, full_html, **kwargs),
+                                         full_fonts=bool(kwargs.get('font_glyphs')))
+        for path in targets.values():
+            print(f"Created: {path}")
+
+        self.record_outputs(input_path, output_path, theme, **kwargs)
+
+    def write_html(self, full_html: str, html_path: Path, theme: str = 'default', **kwargs):
+        """Write a document's themed HTML for browser preview.
+
+        `full_html` is the same document the PDF is rendered from: Mermaid and
+        math are already inline SVG. The theme CSS is inlined, and local images
+        (absolute file: URIs after the image stage) are copied into
+        `<name>_files/` or, with `html_assets='link'`, referenced by relative path.
+        """
+        css = self.themes.get_css(theme, kwargs.get('landscape', False), kwargs.get('header_left') or "")
+        html = full_html.replace('</head>', f'<style>{css}</style>\n</head>', 1)
+        mode = kwargs.get('html_assets', DEFAULT_HTML_ASSETS)
+        assets_dir = html_path.parent / f"{html_path.stem}_files"
+        copied = set()
+        from urllib.request import url2pathname  # pulls in http.client/ssl; keep it off the import path
+
+        def relink(match) -> str:
+            source = Path(url2pathname(unquote(urlparse(html_lib.unescape(match.group(2))).path)))
+            if not source.is_file():
+                return match.group(0)
+            if mode == 'copy':
+                # Named by a hash of the source path: same-named images from different folders do not collide
+                name = hashlib.sha256(str(source).encode('utf-8')).hexdigest()[:16] + source.suffix.lower()
+                target = assets_dir / name
+                st = source.stat()
+                if not target.exists() or target.stat().st_size != st.st_size or target.stat().st_mtime_ns < st.st_mtime_ns:
+                    assets_dir.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(source, target)
+                copied.add(name)
+                href = f"{assets_dir.name}/{quote(name)}"
+            else:
+                try:
+                    href = quote(Path(os.path.relpath(source, html_path.parent)).as_posix())
+                except ValueError:  # Different drive on Windows
+                    href = source.as_uri()
+            return match.group(1) + href + match.group(3)
+
+        html = _FILE_URL_SRC.sub(relink, html)
+        # Drop images a previous build copied but this one no longer references
+        if assets_dir.is_dir():
+            for stale in assets_dir.iterdir():
+                if stale.name not in copied and stale.is_file():
+                    stale.unlink()
+            if not copied and not any(assets_dir.iterdir()):
+                assets_dir.rmdir()
+        html_path.parent.mkdir(parents=True, exist_ok=True)
+        html_path.write_text(html, encoding='utf-8')
+
+    def process_many(self, tasks: List[Tuple[Path, Path]], theme: str = 'default', jobs: int = 1, **kwargs) -> List[Tuple[Path, str]]:
+        """Convert (input, output) pairs, optionally spread across a process pool.
+
+        Each worker process holds its own warm Processor. Returns the list of
+        (input_path, error message) for files that failed, in input order.
+        In 'batch' font mode all tasks share one glyph set (see batch_glyphs).
+        """
+        jobs = resolve_jobs(jobs, len(tasks))
+        failures = []
+        if 'font_glyphs' not in kwargs and kwargs.get('output_format', DEFAULT_OUTPUT_FORMAT) != 'html':
+            kwargs['font_glyphs'] = self.batch_glyphs([md_path for md_path, _ in tasks], theme, **kwargs)
+        if jobs <= 1:
+            self.prefetch_mermaid([md_path for md_path, out_path in tasks
+                                   if not self.is_up_to_date(md_path, out_path, theme, **kwargs)])
+            for md_path, out_path in tasks:
+                try:
+                    self.process(md_path, out_path, theme, **kwargs)
+                except Exception as e:
+                    failures.append((md_path, str(e)))
+            return failures
+
+        # The manifest is owned by this process: skip fresh outputs before
+        # dispatching and record successes as results come back.
+        pending = []
+        for md_path, out_path in tasks:
+            if self.is_up_to_date(md_path, out_path, theme, **kwargs):
+                print(f"Up to date: {out_path}")
+            else:
+                pending.append((md_path, out_path))
+        if not pending:
+            return failures
+
+        # Diagrams land in the shared on-disk cache, so workers only read them
+        self.prefetch_mermaid([md_path for md_path, _ in pending])
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(pending)),
+            initializer=_init_worker,
+            initargs=(self.themes.style_dir, self.worker_options, bool(self.instrumentation.listeners)),
+        ) as pool:
+            futures = [
+                pool.submit(_process_in_worker, md_path, out_path, theme, kwargs)
+                for md_path, out_path in pending
+            ]
+            # Collect in submission order so reporting stays deterministic
+            for (md_path, out_path), future in zip(pending, futures):
+                try:
+                    error, events = future.result()
+                except Exception as e:
+                    error, events = str(e), []
+                # Worker spans reach this Processor's listeners (e.g. --profile)
+                for event in events:
+                    self.instrumentation.emit(event)
+                if error:
+                    failures.append((md_path, error))
+                else:
+                    self.record_outputs(md_path, out_path, theme, **kwargs)
+        return failures
+
+    def batch(self, input_dir: Path, output_dir: Path, pattern: str = "*.md", theme: str = 'default', jobs: int = 1, **kwargs):
         output_dir.mkdir(parents=True, exist_ok=True)
-        files = list(input_dir.glob(pattern))
+        files = sorted(input_dir.glob(pattern))
         print(f"Batch processing {len(files)} files...")
+        tasks = []
         for f in files:
             rel_path = f.relative_to(input_dir)
             out_f = output_dir / rel_path.with_suffix('.pdf')
             out_f.parent.mkdir(parents=True, exist_ok=True)
+            tasks.append((f, out_f))
+
+        start = time.perf_counter()
+        failures = self.process_many(tasks, theme, jobs, **kwargs)
+        for f, error in failures:
+            print(f"Error processing {f}: {error}")
+        elapsed = time.perf_counter() - start
+        print(f"Batch complete: {len(tasks) - len(failures)}/{len(tasks)} succeeded "
+              f"in {elapsed:.1f}s (jobs={resolve_jobs(jobs, len(tasks))})")
+        self.report_cache_stats()
+
+    def merge_documents(self, input_paths: List[Path], output_path: Path, theme: str = 'default', **kwargs) -> List[Tuple[Path, str]]:
+        """Render each file to an in-memory document and write their pages as one PDF.
+
+        Unlike `merge`, every file keeps its own title/header styling, and
+        unlike merging intermediate PDFs nothing is written or re-parsed per
+        file. Files are merged in the given order; failures are skipped and
+        returned as (path, error) pairs.
+        """
+        output_path = merged_output_path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        print(f"Rendering {len(input_paths)} files into {output_path.name}...")
+        self.prefetch_mermaid(input_paths)
+        kwargs.setdefault('font_glyphs', self.batch_glyphs(input_paths, theme, **kwargs))
+        documents = []
+        outline = []
+        page_count = 0
+        failures = []
+        for p in input_paths:
             try:
-                self.process(f, out_f, theme, **kwargs)
+                print(f"Rendering {p.name}...")
+                with self.instrumentation.span('document', file=str(p)):
+                    full_html = self.build_html(p, p.stem.title(), theme, inline_css=False, **kwargs)
+                    with self.instrumentation.span('pdf'):
+                        document = self.engine.render(full_html, self.stylesheets_for(theme, full_html, **kwargs))
             except Exception as e:
-                print(f"Error processing {f}: {e}")
+                failures.append((p, str(e)))
+                continue
+            documents.append(document)
+            outline.append({'group': p.parent.name, 'title': p.stem.title(), 'page': page_count,
+                            'headings': [(level, label, page_count + page)
+                                         for level, label, page in self.engine.heading_index(document)]})
+            page_count += len(document.pages)
+        if not documents:
+            print("Nothing rendered; merged PDF not written.")
+            return failures
+        with self.instrumentation.span('pdf.write', documents=len(documents)):
+            self.engine.write_documents(documents, output_path, full_fonts=bool(kwargs.get('font_glyphs')))
+        if kwargs.get('outline', DEFAULT_MERGE_OUTLINE):
+            with self.instrumentation.span('pdf.outline'):
+                write_merged_outline(output_path, outline)
+        print(f"Merged PDF created: {output_path} ({len(documents)} files)")
+        self.report_cache_stats()
+        return failures
 
-    def merge(self, input_paths: List[Path], output_path: Path, theme: str = 'default', **kwargs):
-        # Resolve output path if it's a directory
-        if output_path.is_dir():
-            output_path = output_path / "merged.pdf"
+    def merge(self, input_paths: List[Path], output_path: Path, theme: str = 'default',
+              chunk_size: int = DEFAULT_MERGE_CHUNK_SIZE, max_memory_mb: int = DEFAULT_MERGE_MAX_MEMORY_MB, **kwargs):
+        """Merge Markdown files into one PDF, laying sections out in bounded chunks.
+
+        Each chunk of up to `chunk_size` files becomes one WeasyPrint layout
+        written to a temporary PDF; the chunk PDFs are then stitched together.
+        When resident memory exceeds `max_memory_mb` after a chunk, the chunk
+        size is halved. A chunk that fails is retried file by file so a single
+        bad section is skipped instead of failing the whole merge.
+
+        The heading bookmarks and page count of every laid-out chunk are kept,
+        so the merged PDF gets a country -> file -> H1 -> H2 outline without
+        re-reading page content (disable with `outline=False`).
+        """
+        output_path = merged_output_path(output_path)
             
         # Ensure parent directory exists
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
         print(f"Merging {len(input_paths)} files into {output_path.name}...")
+        self.prefetch_mermaid(input_paths)
+        # One shared font subset keeps chunk fonts identical, so stitching stores them once
+        kwargs.setdefault('font_glyphs', self.batch_glyphs(input_paths, theme, **kwargs))
+
+        sections = list(enumerate(input_paths))
+        chunk_size = max(1, chunk_size)
+        chunk_pdfs = []
+        failures = []
+        outline = []
+        page_count = 0
+        with tempfile.TemporaryDirectory(prefix=".merge_", dir=output_path.parent) as work_dir:
+            def render(chunk) -> Optional[str]:
+                nonlocal page_count
+                chunk_path = Path(work_dir) / f"chunk_{len(chunk_pdfs):04d}.pdf"
+                try:
+                    entries, pages = self._render_merge_chunk(chunk, chunk_path, theme, **kwargs)
+                except Exception as e:
+                    return str(e)
+                chunk_pdfs.append(chunk_path)
+                for entry in entries:
+                    entry['page'] += page_count
+                    entry['headings'] = [(level, label, page_count + page) for level, label, page in entry['headings']]
+                outline.extend(entries)
+                page_count += pages
+                return None
+
+            while sections:
+                chunk, sections = sections[:chunk_size], sections[chunk_size:]
+                error = render(chunk)
+                if error and len(chunk) > 1:
+                    # Isolate the bad section: retry this chunk one file at a time
+                    print(f"  Chunk failed ({error}); retrying its {len(chunk)} files individually")
+                    for item in chunk:
+                        item_error = render([item])
+                        if item_error:
+                            failures.append((item[1], item_error))
+                            print(f"Error merging {item[1]}: {item_error}")
+                elif error:
+                    failures.append((chunk[0][1], error))
+                    print(f"Error merging {chunk[0][1]}: {error}")
+
+                gc.collect()
+                rss = current_rss_mb()
+                if rss > max_memory_mb and chunk_size > 1:
+                    chunk_size = max(1, chunk_size // 2)
+                    print(f"  RSS {rss:.0f} MB above {max_memory_mb} MB ceiling; chunk size now {chunk_size}")
+
+            if not chunk_pdfs:
+                print("Nothing rendered; merged PDF not written.")
+                return failures
+            if not kwargs.get('outline', DEFAULT_MERGE_OUTLINE):
+                outline = None
+            if len(chunk_pdfs) == 1:
+                os.replace(chunk_pdfs[0], output_path)
+                if outline:
+                    write_merged_outline(output_path, outline)
+            else:
+                stitch_pdfs(chunk_pdfs, output_path, outline)
+
+        print(f"Merged PDF created: {output_path} ({len(chunk_pdfs)} chunks, peak RSS {peak_rss_mb():.0f} MB)")
+        self.report_cache_stats()
+        return failures
+
+    def _render_merge_chunk(self, chunk: List[Tuple[int, Path]], chunk_path: Path, theme: str, **kwargs) -> Tuple[List[Dict], int]:
+        """Lay out a chunk into chunk_path; returns its outline entries (chunk-relative pages) and page count."""
+        # The chunk is laid out as one document, so later stages are attributed to the chunk
+        label = ', '.join(p.name for _, p in chunk)
+        with self.instrumentation.span('chunk', file=f"chunk[{label}]"):
+            document = self._render_chunk_document(chunk, chunk_path, theme, **kwargs)
+
+        # Each file starts on the page holding its <section id="part-N"> anchor
+        starts = {}
+        for index, page in enumerate(document.pages):
+            for anchor in page.anchors:
+                if anchor.startswith('part-'):
+                    starts.setdefault(anchor, index)
+        entries = []
+        for i, p in chunk:
+            entries.append({'group': p.parent.name, 'title': p.stem.title(),
+                            'page': starts.get(f'part-{i}', entries[-1]['page'] if entries else 0), 'headings': []})
+        for level, label, page in self.engine.heading_index(document):
+            owner = [entry for entry in entries if entry['page'] <= page]
+            (owner[-1] if owner else entries[0])['headings'].append((level, label, page))
+        return entries, len(document.pages)
+
+    def _render_chunk_document(self, chunk: List[Tuple[int, Path]], chunk_path: Path, theme: str, **kwargs):
         combined_body = []
-        for i, p in enumerate(input_paths):
+        for i, p in chunk:
             md_text = p.read_text(encoding='utf-8')
-            html_body = self.pipeline.convert(md_text)
-            html_body = self.mermaid.render_all(html_body)
-            # Add section break and page break
-            combined_body.append(f'<section id="part-{i}" style="page-break-after: always;">{html_body}</section>')
+            with self.instrumentation.span('markdown', file=str(p)):
+                html_body = self.pipeline.convert(md_text)
+            # Add section break and page break; images resolve against each section's own folder
+            base_dir = html_lib.escape(str(p.resolve().parent), quote=True)
+            combined_body.append(f'<section id="part-{i}" data-base-dir="{base_dir}" style="page-break-after: always;">{html_body}</section>')
         
-        full_html = self.themes.get_full_html("\n".join(combined_body), "Merged Document", theme, header_left=kwargs.get('header_left', ""))
-        self.engine.generate(full_html, output_path)
-        print(f"Merged PDF created: {output_path}")
+        # One parse of the combined chunk body for all rewriting passes
+        body = self.transformer.transform("\n".join(combined_body), theme, landscape=kwargs.get('landscape', False))
+        if kwargs.get('timings'):
+            print(format_timings(self.transformer.last_timings))
+        full_html = self.themes.get_full_html(body, "Merged Document", theme, kwargs.get('landscape', False),
+                                              header_left=kwargs.get('header_left', ""), process_body=False,
+                                              inline_css=False)
+        with self.instrumentation.span('pdf'):
+            document = self.engine.render(full_html, self.stylesheets_for(theme, full_html, **kwargs))
+            document.write_pdf(str(chunk_path), **({'full_fonts': True} if kwargs.get('font_glyphs') else {}))
+        return document
+
+def current_rss_mb() -> float:
+    """Current resident set size in MB (falls back to the peak where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as handle:
+            resident_pages = int(handle.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (0 where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def stitch_pdfs(input_paths: List[Path], output_path: Path, outline: Optional[List[Dict]] = None):
+    """Concatenate PDFs with the same backends merge.py uses, writing `outline` when given (pikepdf only)."""
+    skill_dir = str(Path(__file__).resolve().parent)
+    if skill_dir not in sys.path:
+        sys.path.insert(0, skill_dir)
+    from merge import select_backend, merge_with_pikepdf, merge_with_pypdf
+
+    backend_name, backend = select_backend()
+    if not backend:
+        raise RuntimeError("No PDF merge backend available. Install pikepdf or pypdf/PyPDF2.")
+    if backend_name == "pikepdf":
+        merge_with_pikepdf(backend, input_paths, output_path, outline=outline or None)
+    else:
+        merge_with_pypdf(backend, input_paths, output_path)
+
+def write_merged_outline(pdf_path: Path, outline: List[Dict]):
+    """Write a country -> file -> heading bookmark tree into a merged PDF (see merge.write_outline)."""
+    skill_dir = str(Path(__file__).resolve().parent)
+    if skill_dir not in sys.path:
+        sys.path.insert(0, skill_dir)
+    from merge import add_outline
+
+    if outline and not add_outline(pdf_path, outline):
+        print("[WARN] pikepdf not installed; merged PDF keeps WeasyPrint's flat bookmarks.")
+
+def format_timings(timings: Dict[str, float]) -> str:
+    parts = [f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items()]
+    return f"  Timings: {', '.join(parts)} (total {sum(timings.values()) * 1000:.1f}ms)"
+
+def resolve_jobs(jobs: Optional[int], task_count: int = 0) -> int:
+    """Normalize a --jobs value: 0 (or negative) means one worker per CPU core."""
+    if jobs is None:
+        jobs = DEFAULT_JOBS
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    if task_count:
+        jobs = min(jobs, task_count)
+    return max(jobs, 1)
+
+# Per-process Processor used by pool workers (created once by _init_worker)
+_WORKER_PROCESSOR: Optional[Processor] = None
+_WORKER_RECORDER: Optional[ProfileRecorder] = None
+
+def _init_worker(style_dir: Path, options: Dict, profile: bool = False):
+    global _WORKER_PROCESSOR, _WORKER_RECORDER
+    _WORKER_PROCESSOR = Processor(style_dir, **options)
+    _WORKER_RECORDER = _WORKER_PROCESSOR.enable_profile() if profile else None
+
+def _process_in_worker(input_path: Path, output_path: Path, theme: str, kwargs: Dict) -> Tuple[Optional[str], List[Dict]]:
+    """Pool task: convert one file with the worker's warm Processor.
+
+    Returns (error message or None, profile events recorded for this file).
+    """
+    error = None
+    try:
+        _WORKER_PROCESSOR.process(input_path, output_path, theme, **kwargs)
+    except Exception as e:
+        error = str(e)
+    events = []
+    if _WORKER_RECORDER is not None:
+        events, _WORKER_RECORDER.events = _WORKER_RECORDER.events, []
+    return error, events
 
 def main():
     parser = argparse.ArgumentParser(description='Advanced Markdown to PDF Converter')
@@ -597,6 +2337,22 @@ def main():
     parser.add_argument('--merge', action='store_true', help='Merge multiple files')
     parser.add_argument('--landscape', action='store_true', help='Use landscape orientation')
     parser.add_argument('--header-left', help=f'Text for the top-left header (default: {DEFAULT_HEADER_LEFT})')
+    parser.add_argument('--no-mermaid-batch', action='store_true', help='Render Mermaid diagrams one mmdc process at a time')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_MERGE_CHUNK_SIZE, help=f'Files laid out per chunk in merge mode (default: {DEFAULT_MERGE_CHUNK_SIZE})')
+    parser.add_argument('--max-memory-mb', type=int, default=DEFAULT_MERGE_MAX_MEMORY_MB, help=f'Memory ceiling for merge mode; chunks shrink above it (default: {DEFAULT_MERGE_MAX_MEMORY_MB})')
+    parser.add_argument('--no-outline', action='store_true', help='Merge mode: skip the country / file / heading bookmark tree')
+    parser.add_argument('--font-subset', choices=FONT_SUBSET_MODES, default=DEFAULT_FONT_SUBSET, help=f"CJK font subsetting: WeasyPrint's own, a cached per-document subset, or one shared subset per batch/merge (default: {DEFAULT_FONT_SUBSET})")
+    parser.add_argument('--image-dpi', type=int, default=DEFAULT_IMAGE_DPI, help=f'Downscale images to this DPI at page content width, 0 = embed originals (default: {DEFAULT_IMAGE_DPI})')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT, help=f'Write PDF, themed HTML for browser preview, or both from one parse (default: {DEFAULT_OUTPUT_FORMAT})')
+    parser.add_argument('--html-assets', choices=HTML_ASSET_MODES, default=DEFAULT_HTML_ASSETS, help=f'HTML output: copy local images next to the page or link them by relative path (default: {DEFAULT_HTML_ASSETS})')
+    parser.add_argument('--allow-remote', action='store_true', help='Let WeasyPrint fetch http(s) images and stylesheets (off by default so builds work offline)')
+    parser.add_argument('--mirror-dir', help='Serve http(s) resources from <dir>/<host>/<path> instead of the network')
+    parser.add_argument('--timings', action='store_true', help='Print per-pass HTML transform timings')
+    parser.add_argument('--force', action='store_true', help='Rebuild batch outputs even if the build manifest says they are up to date')
+    parser.add_argument('-j', '--jobs', type=int, help=f'Parallel worker processes for batch mode, 0 = all CPU cores (default: {DEFAULT_JOBS})')
+    parser.add_argument('--watch', action='store_true', help='Keep running and reconvert inputs whenever Markdown or styles change')
+    parser.add_argument('--profile', help='Write per-stage timings, memory and cache hits of each run to this file')
+    parser.add_argument('--profile-format', choices=['json', 'chrome'], default='json', help='Profile as a JSON report or a Chrome trace (chrome://tracing, Perfetto)')
     
     args = parser.parse_args()
     
@@ -612,15 +2368,84 @@ def main():
         parser.error("错误: 未指定输出路径！请使用 -o 参数或在脚本中设置 DEFAULT_OUTPUT。")
     
     skill_dir = Path(__file__).parent
-    processor = Processor(skill_dir / 'styles')
+    manifest = BuildManifest(manifest_path_for(Path(final_output))) if args.batch else None
+    processor = Processor(skill_dir / 'styles', manifest=manifest,
+                          mermaid_batch=DEFAULT_MERMAID_BATCH and not args.no_mermaid_batch,
+                          font_subset=args.font_subset, image_dpi=args.image_dpi,
+                          allow_remote=DEFAULT_ALLOW_REMOTE or args.allow_remote,
+                          mirror_dir=args.mirror_dir or DEFAULT_MIRROR_DIR)
     
+    options = dict(landscape=final_landscape, header_left=args.header_left, timings=args.timings,
+                   output_format=args.format, html_assets=args.html_assets)
+    style_dir = skill_dir / 'styles'
+
     if args.merge:
+        if args.format != 'pdf':
+            print("[WARN] --format applies to single-file and batch conversion; merge mode writes a PDF only.")
         inputs = [Path(p) for p in final_input]
-        processor.merge(inputs, Path(final_output), final_style, landscape=final_landscape, header_left=args.header_left)
+        watch_roots = inputs + [style_dir]
+
+        def build(changed=None):
+            processor.merge(inputs, Path(final_output), final_style, chunk_size=args.chunk_size,
+                            max_memory_mb=args.max_memory_mb, outline=not args.no_outline, **options)
     elif args.batch:
-        processor.batch(Path(final_input[0]), Path(final_output), theme=final_style, landscape=final_landscape, header_left=args.header_left)
+        input_dir = Path(final_input[0])
+        output_dir = Path(final_output)
+        watch_roots = [input_dir, style_dir]
+        last_glyphs = {}
+
+        def build(changed=None):
+            # In 'batch' font mode every file embeds the glyph set of the whole directory,
+            # so it is recomputed over all sources, never just the changed ones
+            glyphs = None
+            if args.format != 'html':
+                glyphs = processor.batch_glyphs(sorted(input_dir.glob('*.md')), final_style, **options)
+            glyphs_changed = last_glyphs.get('glyphs', glyphs) != glyphs
+            last_glyphs['glyphs'] = glyphs
+            # A style or image change, a new glyph (or the first run) goes through the full
+            # batch; the manifest still skips anything whose fingerprint did not change.
+            if changed is None or glyphs_changed or any(p.suffix != '.md' for p in changed):
+                processor.batch(input_dir, output_dir, theme=final_style, jobs=args.jobs,
+                                force=args.force and changed is None, **options)
+                return
+            sources = [p for p in sorted(changed) if p.suffix == '.md' and p.parent == input_dir.resolve()]
+            # Deleted sources take their outputs and manifest entries with them
+            for md_path in sources:
+                if md_path.exists():
+                    continue
+                for stale in output_targets(output_dir / md_path.with_suffix('.pdf').name, args.format).values():
+                    manifest.forget(stale)
+                    if stale.exists():
+                        stale.unlink()
+                        print(f"Removed {stale} (source deleted)")
+                    # Images copied next to an HTML output (--html-assets copy)
+                    shutil.rmtree(stale.parent / f"{stale.stem}_files", ignore_errors=True)
+            tasks = [(p, output_dir / p.with_suffix('.pdf').name) for p in sources if p.exists()]
+            for md_path, error in processor.process_many(tasks, final_style, font_glyphs=glyphs, **options):
+                print(f"Error processing {md_path}: {error}")
     else:
-        processor.process(Path(final_input[0]), Path(final_output), final_style, landscape=final_landscape, header_left=args.header_left)
+        input_file = Path(final_input[0])
+        watch_roots = [input_file, style_dir] + processor.image_dependencies(input_file)
+
+        def build(changed=None):
+            processor.process(input_file, Path(final_output), final_style, **options)
+
+    if args.profile:
+        recorder = processor.enable_profile()
+        run_build = build
+
+        def build(changed=None):
+            # One profile per run; in watch mode each rebuild replaces the previous one
+            recorder.clear()
+            try:
+                run_build(changed)
+            finally:
+                recorder.write(Path(args.profile), args.profile_format)
+
+    build()
+    if args.watch:
+        from watch import watch_loop
+        watch_loop(watch_roots, build)
 
 if __name__ == "__main__":
     main()
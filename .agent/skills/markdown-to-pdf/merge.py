@@ -4,9 +4,15 @@ Merge PDF files in a directory into a single PDF.
 """
 
 import argparse
+import hashlib
+import json
+import os
 import sys
+import tempfile
+from contextlib import ExitStack
+from decimal import Decimal
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 SKILL_DIR = Path(__file__).resolve().parent
 
@@ -20,6 +26,19 @@ DEFAULT_SORT_ORDER = "desc"  # Default to descending order     choices=["asc", "
 
 DEFAULT_RECURSIVE = True
 
+DEFAULT_OUTLINE = True  # Bookmark tree: country -> file -> H1 -> H2 (pikepdf backend)
+DEFAULT_OUTLINE_DEPTH = 2  # Heading levels kept under each file (1 = H1 only)
+
+DEFAULT_INCREMENTAL = True  # Splice only changed inputs into the previous merged PDF (pikepdf backend)
+DEFAULT_DEDUPE = True  # Share byte-identical fonts, images and other streams across inputs (pikepdf backend)
+
+# Dictionaries that may be shared between pages once their contents match;
+# pages, annotations and outline items must stay distinct objects
+DEDUPE_TYPES = {"/Font", "/FontDescriptor", "/ExtGState", "/XObject", "/Pattern", "/Shading", "/Encoding"}
+
+# Bump when the page map layout changes; an older map then triggers a full merge
+PAGE_MAP_VERSION = "1"
+
 
 
 
@@ -43,14 +62,18 @@ def select_backend() -> Tuple[Optional[str], Optional[object]]:
         return None, None
 
 
+def sort_for_merge(paths: List[Path], sort_order: str = "desc", key: Optional[Callable[[Path], object]] = None) -> List[Path]:
+    is_reverse = (sort_order.lower() == "desc")
+    return sorted(paths, key=key, reverse=is_reverse)
+
+
 def collect_pdf_files(input_dir: Path, pattern: str, recursive: bool, sort_order: str = "desc") -> List[Path]:
     if recursive:
         candidates = input_dir.rglob(pattern)
     else:
         candidates = input_dir.glob(pattern)
     
-    is_reverse = (sort_order.lower() == "desc")
-    return sorted([p for p in candidates if p.is_file()], reverse=is_reverse)
+    return sort_for_merge([p for p in candidates if p.is_file()], sort_order)
 
 
 def resolve_output_path(output_arg: Optional[str]) -> Path:
@@ -60,13 +83,315 @@ def resolve_output_path(output_arg: Optional[str]) -> Path:
     return output_path
 
 
-def merge_with_pikepdf(pikepdf_module: object, input_paths: List[Path], output_path: Path) -> None:
+def outline_group(path: Path, input_dir: Path) -> str:
+    """Top-level bookmark for a file: its first sub-directory (the country), else the input directory."""
+    rel = path.relative_to(input_dir)
+    return rel.parts[0] if len(rel.parts) > 1 else input_dir.resolve().name
+
+
+def read_headings(src: object, depth: int = DEFAULT_OUTLINE_DEPTH) -> List[Tuple[int, str, int]]:
+    """(level, title, page index) of a PDF's own bookmarks, down to `depth` levels.
+
+    WeasyPrint writes H1/H2... bookmarks while converting, so this is the
+    heading index of each intermediate PDF; only the outline is read.
+    """
+    page_numbers = {page.objgen: index for index, page in enumerate(src.pages)}
+    headings = []
+
+    def walk(items, level):
+        for item in items:
+            destination = item.destination
+            if level <= depth and destination is not None and not isinstance(destination, str):
+                try:
+                    page = page_numbers.get(destination[0].objgen)
+                except (IndexError, TypeError, AttributeError, ValueError):
+                    page = None
+                if page is not None:
+                    headings.append((level, str(item.title), page))
+            if level < depth:
+                walk(item.children, level + 1)
+
+    with src.open_outline() as outline:
+        walk(outline.root, 1)
+    return headings
+
+
+def write_outline(pikepdf_module: object, pdf: object, entries: List[Dict]) -> None:
+    """Replace the outline of `pdf` with a group -> file -> heading tree.
+
+    Each entry describes one merged file: {'group', 'title', 'page', 'headings'},
+    with page numbers counted from the start of the merged PDF and headings
+    as (level, title, page) tuples.
+    """
+    OutlineItem = pikepdf_module.OutlineItem
+    with pdf.open_outline() as outline:
+        outline.root.clear()
+        group_item = None
+        group_name = None
+        for entry in entries:
+            if group_item is None or entry.get('group') != group_name:
+                group_name = entry.get('group')
+                group_item = OutlineItem(group_name or entry['title'], entry['page'])
+                outline.root.append(group_item)
+            file_item = OutlineItem(entry['title'], entry['page'])
+            group_item.children.append(file_item)
+            # Nearest open item above each heading level; level 0 is the file itself
+            parents = {0: file_item}
+            for level, title, page in entry.get('headings', []):
+                item = OutlineItem(title, page)
+                parents[max(open_level for open_level in parents if open_level < level)].children.append(item)
+                parents = {open_level: node for open_level, node in parents.items() if open_level < level}
+                parents[level] = item
+
+
+def _is_number_array(pikepdf_module: object, array: object) -> bool:
+    return all(isinstance(item, (int, float, Decimal)) or (
+        isinstance(item, pikepdf_module.Array) and not item.is_indirect and _is_number_array(pikepdf_module, item))
+        for item in array)
+
+
+def _dedupe_key(pikepdf_module: object, obj: object) -> Optional[bytes]:
+    """Content key of a shareable indirect object, None for objects that must stay distinct."""
+    if isinstance(obj, pikepdf_module.Stream):
+        # Compressed bytes as stored; /Length is managed by qpdf and not part of the unparsed dict
+        return b"S" + obj.stream_dict.unparse(resolved=True) + b"\0" + obj.read_raw_bytes()
+    if isinstance(obj, pikepdf_module.Dictionary):
+        if str(obj.get("/Type", "")) in DEDUPE_TYPES:
+            return b"D" + obj.unparse(resolved=True)
+        return None
+    if isinstance(obj, pikepdf_module.Array):
+        # Plain number arrays (glyph widths, matrices) cannot carry document structure
+        if _is_number_array(pikepdf_module, obj):
+            return b"A" + obj.unparse(resolved=True)
+    return None
+
+
+def _retarget(pikepdf_module: object, container: object, duplicates: Dict[Tuple[int, int], object]) -> None:
+    """Point references inside container (and its direct children) at the kept copies."""
+    if isinstance(container, pikepdf_module.Stream):
+        container = container.stream_dict
+    if isinstance(container, pikepdf_module.Dictionary):
+        items = [(key, container[key]) for key in container.keys()]
+    elif isinstance(container, pikepdf_module.Array):
+        items = list(enumerate(container))
+    else:
+        return
+    for key, value in items:
+        if not isinstance(value, (pikepdf_module.Dictionary, pikepdf_module.Array, pikepdf_module.Stream)):
+            continue
+        if value.is_indirect:
+            if value.objgen in duplicates:
+                container[key] = duplicates[value.objgen]
+        else:
+            _retarget(pikepdf_module, value, duplicates)
+
+
+def dedupe_objects(pikepdf_module: object, pdf: object) -> Dict[str, int]:
+    """Share byte-identical streams and resource dictionaries across the pages of `pdf`.
+
+    Every intermediate PDF embeds its own copy of each font program, image
+    and ICC profile. Identical streams are found by hashing their stored
+    bytes; references are then pointed at one copy, which in turn makes the
+    font dictionaries above them identical, so passes repeat until nothing
+    new matches. Unreferenced copies are dropped when the PDF is saved.
+    Returns the number of shared objects and the stream bytes no longer written.
+    """
+    stats = {"objects": 0, "bytes_saved": 0}
+    container_types = (pikepdf_module.Dictionary, pikepdf_module.Array, pikepdf_module.Stream)
+    # Replaced copies stay in the object table until save, so they are skipped explicitly
+    dropped = set()
+    while True:
+        containers = [obj for obj in pdf.objects if isinstance(obj, container_types) and obj.objgen not in dropped]
+        kept: Dict[bytes, object] = {}
+        duplicates: Dict[Tuple[int, int], object] = {}
+        for obj in containers:
+            key = _dedupe_key(pikepdf_module, obj)
+            if key is None:
+                continue
+            digest = hashlib.sha256(key).digest()
+            if digest in kept:
+                duplicates[obj.objgen] = kept[digest]
+                if isinstance(obj, pikepdf_module.Stream):
+                    stats["bytes_saved"] += len(obj.read_raw_bytes())
+            else:
+                kept[digest] = obj
+        if not duplicates:
+            return stats
+        stats["objects"] += len(duplicates)
+        dropped.update(duplicates)
+        for obj in containers:
+            if obj.objgen not in duplicates:
+                _retarget(pikepdf_module, obj, duplicates)
+
+
+def merge_with_pikepdf(pikepdf_module: object, input_paths: List[Path], output_path: Path,
+                       groups: Optional[List[str]] = None, outline: Optional[List[Dict]] = None,
+                       dedupe: bool = DEFAULT_DEDUPE) -> Dict[str, int]:
+    """Concatenate PDFs; with `groups` (one per input) build a bookmark tree from the inputs' own outlines,
+    or write a prepared `outline` (see write_outline). Returns dedupe_objects' counts ({} when off)."""
     pdf = pikepdf_module.Pdf.new()
-    for path in input_paths:
+    entries = []
+    for index, path in enumerate(input_paths):
         with pikepdf_module.open(path) as src:
+            if groups is not None:
+                title = str(src.docinfo.get('/Title', '')) or path.stem
+                entries.append({'group': groups[index], 'title': title, 'page': len(pdf.pages),
+                                'headings': [(level, label, len(pdf.pages) + page)
+                                             for level, label, page in read_headings(src)]})
             pdf.pages.extend(src.pages)
+    if outline is not None:
+        entries = outline
+    if entries:
+        write_outline(pikepdf_module, pdf, entries)
+    shared = dedupe_objects(pikepdf_module, pdf) if dedupe else {}
     output_path.parent.mkdir(parents=True, exist_ok=True)
     pdf.save(output_path)
+    return shared
+
+
+def add_outline(pdf_path: Path, entries: List[Dict]) -> bool:
+    """Write a bookmark tree into an existing PDF in place; False when pikepdf is unavailable."""
+    backend_name, backend = select_backend()
+    if backend_name != "pikepdf":
+        return False
+    with backend.open(pdf_path, allow_overwriting_input=True) as pdf:
+        write_outline(backend, pdf, entries)
+        pdf.save(pdf_path)
+    return True
+
+
+def page_map_path_for(output_path: Path) -> Path:
+    """Location of the page map kept next to a merged PDF."""
+    return output_path.with_name(f"{output_path.stem}.pagemap.json")
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_page_map(output_path: Path, outline: bool) -> List[Dict]:
+    """Source entries of the previous merge, or [] when the merged PDF cannot be spliced.
+
+    The map is only trusted while the merged PDF is exactly the file it
+    describes (same size and mtime) and was built with the same outline setting.
+    """
+    map_path = page_map_path_for(output_path)
+    if not output_path.exists() or not map_path.exists():
+        return []
+    try:
+        page_map = json.loads(map_path.read_text(encoding="utf-8"))
+    except (ValueError, OSError) as exc:
+        print(f"[WARN] Ignoring unreadable page map {map_path}: {exc}")
+        return []
+    stat = output_path.stat()
+    if (page_map.get("version") != PAGE_MAP_VERSION or page_map.get("outline") != outline
+            or page_map.get("size") != stat.st_size or page_map.get("mtime_ns") != stat.st_mtime_ns):
+        return []
+    return page_map.get("sources", [])
+
+
+def save_page_map(output_path: Path, sources: List[Dict], outline: bool) -> None:
+    """Record which pages of the merged PDF came from which input (written atomically)."""
+    map_path = page_map_path_for(output_path)
+    stat = output_path.stat()
+    payload = json.dumps({"version": PAGE_MAP_VERSION, "outline": outline, "size": stat.st_size,
+                          "mtime_ns": stat.st_mtime_ns, "sources": sources}, indent=1, ensure_ascii=False)
+    fd, tmp_name = tempfile.mkstemp(dir=map_path.parent, prefix=map_path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(payload)
+        os.replace(tmp_name, map_path)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def merge_incremental(pikepdf_module: object, input_paths: List[Path], output_path: Path,
+                      groups: Optional[List[str]] = None, dedupe: bool = DEFAULT_DEDUPE) -> Dict[str, int]:
+    """Update output_path in place, replacing only the page ranges of inputs whose hash changed.
+
+    A page map next to the merged PDF records each input's path, sha256,
+    first page, page count and outline entry. Unchanged inputs are never
+    reopened: their pages stay in the merged PDF as they are, and their
+    bookmarks are rebuilt from the map. Without a usable map (first run,
+    reordered inputs, merged PDF edited elsewhere) every input is spliced
+    into an empty PDF, which is a full merge that also writes the map. When
+    nothing changed the merged PDF is left untouched.
+    With `dedupe` only a full merge (no usable map) shares identical fonts
+    and images (see dedupe_objects): hashing every object on each splice
+    would make one changed input cost as much as the whole book, so spliced
+    pages keep their own copies until the next `--full` merge. Returns counts of reused /
+    replaced / added / removed inputs, pages copied and shared objects / bytes.
+    """
+    outline = groups is not None
+    paths = [str(p.resolve()) for p in input_paths]
+    digests = [file_digest(p) for p in input_paths]
+    previous = load_page_map(output_path, outline)
+    if [(entry["path"], entry["sha256"]) for entry in previous] == list(zip(paths, digests)):
+        return {"reused": len(paths), "replaced": 0, "added": 0, "removed": 0, "pages_copied": 0,
+                "objects": 0, "bytes_saved": 0}
+
+    # Kept inputs must keep their relative order, otherwise ranges cannot be spliced
+    kept = [entry["path"] for entry in previous if entry["path"] in paths]
+    if kept != [path for path in paths if path in set(kept)]:
+        previous = []
+    unchanged = {entry["path"] for entry in previous
+                 if entry["path"] in paths and entry["sha256"] == digests[paths.index(entry["path"])]}
+    stats = {"reused": len(unchanged), "replaced": 0, "added": 0, "removed": 0, "pages_copied": 0,
+             "objects": 0, "bytes_saved": 0}
+
+    with ExitStack() as stack:
+        if previous:
+            pdf = stack.enter_context(pikepdf_module.open(output_path, allow_overwriting_input=True))
+        else:
+            pdf = stack.enter_context(pikepdf_module.Pdf.new())
+        # Drop stale ranges back to front so earlier start pages stay valid
+        for entry in sorted(previous, key=lambda e: e["start"], reverse=True):
+            if entry["path"] not in unchanged:
+                del pdf.pages[entry["start"]:entry["start"] + entry["pages"]]
+                stats["replaced" if entry["path"] in paths else "removed"] += 1
+
+        reused = {entry["path"]: entry for entry in previous if entry["path"] in unchanged}
+        sources = []
+        cursor = 0
+        for index, (path, digest) in enumerate(zip(paths, digests)):
+            if path in reused:
+                entry = dict(reused[path])
+                shift = cursor - entry["start"]
+                entry["headings"] = [[level, title, page + shift] for level, title, page in entry.get("headings", [])]
+            else:
+                src = stack.enter_context(pikepdf_module.open(input_paths[index]))
+                for offset, page in enumerate(src.pages):
+                    pdf.pages.insert(cursor + offset, page)
+                stats["pages_copied"] += len(src.pages)
+                entry = {"path": path, "sha256": digest, "pages": len(src.pages), "headings": []}
+                if outline:
+                    entry["title"] = str(src.docinfo.get("/Title", "")) or input_paths[index].stem
+                    entry["headings"] = [[level, title, cursor + page] for level, title, page in read_headings(src)]
+            entry["start"] = cursor
+            entry["group"] = groups[index] if outline else None
+            sources.append(entry)
+            cursor += entry["pages"]
+        stats["added"] = len(paths) - len(unchanged) - stats["replaced"]
+
+        if outline:
+            write_outline(pikepdf_module, pdf, [
+                {"group": entry["group"], "title": entry["title"], "page": entry["start"],
+                 "headings": [tuple(heading) for heading in entry["headings"]]}
+                for entry in sources
+            ])
+        if dedupe and not previous:
+            stats.update(dedupe_objects(pikepdf_module, pdf))
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        pdf.save(output_path)
+
+    save_page_map(output_path, sources, outline)
+    return stats
 
 
 def merge_with_pypdf(merger_cls: object, input_paths: List[Path], output_path: Path) -> None:
@@ -79,6 +404,58 @@ def merge_with_pypdf(merger_cls: object, input_paths: List[Path], output_path: P
     merger.close()
 
 
+def merge_directory(
+    input_dir: Path,
+    output_path: Path,
+    pattern: str = DEFAULT_PATTERN,
+    recursive: bool = DEFAULT_RECURSIVE,
+    sort_order: str = DEFAULT_SORT_ORDER,
+    outline: bool = DEFAULT_OUTLINE,
+    incremental: bool = DEFAULT_INCREMENTAL,
+    dedupe: bool = DEFAULT_DEDUPE,
+) -> List[Path]:
+    """Merge the PDFs under input_dir into output_path, in process.
+
+    With `outline` (pikepdf backend) the result gets a bookmark tree of
+    country (first sub-directory) -> file -> H1 -> H2, built from each input's
+    own bookmarks and page count. With `incremental` (pikepdf backend) only
+    inputs whose hash changed since the last merge are spliced in (see
+    merge_incremental). With `dedupe` (pikepdf backend) identical fonts,
+    images and other streams are stored once (see dedupe_objects). Returns
+    the merged input files in merge order (empty if there was nothing to merge).
+    """
+    backend_name, backend = select_backend()
+    if not backend:
+        raise RuntimeError("No PDF merge backend available. Install pikepdf or pypdf/PyPDF2.")
+
+    pdf_files = collect_pdf_files(input_dir, pattern, recursive, sort_order)
+    output_resolved = output_path.resolve()
+    pdf_files = [p for p in pdf_files if p.resolve() != output_resolved]
+
+    if not pdf_files:
+        print(f"No PDF files found in {input_dir} (pattern: {pattern}).")
+        return []
+
+    groups = [outline_group(p, input_dir) for p in pdf_files] if outline else None
+    shared: Dict[str, int] = {}
+    if backend_name == "pikepdf" and incremental:
+        stats = merge_incremental(backend, pdf_files, output_path, groups=groups, dedupe=dedupe)
+        shared = stats
+        if stats["reused"]:
+            print(f"Updated {output_path}: {stats['replaced']} replaced, {stats['added']} added, "
+                  f"{stats['removed']} removed, {stats['reused']} unchanged ({stats['pages_copied']} pages copied)")
+    elif backend_name == "pikepdf":
+        shared = merge_with_pikepdf(backend, pdf_files, output_path, groups=groups, dedupe=dedupe)
+    else:
+        merge_with_pypdf(backend, pdf_files, output_path)
+
+    if not shared.get("reused"):
+        print(f"Merged {len(pdf_files)} PDFs into {output_path}")
+    if shared.get("objects"):
+        print(f"Shared {shared['objects']} duplicate objects ({shared['bytes_saved'] / 1024:.0f} KB of streams saved)")
+    return pdf_files
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Merge PDF files in a directory into one PDF."
@@ -111,6 +488,21 @@ def main() -> None:
         "--header-left",
         help="Text for the top-left header",
     )
+    parser.add_argument(
+        "--no-outline",
+        action="store_true",
+        help="Do not build the country / file / heading bookmark tree",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild the merged PDF from every input instead of splicing changed ones",
+    )
+    parser.add_argument(
+        "--no-dedupe",
+        action="store_true",
+        help="Keep every input's own copy of fonts, images and other streams",
+    )
 
     args = parser.parse_args()
 
@@ -123,26 +515,15 @@ def main() -> None:
     if not final_input_dir.exists() or not final_input_dir.is_dir():
         parser.error(f"Input directory not found: {final_input_dir}")
 
-    backend_name, backend = select_backend()
-    if not backend:
-        print("No PDF merge backend available. Install pikepdf or pypdf/PyPDF2.")
+    try:
+        merge_directory(final_input_dir, final_output_path, final_pattern, final_recursive, final_sort_order,
+                        outline=DEFAULT_OUTLINE and not args.no_outline,
+                        incremental=DEFAULT_INCREMENTAL and not args.full,
+                        dedupe=DEFAULT_DEDUPE and not args.no_dedupe)
+    except RuntimeError as exc:
+        print(exc)
         sys.exit(1)
 
-    pdf_files = collect_pdf_files(final_input_dir, final_pattern, final_recursive, final_sort_order)
-    output_resolved = final_output_path.resolve()
-    pdf_files = [p for p in pdf_files if p.resolve() != output_resolved]
-
-    if not pdf_files:
-        print(f"No PDF files found in {final_input_dir} (pattern: {final_pattern}).")
-        return
-
-    if backend_name == "pikepdf":
-        merge_with_pikepdf(backend, pdf_files, final_output_path)
-    else:
-        merge_with_pypdf(backend, pdf_files, final_output_path)
-
-    print(f"Merged {len(pdf_files)} PDFs into {final_output_path}")
-
 
 if __name__ == "__main__":
     main()
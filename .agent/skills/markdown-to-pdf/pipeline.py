@@ -4,11 +4,17 @@ Run batch Markdown conversion, optional merge, and optional cleanup.
 """
 
 import argparse
-import subprocess
 import sys
 from pathlib import Path
+from typing import Optional
 
 SKILL_DIR = Path(__file__).resolve().parent
+if str(SKILL_DIR) not in sys.path:
+    sys.path.insert(0, str(SKILL_DIR))
+
+from batch_process import DEFAULT_PATTERN, DEFAULT_RECURSIVE, batch_convert, collect_markdown_files  # noqa: E402
+from converter import DEFAULT_LANDSCAPE, DEFAULT_STYLE, Processor  # noqa: E402
+from merge import merge_directory, sort_for_merge  # noqa: E402
 
 DEFAULT_INPUT_DIR = "/Users/originrock/dev/WorldTravel/destinations/New_Zealand"
 DEFAULT_INTERMEDIATE_DIR = "/Users/originrock/dev/WorldTravel/pdf/intermediate/New_Zealand"  # User can set this in the script
@@ -20,36 +26,32 @@ DEFAULT_SORT_ORDER = "desc"  # Default to descending order         choices=["asc
 DEFAULT_AUTO_MERGE = True
 DEFAULT_AUTO_DELETE = False
 
+# "pdf": write intermediate PDFs, then merge them; "memory": render every file
+# in memory and write only the merged PDF (no intermediate files)
+DEFAULT_MERGE_MODE = "pdf"
 
 
-def run_batch(input_dir: Path, output_dir: Path, header_left: str = "") -> None:
-    cmd = [
-        sys.executable,
-        str(SKILL_DIR / "batch_process.py"),
-        "-i",
-        str(input_dir),
-        "--intermediate-dir",
-        str(output_dir),
-    ]
-    if header_left:
-        cmd.extend(["--header-left", header_left])
-    subprocess.run(cmd, check=True)
+
+def run_batch(
+    input_dir: Path,
+    output_dir: Path,
+    header_left: str = "",
+    jobs: Optional[int] = None,
+    force: bool = False,
+    processor: Optional[Processor] = None,
+) -> None:
+    batch_convert(
+        input_dir,
+        output_dir,
+        processor=processor,
+        header_left=header_left,
+        jobs=jobs,
+        force=force,
+    )
 
 
 def run_merge(output_dir: Path, merged_path: Path, sort_order: str = "desc", header_left: str = "") -> None:
-    cmd = [
-        sys.executable,
-        str(SKILL_DIR / "merge.py"),
-        "-i",
-        str(output_dir),
-        "-o",
-        str(merged_path),
-        "--sort-order",
-        sort_order,
-    ]
-    if header_left:
-        cmd.extend(["--header-left", header_left])
-    subprocess.run(cmd, check=True)
+    merge_directory(output_dir, merged_path, sort_order=sort_order)
 
 
 def delete_intermediate_pdfs(output_dir: Path, merged_path: Path) -> int:
@@ -71,6 +73,127 @@ def resolve_flag(default_value: bool, enable_flag: bool, disable_flag: bool) ->
     return default_value
 
 
+def run_memory_merge(
+    input_dir: Path,
+    merged_path: Path,
+    processor: Processor,
+    sort_order: str = DEFAULT_SORT_ORDER,
+    header_left: Optional[str] = None,
+) -> None:
+    """Render Markdown straight into the merged PDF, ordered like merging the intermediate PDFs."""
+    markdown_files = collect_markdown_files(input_dir, DEFAULT_PATTERN, DEFAULT_RECURSIVE)
+    # Same order merge.py would give the PDFs batch_convert writes for these files
+    ordered = sort_for_merge(markdown_files, sort_order, key=lambda p: p.relative_to(input_dir).with_suffix(".pdf"))
+    if not ordered:
+        print(f"No Markdown files found in {input_dir} (pattern: {DEFAULT_PATTERN}).")
+        return
+    failures = processor.merge_documents(
+        ordered,
+        merged_path,
+        theme=DEFAULT_STYLE,
+        landscape=DEFAULT_LANDSCAPE,
+        header_left=header_left,
+    )
+    for md_path, error in failures:
+        print(f"[ERROR] Failed to convert {md_path}: {error}")
+    print(f"Rendered {len(ordered) - len(failures)}/{len(ordered)} files into {merged_path}")
+
+
+def resolve_merged_path(output_dir: Path) -> Path:
+    if DEFAULT_MERGED_NAME.startswith("/") or DEFAULT_MERGED_NAME.startswith("./"):
+        merged_path = Path(DEFAULT_MERGED_NAME)
+    else:
+        merged_path = output_dir / DEFAULT_MERGED_NAME
+
+    if merged_path.suffix.lower() != ".pdf":
+        merged_path = merged_path.with_suffix(".pdf")
+    return merged_path
+
+
+def move_pdfs_to_output(intermediate_dir: Path, output_dir: Path) -> None:
+    print(f"Moving PDFs from {intermediate_dir} to {output_dir}...")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for pdf_path in intermediate_dir.rglob("*.pdf"):
+        rel = pdf_path.relative_to(intermediate_dir)
+        dest = output_dir / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        pdf_path.replace(dest)
+
+    # Clean up
+    try:
+        # Simple cleanup of emptied dirs
+        for d in sorted(intermediate_dir.rglob("*"), key=lambda x: len(str(x)), reverse=True):
+            if d.is_dir() and not any(d.iterdir()):
+                d.rmdir()
+        if not any(intermediate_dir.iterdir()):
+            intermediate_dir.rmdir()
+    except Exception:
+        pass
+
+
+def run_pipeline(
+    input_dir: Path,
+    intermediate_dir: Path,
+    output_dir: Path,
+    processor: Optional[Processor] = None,
+    auto_merge: bool = DEFAULT_AUTO_MERGE,
+    auto_delete: bool = DEFAULT_AUTO_DELETE,
+    sort_order: str = DEFAULT_SORT_ORDER,
+    header_left: Optional[str] = None,
+    jobs: Optional[int] = None,
+    force: bool = False,
+    move_unmerged: bool = False,
+    merge_mode: str = DEFAULT_MERGE_MODE,
+) -> Optional[Path]:
+    """Batch convert, then merge, then clean up, all in this process.
+
+    One Processor (created if not given) serves the whole run, so its caches
+    stay warm and callers can embed the pipeline without spawning processes.
+    Returns the merged PDF path, or None when merging is disabled.
+    When `move_unmerged` is set and merging is off, the PDFs are moved from
+    intermediate_dir into output_dir. With merge_mode "memory" the batch and
+    merge phases collapse into one render pass and intermediate_dir is unused.
+    """
+    if processor is None:
+        processor = Processor(SKILL_DIR / "styles")
+
+    if auto_merge and merge_mode == "memory":
+        merged_path = resolve_merged_path(output_dir)
+        print(f"Rendering Markdown directly into {merged_path} (no intermediate PDFs)...")
+        run_memory_merge(input_dir, merged_path, processor, sort_order, header_left=header_left)
+        return merged_path
+
+    # Step 1: Batch convert to intermediate directory
+    print(f"Phase 1: Converting Markdown to PDFs in {intermediate_dir}...")
+    run_batch(input_dir, intermediate_dir, header_left=header_left, jobs=jobs, force=force, processor=processor)
+
+    # Step 2: Merge if requested
+    if not auto_merge:
+        if move_unmerged:
+            move_pdfs_to_output(intermediate_dir, output_dir)
+        if auto_delete:
+            print("[WARN] auto-delete ignored because auto-merge is disabled.")
+        return None
+
+    merged_path = resolve_merged_path(output_dir)
+    print(f"Phase 2: Merging PDFs into {merged_path}...")
+    run_merge(intermediate_dir, merged_path, sort_order, header_left=header_left)
+
+    # Step 3: Cleanup if requested
+    if auto_delete:
+        deleted = delete_intermediate_pdfs(intermediate_dir, merged_path)
+        print(f"Phase 3: Deleted {deleted} intermediate PDFs from {intermediate_dir}")
+
+        # Clean up intermediate dir if empty
+        try:
+            if not any(intermediate_dir.iterdir()):
+                intermediate_dir.rmdir()
+                print(f"Cleaned up empty intermediate directory: {intermediate_dir}")
+        except Exception:
+            pass
+    return merged_path
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Batch convert Markdown and optionally merge/cleanup PDFs."
@@ -118,6 +241,37 @@ def main() -> None:
         "--header-left",
         help="Text for the top-left header",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Parallel worker processes for the batch phase, 0 = all CPU cores",
+    )
+    parser.add_argument(
+        "--merge-mode",
+        choices=["pdf", "memory"],
+        help=f"pdf: merge intermediate PDFs; memory: render straight into the merged PDF (default in script: {DEFAULT_MERGE_MODE})",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running; reconvert changed Markdown/styles and refresh the merged PDF",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every intermediate PDF, ignoring the build manifest",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Write per-stage timings, memory and cache hits of each run to this file",
+    )
+    parser.add_argument(
+        "--profile-format",
+        choices=["json", "chrome"],
+        default="json",
+        help="Profile as a JSON report or a Chrome trace (default: json)",
+    )
 
     args = parser.parse_args()
 
@@ -147,63 +301,57 @@ def main() -> None:
     if not final_input_dir.exists() or not final_input_dir.is_dir():
         parser.error(f"Input directory not found: {final_input_dir}")
 
-    # Step 1: Batch convert to intermediate directory
-    print(f"Phase 1: Converting Markdown to PDFs in {intermediate_dir}...")
-    run_batch(final_input_dir, intermediate_dir, header_left=args.header_left)
+    def build(force: bool = False) -> None:
+        if recorder is not None:
+            recorder.clear()
+        try:
+            run_build(force)
+        finally:
+            if recorder is not None:
+                recorder.write(Path(args.profile), args.profile_format)
 
-    # Step 2: Merge if requested
-    if auto_merge:
-        # Determine merged path
-        if DEFAULT_MERGED_NAME.startswith("/") or DEFAULT_MERGED_NAME.startswith("./"):
-             merged_path = Path(DEFAULT_MERGED_NAME)
-        else:
-             merged_path = final_output_dir / DEFAULT_MERGED_NAME
-        
-        if merged_path.suffix.lower() != ".pdf":
-            merged_path = merged_path.with_suffix(".pdf")
-
-        print(f"Phase 2: Merging PDFs into {merged_path}...")
-        run_merge(intermediate_dir, merged_path, final_sort_order, header_left=args.header_left)
+    def run_build(force: bool) -> None:
+        run_pipeline(
+            final_input_dir,
+            intermediate_dir,
+            final_output_dir,
+            auto_merge=auto_merge,
+            auto_delete=auto_delete,
+            sort_order=final_sort_order,
+            header_left=args.header_left,
+            jobs=args.jobs,
+            force=force,
+            # PDFs only leave the intermediate directory when it was not chosen explicitly
+            move_unmerged=not args.intermediate_dir,
+            merge_mode=args.merge_mode or DEFAULT_MERGE_MODE,
+            processor=processor,
+        )
 
-        if auto_delete:
-            deleted = delete_intermediate_pdfs(intermediate_dir, merged_path)
-            print(f"Phase 3: Deleted {deleted} intermediate PDFs from {intermediate_dir}")
-            
-            # Clean up intermediate dir if empty
-            try:
-                if not any(intermediate_dir.iterdir()):
-                    intermediate_dir.rmdir()
-                    print(f"Cleaned up empty intermediate directory: {intermediate_dir}")
-            except Exception:
-                pass
-    else:
-        # If not merging, maybe move them to final output or just leave them
-        # Current behavior: they stay in intermediate_dir (which might be the output dir if defaulting to it)
-        # But wait, I changed default to .temp_pdfs. 
-        # If auto_merge is false, user probably wants them in final_output.
-        if not args.intermediate_dir:
-            # Move from .temp_pdfs to final_output
-            print(f"Moving PDFs from {intermediate_dir} to {final_output_dir}...")
-            final_output_dir.mkdir(parents=True, exist_ok=True)
-            for pdf_path in intermediate_dir.rglob("*.pdf"):
-                rel = pdf_path.relative_to(intermediate_dir)
-                dest = final_output_dir / rel
-                dest.parent.mkdir(parents=True, exist_ok=True)
-                pdf_path.replace(dest)
-            
-            # Clean up
-            try:
-                # Simple cleanup of emptied dirs
-                for d in sorted(intermediate_dir.rglob("*"), key=lambda x: len(str(x)), reverse=True):
-                    if d.is_dir() and not any(d.iterdir()):
-                        d.rmdir()
-                if not any(intermediate_dir.iterdir()):
-                    intermediate_dir.rmdir()
-            except Exception:
-                pass
-        
-        if auto_delete:
-            print("[WARN] auto-delete ignored because auto-merge is disabled.")
+    processor = Processor(SKILL_DIR / "styles")
+    recorder = processor.enable_profile() if args.profile else None
+    try:
+        build(force=args.force)
+    except RuntimeError as exc:
+        print(exc)
+        sys.exit(1)
+
+    if args.watch:
+        from watch import watch_loop
+
+        input_root = final_input_dir.resolve()
+
+        def rebuild(changed) -> None:
+            # Drop intermediates of deleted sources so they leave the merged PDF too
+            for path in changed:
+                if path.suffix == ".md" and not path.exists() and input_root in path.parents:
+                    stale = intermediate_dir / path.relative_to(input_root).with_suffix(".pdf")
+                    if stale.exists():
+                        stale.unlink()
+                        print(f"Removed {stale} (source deleted)")
+            # The build manifest limits re-rendering to the changed files
+            build()
+
+        watch_loop([final_input_dir, SKILL_DIR / "styles"], rebuild)
 
 
 if __name__ == "__main__":
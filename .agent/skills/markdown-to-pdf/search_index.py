@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Full-text search over the destinations tree.
+
+Markdown files are converted with the same MarkdownPipeline the PDFs use and
+split into heading sections (H1-H3). Sections are stored in a SQLite FTS5
+index. Chinese/Japanese/Korean text is indexed as overlapping character
+bigrams, because unicode61 would otherwise treat a whole CJK run as one
+token. Updates are incremental: only files whose content hash changed are
+re-indexed, and deleted files are dropped.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SKILL_DIR = Path(__file__).resolve().parent
+if str(SKILL_DIR) not in sys.path:
+    sys.path.insert(0, str(SKILL_DIR))
+
+from converter import DEFAULT_HTML_PARSER, MarkdownPipeline, default_cache_root, make_soup  # noqa: E402
+
+DEFAULT_CORPUS = SKILL_DIR.parents[2] / "destinations"
+DEFAULT_DB = default_cache_root() / "search" / "destinations.sqlite3"
+DEFAULT_LIMIT = 10
+SECTION_LEVELS = ("h1", "h2", "h3")
+SNIPPET_CHARS = 60
+
+# Bump when tokenization or section splitting changes; the index is then rebuilt
+INDEX_VERSION = "1"
+
+CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af\uff66-\uff9f"  # kana, CJK ideographs, hangul
+TOKEN_PATTERN = re.compile(rf"([{CJK}]+)|([^\W_{CJK}]+\*?)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    country TEXT,
+    sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    path TEXT,
+    country TEXT,
+    file TEXT,
+    heading TEXT,
+    anchor TEXT,
+    body TEXT
+);
+CREATE INDEX IF NOT EXISTS sections_path ON sections(path);
+CREATE VIRTUAL TABLE IF NOT EXISTS section_index USING fts5(heading, body, tokenize='unicode61');
+"""
+
+
+def tokenize(text: str, query: bool = False) -> List[str]:
+    """Lowercased words, with CJK runs split into overlapping bigrams.
+
+    Each indexed CJK run also ends with its last character on its own, so a
+    single-character query (searched as a prefix) finds it anywhere in a run.
+    """
+    tokens = []
+    for cjk, word in TOKEN_PATTERN.findall(text.lower()):
+        if word:
+            tokens.append(word if query else word.rstrip("*"))
+        elif len(cjk) == 1:
+            tokens.append(f"{cjk}*" if query else cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            if not query:
+                tokens.append(cjk[-1])
+    return tokens
+
+
+def build_match(query: str) -> Optional[str]:
+    """FTS5 MATCH expression: every whitespace-separated term must occur as a phrase."""
+    clauses = []
+    for term in query.split():
+        tokens = tokenize(term, query=True)
+        if not tokens:
+            continue
+        if len(tokens) == 1 and tokens[0].endswith("*"):
+            clauses.append(f'"{tokens[0][:-1]}"*')
+        else:
+            clauses.append('"' + " ".join(t.rstrip("*") for t in tokens) + '"')
+    return " AND ".join(clauses) or None
+
+
+def split_sections(html: str, title: str) -> Iterator[Tuple[str, str, str]]:
+    """Yield (heading breadcrumb, anchor, plain text) per H1-H3 section of an HTML body."""
+    soup = make_soup(html, DEFAULT_HTML_PARSER)
+    root = soup.body or soup
+    trail: Dict[str, str] = {}
+    heading, anchor, parts = title, "", []
+    for node in root.children:
+        name = getattr(node, "name", None)
+        if name in SECTION_LEVELS:
+            if parts:
+                yield heading, anchor, " ".join(parts)
+            level = SECTION_LEVELS.index(name)
+            trail = {k: v for k, v in trail.items() if SECTION_LEVELS.index(k) < level}
+            trail[name] = node.get_text(" ", strip=True)
+            heading = " > ".join(trail[k] for k in SECTION_LEVELS if k in trail)
+            anchor, parts = node.get("id", ""), []
+            continue
+        text = node.get_text(" ", strip=True) if name else str(node).strip()
+        if text:
+            parts.append(text)
+    if parts or heading != title:
+        yield heading, anchor, " ".join(parts)
+
+
+class SearchIndex:
+    """SQLite FTS5 index of Markdown sections, updated by file hash."""
+
+    def __init__(self, db_path: Path = DEFAULT_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != INDEX_VERSION:
+            self.clear()
+        self._pipeline: Optional[MarkdownPipeline] = None
+
+    def clear(self) -> None:
+        """Drop every indexed file and section."""
+        with self.conn:
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("DELETE FROM sections")
+            self.conn.execute("DELETE FROM section_index")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (INDEX_VERSION,))
+
+    @property
+    def pipeline(self) -> MarkdownPipeline:
+        if self._pipeline is None:
+            self._pipeline = MarkdownPipeline()
+        return self._pipeline
+
+    def _remove(self, path: str) -> None:
+        ids = [row[0] for row in self.conn.execute("SELECT id FROM sections WHERE path = ?", (path,))]
+        self.conn.executemany("DELETE FROM section_index WHERE rowid = ?", [(i,) for i in ids])
+        self.conn.execute("DELETE FROM sections WHERE path = ?", (path,))
+        self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _add(self, md_path: Path, country: str, digest: str, text: str) -> int:
+        path = str(md_path)
+        html = self.pipeline.convert(text)
+        count = 0
+        for heading, anchor, body in split_sections(html, md_path.stem):
+            cursor = self.conn.execute(
+                "INSERT INTO sections (path, country, file, heading, anchor, body) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, country, md_path.name, heading, anchor, body),
+            )
+            self.conn.execute(
+                "INSERT INTO section_index (rowid, heading, body) VALUES (?, ?, ?)",
+                (cursor.lastrowid, " ".join(tokenize(heading)), " ".join(tokenize(body))),
+            )
+            count += 1
+        self.conn.execute("INSERT INTO files VALUES (?, ?, ?)", (path, country, digest))
+        return count
+
+    def update(self, corpus_dir: Path, pattern: str = "*.md") -> Dict[str, int]:
+        """Index new and changed files under corpus_dir and drop deleted ones."""
+        corpus_dir = Path(corpus_dir).resolve()
+        known = {path: digest for path, digest in self.conn.execute("SELECT path, sha256 FROM files")}
+        seen = set()
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "sections": 0}
+        with self.conn:
+            for md_path in sorted(corpus_dir.rglob(pattern)):
+                path = str(md_path)
+                seen.add(path)
+                data = md_path.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                if known.get(path) == digest:
+                    stats["unchanged"] += 1
+                    continue
+                if path in known:
+                    self._remove(path)
+                    stats["updated"] += 1
+                else:
+                    stats["added"] += 1
+                rel = md_path.relative_to(corpus_dir)
+                country = rel.parts[0] if len(rel.parts) > 1 else ""
+                stats["sections"] += self._add(md_path, country, digest, data.decode("utf-8"))
+            prefix = str(corpus_dir) + "/"
+            for path in known:
+                if path.startswith(prefix) and path not in seen:
+                    self._remove(path)
+                    stats["removed"] += 1
+        return stats
+
+    def search(self, query: str, country: Optional[str] = None, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """Best-matching sections (BM25, headings weighted up) for a query."""
+        match = build_match(query)
+        if match is None:
+            return []
+        sql = ("SELECT s.country, s.file, s.heading, s.anchor, s.body, s.path, bm25(section_index, 5.0, 1.0) AS score "
+               "FROM section_index JOIN sections s ON s.id = section_index.rowid "
+               "WHERE section_index MATCH ?")
+        params: List = [match]
+        if country:
+            sql += " AND s.country = ?"
+            params.append(country)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        hits = []
+        for country_name, file_name, heading, anchor, body, path, score in self.conn.execute(sql, params):
+            hits.append({
+                "country": country_name,
+                "file": file_name,
+                "section": heading,
+                "anchor": anchor,
+                "path": path,
+                "score": round(-score, 3),
+                "snippet": make_snippet(body, query),
+            })
+        return hits
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def make_snippet(body: str, query: str) -> str:
+    """Text around the first occurrence of any query term."""
+    lowered = body.lower()
+    positions = [lowered.find(term.lower().rstrip("*")) for term in query.split()]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - SNIPPET_CHARS // 2) if positions else 0
+    snippet = body[start:start + SNIPPET_CHARS * 2].replace("\n", " ")
+    return ("…" if start else "") + snippet + ("…" if start + SNIPPET_CHARS * 2 < len(body) else "")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Index destination Markdown into SQLite FTS5 and search it by country/file/section."
+    )
+    parser.add_argument(
+        "query",
+        nargs="*",
+        help="Search terms (all must match); omit with --update to only refresh the index",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        default=str(DEFAULT_CORPUS),
+        help="Corpus directory to index (default: the repository's destinations/)",
+    )
+    parser.add_argument(
+        "--db",
+        default=str(DEFAULT_DB),
+        help=f"Index database (default: {DEFAULT_DB})",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Re-index changed files before searching (always done when the index is empty)",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Drop the index and rebuild it from scratch",
+    )
+    parser.add_argument(
+        "--country",
+        help="Only return hits from this destination folder, e.g. Japan",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=DEFAULT_LIMIT,
+        help=f"Maximum hits (default: {DEFAULT_LIMIT})",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print hits as JSON",
+    )
+
+    args = parser.parse_args()
+
+    if not args.query and not (args.update or args.rebuild):
+        parser.error("Give search terms, or --update / --rebuild to refresh the index.")
+
+    index = SearchIndex(Path(args.db))
+    try:
+        if args.rebuild:
+            index.clear()
+        empty = index.conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+        if args.update or args.rebuild or empty:
+            corpus_dir = Path(args.input)
+            if not corpus_dir.is_dir():
+                parser.error(f"Corpus directory not found: {corpus_dir}")
+            start = time.perf_counter()
+            stats = index.update(corpus_dir)
+            print(f"Index updated in {(time.perf_counter() - start) * 1000:.0f}ms: "
+                  f"{stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, "
+                  f"{stats['unchanged']} unchanged ({stats['sections']} sections written)", file=sys.stderr)
+        if not args.query:
+            return
+
+        query = " ".join(args.query)
+        start = time.perf_counter()
+        hits = index.search(query, args.country, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        index.close()
+
+    if args.json:
+        print(json.dumps(hits, ensure_ascii=False, indent=2))
+        return
+    for hit in hits:
+        location = f"{hit['country']}/{hit['file']}" if hit["country"] else hit["file"]
+        print(f"{location} § {hit['section']}  ({hit['score']})")
+        print(f"    {hit['snippet']}")
+    print(f"{len(hits)} hits in {elapsed:.1f}ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Local conversion service: keeps warm Processors and converts Markdown to PDF over HTTP.
+
+Listens on 127.0.0.1 (TCP) or a Unix socket. Requests are queued and served by
+a bounded pool of worker threads, each owning one Processor, so the Markdown
+pipeline, Mermaid/math caches, stylesheets and fonts stay loaded between calls.
+
+Endpoints:
+  POST /convert  JSON body with either "markdown" (text) or "path" (file), plus
+                 optional "theme", "landscape", "header_left", "title" and
+                 "output" (write the PDF there instead of returning it).
+                 Only application/json bodies are accepted; "path",
+                 "output" and every local image or file: resource the
+                 Markdown references must resolve inside --root (default:
+                 the cwd), and "theme" must name a stylesheet in styles/.
+  GET  /health   JSON with queue depth, worker count and cache statistics.
+"""
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SKILL_DIR = Path(__file__).resolve().parent
+if str(SKILL_DIR) not in sys.path:
+    sys.path.insert(0, str(SKILL_DIR))
+
+from converter import DEFAULT_LANDSCAPE, DEFAULT_STYLE, Processor  # noqa: E402
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 16  # Pending requests beyond this are rejected with 503
+DEFAULT_TIMEOUT = 300  # Seconds a request may wait for its result
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+class ConversionJob:
+    def __init__(self, request: Dict):
+        self.request = request
+        self.done = threading.Event()
+        self.result: Optional[bytes] = None
+        self.error: Optional[str] = None
+
+
+class ConversionService:
+    """Bounded request queue in front of a fixed pool of warm Processors."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE, root: Optional[Path] = None):
+        if workers < 1 or queue_size < 1:
+            raise ValueError("workers and queue_size must be at least 1")
+        self.jobs: "queue.Queue[ConversionJob]" = queue.Queue(maxsize=queue_size)
+        # Requests may only read and write inside root; default to the directory the service runs in
+        self.root = (root or Path.cwd()).resolve()
+        self.themes = {path.stem for path in (SKILL_DIR / "styles").glob("*.css")}
+        self.processors: List[Processor] = []
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        for index in range(workers):
+            processor = Processor(SKILL_DIR / "styles")
+            # Images and file: resources referenced by the Markdown are confined too
+            processor.confine(self.root)
+            self.processors.append(processor)
+            thread = threading.Thread(target=self._work, args=(processor,), name=f"convert-{index}", daemon=True)
+            thread.start()
+
+    def submit(self, request: Dict) -> ConversionJob:
+        """Queue a request; raises queue.Full when the service is saturated."""
+        job = ConversionJob(request)
+        self.jobs.put_nowait(job)
+        return job
+
+    def _work(self, processor: Processor) -> None:
+        # Load Markdown extensions, WeasyPrint, fonts and the default stylesheet before the first request
+        try:
+            processor.convert_text("# warm-up", "warm-up", DEFAULT_STYLE)
+        except Exception as exc:
+            print(f"[WARN] Warm-up conversion failed: {exc}")
+        while True:
+            job = self.jobs.get()
+            try:
+                job.result = self._convert(processor, job.request)
+                with self._lock:
+                    self.completed += 1
+            except Exception as exc:
+                job.error = str(exc)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                job.done.set()
+
+    def _resolve_path(self, raw: str) -> Path:
+        path = Path(raw).expanduser()
+        if not path.is_absolute():
+            path = self.root / path
+        path = path.resolve()
+        if self.root not in path.parents and path != self.root:
+            raise ValueError(f"Path outside allowed root: {path}")
+        return path
+
+    def _convert(self, processor: Processor, request: Dict) -> bytes:
+        theme = request.get("theme") or DEFAULT_STYLE
+        if theme not in self.themes:
+            raise ValueError(f"Unknown theme {theme!r}; available: {', '.join(sorted(self.themes))}")
+        options = {
+            "landscape": bool(request.get("landscape", DEFAULT_LANDSCAPE)),
+            "header_left": request.get("header_left"),
+        }
+        if request.get("path"):
+            source = self._resolve_path(request["path"])
+            md_text = source.read_text(encoding="utf-8")
+            title = request.get("title") or source.stem.title()
+            # Relative image paths resolve against the Markdown file's folder
+            options["base_dir"] = source.parent
+        elif "markdown" in request:
+            md_text = request["markdown"]
+            title = request.get("title") or "Document"
+        else:
+            raise ValueError('Request needs "markdown" or "path"')
+
+        pdf_bytes = processor.convert_text(md_text, title, theme, **options)
+        if request.get("output"):
+            output = self._resolve_path(request["output"])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_bytes(pdf_bytes)
+        return pdf_bytes
+
+    def health(self) -> Dict:
+        return {
+            "workers": len(self.processors),
+            "queued": self.jobs.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "caches": [processor.cache_stats() for processor in self.processors],
+        }
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    service: ConversionService = None  # set by make_server
+    timeout_seconds: float = DEFAULT_TIMEOUT
+
+    def address_string(self) -> str:
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/health":
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/convert":
+            self._send_json(404, {"error": "not found"})
+            return
+        # Browsers can send text/plain POSTs cross-origin without a preflight; only accept JSON
+        content_type = (self.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+        if content_type != "application/json":
+            self._send_json(415, {"error": "Content-Type must be application/json"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self._send_json(413 if length else 400, {"error": "missing or oversized body"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            if not isinstance(request, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as exc:
+            self._send_json(400, {"error": f"invalid JSON: {exc}"})
+            return
+
+        try:
+            job = self.service.submit(request)
+        except queue.Full:
+            self._send_json(503, {"error": "conversion queue is full, retry later"})
+            return
+        if not job.done.wait(self.timeout_seconds):
+            self._send_json(504, {"error": "conversion timed out"})
+            return
+        if job.error:
+            self._send_json(500, {"error": job.error})
+            return
+        if request.get("output"):
+            self._send_json(200, {"output": request["output"], "bytes": len(job.result)})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(job.result)))
+        self.end_headers()
+        self.wfile.write(job.result)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: ConversionService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                socket_path: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT):
+    handler = type("BoundConversionHandler", (ConversionHandler,), {"service": service, "timeout_seconds": timeout})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return ThreadingUnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run a local Markdown-to-PDF conversion service with warm renderers."
+    )
+    parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help=f"Interface to bind (default: {DEFAULT_HOST})",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"TCP port (default: {DEFAULT_PORT})",
+    )
+    parser.add_argument(
+        "--socket",
+        help="Listen on this Unix socket path instead of TCP",
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=DEFAULT_WORKERS,
+        help=f"Worker threads, each with its own warm Processor (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=positive_int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"Maximum pending requests before answering 503 (default: {DEFAULT_QUEUE_SIZE})",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f"Seconds a request waits for its PDF (default: {DEFAULT_TIMEOUT})",
+    )
+    parser.add_argument(
+        "--root",
+        help="Only allow 'path'/'output' requests inside this directory (default: current directory)",
+    )
+
+    args = parser.parse_args()
+
+    service = ConversionService(args.workers, args.queue_size, Path(args.root) if args.root else None)
+    server = make_server(service, args.host, args.port, args.socket, args.timeout)
+    where = args.socket or f"http://{args.host}:{args.port}"
+    print(f"Conversion service listening on {where} ({args.workers} workers). Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
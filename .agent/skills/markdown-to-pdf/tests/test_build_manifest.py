@@ -0,0 +1,133 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from converter import BuildManifest, Processor, manifest_path_for
+
+SKILL_DIR = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def build(tmp_path):
+    """A Processor with its own copy of the themes, one source and one already built output."""
+    style_dir = tmp_path / "styles"
+    shutil.copytree(SKILL_DIR / "styles", style_dir)
+    source = tmp_path / "docs" / "itinerary.md"
+    source.parent.mkdir()
+    source.write_text("# Day 1\n\nTokyo\n", encoding="utf-8")
+    output = tmp_path / "pdf" / "itinerary.pdf"
+    output.parent.mkdir()
+    output.write_bytes(b"%PDF-1.7 stub")
+    processor = Processor(style_dir, manifest=BuildManifest(manifest_path_for(output.parent)))
+    processor.record_outputs(source, output, "odoo_doc", landscape=False)
+    return processor, source, output
+
+
+def test_recorded_output_is_up_to_date(build):
+    processor, source, output = build
+
+    assert processor.is_up_to_date(source, output, "odoo_doc", landscape=False)
+
+
+def test_manifest_survives_a_new_process(build):
+    processor, source, output = build
+    reloaded = Processor(processor.themes.style_dir, manifest=BuildManifest(processor.manifest.path))
+
+    assert reloaded.is_up_to_date(source, output, "odoo_doc", landscape=False)
+
+
+def test_source_edit_invalidates(build):
+    processor, source, output = build
+    source.write_text("# Day 1\n\nKyoto\n", encoding="utf-8")
+
+    assert not processor.is_up_to_date(source, output, "odoo_doc", landscape=False)
+
+
+def test_theme_css_edit_invalidates(build):
+    processor, source, output = build
+    css = processor.themes.style_dir / "odoo_doc.css"
+    css.write_text(css.read_text(encoding="utf-8") + "\nh1 { color: red; }\n", encoding="utf-8")
+
+    assert not processor.is_up_to_date(source, output, "odoo_doc", landscape=False)
+
+
+@pytest.mark.parametrize("theme, options", [
+    ("technical", {"landscape": False}),
+    ("odoo_doc", {"landscape": True}),
+    ("odoo_doc", {"landscape": False, "header_left": "Japan 2026"}),
+    ("odoo_doc", {"landscape": False, "font_glyphs": "東京"}),
+    ("odoo_doc", {"landscape": False, "force": True}),
+])
+def test_option_change_invalidates(build, theme, options):
+    processor, source, output = build
+
+    assert not processor.is_up_to_date(source, output, theme, **options)
+
+
+def test_batch_glyph_set_change_invalidates(build):
+    processor, source, output = build
+    processor.record_outputs(source, output, "odoo_doc", font_glyphs="東京")
+
+    assert processor.is_up_to_date(source, output, "odoo_doc", font_glyphs="京東")
+    assert not processor.is_up_to_date(source, output, "odoo_doc", font_glyphs="東京大阪")
+
+
+def test_converter_version_bump_invalidates(build, monkeypatch):
+    processor, source, output = build
+    monkeypatch.setattr("converter.CONVERTER_VERSION", "0.0.0-test")
+
+    assert not processor.is_up_to_date(source, output, "odoo_doc", landscape=False)
+
+
+def test_missing_output_is_rebuilt(build):
+    processor, source, output = build
+    output.unlink()
+
+    assert not processor.is_up_to_date(source, output, "odoo_doc", landscape=False)
+
+
+def test_forget_drops_the_entry(build):
+    processor, source, output = build
+    processor.manifest.forget(output)
+
+    assert not processor.is_up_to_date(source, output, "odoo_doc", landscape=False)
+    assert BuildManifest(processor.manifest.path).entries == {}
+
+
+def test_unreadable_manifest_starts_empty(tmp_path, capsys):
+    path = tmp_path / "pdf.manifest.json"
+    path.write_text("{not json", encoding="utf-8")
+
+    assert BuildManifest(path).entries == {}
+    assert "Ignoring unreadable build manifest" in capsys.readouterr().out
+
+
+def test_save_leaves_no_temp_files(build):
+    processor, _, _ = build
+
+    assert not list(processor.manifest.path.parent.glob("*.tmp"))
+
+
+def test_embedded_image_edit_invalidates(build):
+    processor, source, output = build
+    image = source.parent / "images" / "map.png"
+    image.parent.mkdir()
+    image.write_bytes(b"\x89PNG v1")
+    source.write_text("# Day 1\n\n![Map](images/map.png \"Route\")\n", encoding="utf-8")
+    processor.record_outputs(source, output, "odoo_doc")
+
+    assert processor.is_up_to_date(source, output, "odoo_doc")
+    image.write_bytes(b"\x89PNG v2")
+    assert not processor.is_up_to_date(source, output, "odoo_doc")
+
+
+def test_image_dependencies_follow_inline_html_and_reference_images(build):
+    processor, source, _ = build
+    for name in ("a.png", "b.jpg", "c.svg", "linked.pdf"):
+        (source.parent / name).write_bytes(b"data")
+    source.write_text('![A](a.png)\n<img src="b.jpg">\n![C][chart]\n[doc](linked.pdf)\n'
+                      '![remote](https://example.com/x.png)\n![gone](missing.png)\n\n[chart]: c.svg\n',
+                      encoding="utf-8")
+
+    assert [p.name for p in processor.image_dependencies(source)] == ["a.png", "b.jpg", "c.svg"]
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pytest
+
+from converter import Processor, make_soup
+
+SKILL_DIR = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def confined(tmp_path):
+    root = tmp_path / "root"
+    (root / "images").mkdir(parents=True)
+    (root / "images" / "inside.svg").write_text("<svg/>", encoding="utf-8")
+    outside = tmp_path / "secret.svg"
+    outside.write_text("<svg/>", encoding="utf-8")
+    processor = Processor(SKILL_DIR / "styles")
+    processor.confine(root)
+    return processor, root, outside
+
+
+def test_images_outside_root_are_not_served(confined):
+    processor, root, outside = confined
+    soup = make_soup(f'<img src="images/inside.svg"><img src="{outside}"><img src="{outside.as_uri()}">', "html.parser")
+
+    assert processor.assets.process_tree(soup, base_dir=root) == 1
+    assert [img["src"] for img in soup.find_all("img")][1:] == [str(outside), outside.as_uri()]
+
+
+def test_file_urls_outside_root_are_refused(confined):
+    processor, root, outside = confined
+
+    assert processor.fetcher.local_path((root / "images" / "inside.svg").as_uri()) == root / "images" / "inside.svg"
+    with pytest.raises(ValueError):
+        processor.fetcher.local_path(outside.as_uri())
+    assert processor.fetcher.stats()["blocked"] == 1
+
+
+def test_own_caches_stay_readable(confined):
+    processor, _, _ = confined
+    cached = processor.assets.caches["png"].root / "subset.png"
+    cached.write_bytes(b"png")
+
+    assert processor.fetcher.local_path(cached.as_uri()) == cached.resolve()
+
+
+def test_unconfined_processor_reads_anywhere(tmp_path):
+    image = tmp_path / "a.svg"
+    image.write_text("<svg/>", encoding="utf-8")
+
+    assert Processor(SKILL_DIR / "styles").fetcher.local_path(image.as_uri()) == image
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+from converter import DiskCache
+
+
+def age(cache: DiskCache, key: str, seconds: float) -> None:
+    """Backdate an entry's mtime (the LRU clock)."""
+    stamp = time.time() - seconds
+    os.utime(cache.path_for(key), (stamp, stamp))
+
+
+def test_put_then_get_round_trips(tmp_path):
+    cache = DiskCache(tmp_path / "svg", "svg")
+    key = cache.make_key("graph TD", "neutral", 2)
+    cache.put(key, "<svg>A</svg>")
+
+    assert cache.contains(key)
+    assert DiskCache(tmp_path / "svg", "svg").get(key) == "<svg>A</svg>"
+    assert cache.stats()["writes"] == 1
+
+
+def test_make_key_depends_on_every_part():
+    assert DiskCache.make_key("a", {"x": 1}) == DiskCache.make_key("a", {"x": 1})
+    assert DiskCache.make_key("a", {"x": 1}) != DiskCache.make_key("a", {"x": 2})
+    assert DiskCache.make_key("a", "b") != DiskCache.make_key("ab")
+
+
+def test_missing_entry_counts_a_miss(tmp_path):
+    cache = DiskCache(tmp_path, "svg")
+
+    assert cache.get(cache.make_key("absent")) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_put_replaces_atomically_and_leaves_no_temp_files(tmp_path):
+    cache = DiskCache(tmp_path, "svg")
+    key = cache.make_key("diagram")
+    cache.put(key, "<svg>old</svg>")
+    cache.put(key, "<svg>new</svg>")
+
+    assert cache.path_for(key).read_text(encoding="utf-8") == "<svg>new</svg>"
+    assert sorted(p.name for p in tmp_path.iterdir()) == [f"{key}.svg"]
+
+
+def test_put_file_moves_the_produced_file(tmp_path):
+    cache = DiskCache(tmp_path / "cache", "svg")
+    produced = tmp_path / "out-1.svg"
+    produced.write_text("<svg>B</svg>", encoding="utf-8")
+    key = cache.make_key("B")
+    cache.put_file(key, produced)
+
+    assert not produced.exists()
+    assert cache.get(key) == "<svg>B</svg>"
+
+
+def test_corrupt_entry_is_a_miss_and_is_dropped(tmp_path):
+    cache = DiskCache(tmp_path, "svg")
+    key = cache.make_key("corrupt")
+    cache.path_for(key).write_bytes(b"\xff\xfe\x00broken")
+
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 1
+    assert not cache.contains(key)
+
+
+def test_hit_refreshes_the_lru_clock(tmp_path):
+    cache = DiskCache(tmp_path, "svg")
+    key = cache.make_key("warm")
+    cache.put(key, "<svg/>")
+    age(cache, key, 3600)
+    cache.get(key)
+
+    assert time.time() - cache.path_for(key).stat().st_mtime < 60
+
+
+def test_evict_drops_least_recently_used_entries_over_the_size_limit(tmp_path):
+    cache = DiskCache(tmp_path, "svg", max_bytes=250)
+    keys = [cache.make_key(i) for i in range(3)]
+    for index, key in enumerate(keys):
+        cache.put(key, "x" * 100)
+        age(cache, key, 300 - index * 100)  # keys[0] is the oldest
+    cache.get(keys[0])  # ...until it is read again
+
+    assert cache.evict() == 1
+    assert [cache.contains(key) for key in keys] == [True, False, True]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evict_drops_entries_older_than_max_age(tmp_path):
+    cache = DiskCache(tmp_path, "svg", max_age_days=1)
+    stale, fresh = cache.make_key("stale"), cache.make_key("fresh")
+    cache.put(stale, "<svg/>")
+    cache.put(fresh, "<svg/>")
+    age(cache, stale, 2 * 86400)
+
+    assert cache.evict() == 1
+    assert not cache.contains(stale) and cache.contains(fresh)
+
+
+def test_evict_ignores_other_files(tmp_path):
+    cache = DiskCache(tmp_path, "svg", max_bytes=0)
+    (tmp_path / "mermaid_config_0123.json").write_text("{}", encoding="utf-8")
+    cache.put(cache.make_key("a"), "<svg/>")
+
+    cache.evict()
+    assert [p.name for p in tmp_path.iterdir()] == ["mermaid_config_0123.json"]
+
+
+def test_memory_layer_serves_repeat_lookups_and_stays_bounded(tmp_path):
+    cache = DiskCache(tmp_path, "svg", memory_items=2)
+    keys = [cache.make_key(i) for i in range(3)]
+    for key in keys:
+        cache.put(key, f"<svg>{key}</svg>")
+
+    assert cache.get(keys[2]) == f"<svg>{keys[2]}</svg>"
+    assert cache.stats()["memory_hits"] == 1
+    assert keys[0] not in cache._memory
+    assert cache.get(keys[0]) == f"<svg>{keys[0]}</svg>"  # still on disk
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_concurrent_access_keeps_counters_and_memory_consistent(tmp_path):
+    cache = DiskCache(tmp_path, "svg", memory_items=8)
+    keys = [cache.make_key(i) for i in range(32)]
+    rounds = 200
+
+    def worker(offset):
+        for i in range(rounds):
+            key = keys[(offset + i) % len(keys)]
+            if cache.get(key) is None:
+                cache.put(key, f"<svg>{key}</svg>")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats["hits"] + stats["misses"] == 8 * rounds
+    assert len(cache._memory) <= 8
+
+
+def test_evict_counts_entries_removed_concurrently_as_gone(tmp_path, monkeypatch):
+    cache = DiskCache(tmp_path, "svg", max_bytes=12)
+    keys = [cache.make_key(i) for i in range(3)]
+    for index, key in enumerate(keys):
+        cache.put(key, "<svg/>")  # 6 bytes each
+        age(cache, key, 300 - index * 100)  # keys[0] is the oldest
+    real_unlink = Path.unlink
+
+    def unlink_raced(self, *args, **kwargs):
+        # Another evictor removes the oldest entry just before this one does
+        if self == cache.path_for(keys[0]):
+            real_unlink(self)
+        return real_unlink(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "unlink", unlink_raced)
+
+    # Its bytes are gone either way, so nothing else has to be dropped
+    assert cache.evict() == 0
+    assert [cache.contains(key) for key in keys] == [False, True, True]
@@ -0,0 +1,36 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+from converter import HtmlTransformer, MermaidRenderer, ThemeManager, parse_fragment, serialize_fragment
+
+STYLE_DIR = Path(__file__).resolve().parents[1] / "styles"
+
+PARSERS = ["html.parser", pytest.param("lxml", marks=pytest.mark.skipif(
+    importlib.util.find_spec("lxml") is None, reason="lxml not installed"))]
+
+
+@pytest.mark.parametrize("parser", PARSERS)
+def test_leading_style_survives_round_trip(parser):
+    html = "<style>p{color:red}</style>\n<p>x</p>"
+
+    assert serialize_fragment(parse_fragment(html, parser)) == html
+
+
+@pytest.mark.parametrize("parser", PARSERS)
+def test_leading_comment_survives_round_trip(parser):
+    html = "<!-- generated -->\n<p>x</p>"
+
+    assert serialize_fragment(parse_fragment(html, parser)) == html
+
+
+@pytest.mark.parametrize("parser", PARSERS)
+def test_transform_keeps_leading_head_elements(tmp_path, parser):
+    transformer = HtmlTransformer(MermaidRenderer(cache_dir=tmp_path / "mermaid"),
+                                  ThemeManager(STYLE_DIR, cache_dir=tmp_path / "math"), parser=parser)
+    html = transformer.transform('<!-- note -->\n<style>p{color:red}</style>\n<meta charset="utf-8"/>\n'
+                                 '<blockquote><p>[!TIP] Book early</p></blockquote>')
+
+    assert html.startswith('<!-- note -->\n<style>p{color:red}</style>\n<meta charset="utf-8"/>')
+    assert 'class="alert alert-tip"' in html
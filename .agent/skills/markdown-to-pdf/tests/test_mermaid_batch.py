@@ -0,0 +1,92 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+from converter import MermaidRenderer
+
+# Logs every call to $STUB_MMDC_LOG; a batch writes out-N.svg holding the N-th block's source,
+# and fails without output when $STUB_MMDC_FAIL_BATCH is set.
+STUB_MMDC = '''\
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+args = sys.argv[1:]
+if "--version" in args:
+    print("stub-mmdc 1.0")
+    sys.exit(0)
+source = Path(args[args.index("-i") + 1])
+output = Path(args[args.index("-o") + 1])
+with open(os.environ["STUB_MMDC_LOG"], "a", encoding="utf-8") as log:
+    log.write(json.dumps({"input": source.suffix}) + "\\n")
+if source.suffix == ".md":
+    if os.environ.get("STUB_MMDC_FAIL_BATCH"):
+        print("batch failed", file=sys.stderr)
+        sys.exit(1)
+    blocks = re.findall(r"^```mermaid\\n(.*?)\\n```$", source.read_text(encoding="utf-8"), re.MULTILINE | re.DOTALL)
+    for index, block in enumerate(blocks, start=1):
+        (output.parent / f"{output.stem}-{index}.svg").write_text(f"<svg>{block}</svg>", encoding="utf-8")
+else:
+    output.write_text(f"<svg>{source.read_text(encoding='utf-8')}</svg>", encoding="utf-8")
+'''
+
+SOURCES = ["graph TD\n  A --> B", "graph LR\n  X --> Y", "sequenceDiagram\n  P->>Q: hi"]
+
+
+@pytest.fixture
+def stub_mmdc(tmp_path, monkeypatch):
+    script = tmp_path / "mmdc"
+    script.write_text(f"#!{sys.executable}\n{STUB_MMDC}", encoding="utf-8")
+    script.chmod(0o755)
+    log = tmp_path / "mmdc.log"
+    monkeypatch.setenv("MMDC_PATH", str(script))
+    monkeypatch.setenv("STUB_MMDC_LOG", str(log))
+
+    def calls():
+        if not log.exists():
+            return []
+        return [json.loads(line)["input"] for line in log.read_text(encoding="utf-8").splitlines()]
+
+    return calls
+
+
+def make_renderer(tmp_path: Path) -> MermaidRenderer:
+    return MermaidRenderer(cache_dir=tmp_path / "mermaid", batch_mode=True, pool_size=1)
+
+
+def test_prefetch_renders_all_diagrams_in_one_batch(tmp_path, stub_mmdc):
+    renderer = make_renderer(tmp_path)
+
+    assert renderer.prefetch(SOURCES) == len(SOURCES)
+    assert stub_mmdc() == [".md"]
+    # Each out-N.svg landed under the key of the N-th fence
+    for source in SOURCES:
+        assert renderer.cache.get(renderer.cache_key(source)) == f"<svg>{source}</svg>"
+
+
+def test_prefetched_diagrams_are_not_rendered_again(tmp_path, stub_mmdc):
+    renderer = make_renderer(tmp_path)
+    renderer.prefetch(SOURCES)
+
+    assert [renderer._render_diagram(source) for source in SOURCES] == [f"<svg>{s}</svg>" for s in SOURCES]
+    assert renderer.prefetch(SOURCES) == 0
+    assert stub_mmdc() == [".md"]
+
+
+def test_failed_batch_falls_back_to_per_diagram_rendering(tmp_path, stub_mmdc, monkeypatch):
+    monkeypatch.setenv("STUB_MMDC_FAIL_BATCH", "1")
+    renderer = make_renderer(tmp_path)
+
+    assert renderer.prefetch(SOURCES) == 0
+    assert [renderer._render_diagram(source) for source in SOURCES] == [f"<svg>{s}</svg>" for s in SOURCES]
+    assert stub_mmdc() == [".md", ".mmd", ".mmd", ".mmd"]
+
+
+def test_indented_fences_match_the_pipeline_source():
+    md_text = "1. Step\n\n    ```mermaid\n    graph TD\n      A --> B\n    ```\n"
+
+    assert MermaidRenderer.extract_sources(md_text) == ["graph TD\n  A --> B"]
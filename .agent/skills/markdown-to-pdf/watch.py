@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+File watching for --watch modes: yields batches of changed Markdown, CSS and image files.
+
+Uses watchdog (inotify on Linux, FSEvents on macOS) when installed and falls
+back to mtime polling otherwise.
+"""
+
+import fnmatch
+import queue
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
+
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.PNG", "*.JPG", "*.JPEG")
+DEFAULT_PATTERNS = ("*.md", "*.css") + IMAGE_PATTERNS
+DEFAULT_POLL_INTERVAL = 1.0  # seconds between scans in polling mode
+DEFAULT_DEBOUNCE = 0.3  # seconds to wait for a burst of saves to settle
+
+
+class ChangeWatcher:
+    """Watch files and directories and report changed paths in debounced batches."""
+
+    def __init__(
+        self,
+        roots: Iterable[Path],
+        patterns: Iterable[str] = DEFAULT_PATTERNS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        debounce: float = DEFAULT_DEBOUNCE,
+        use_native: bool = True,
+    ):
+        self.roots = [Path(r).resolve() for r in roots]
+        self.patterns = tuple(patterns)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._events: "queue.Queue[Path]" = queue.Queue()
+        self._observer = self._start_native() if use_native else None
+        self.mode = "native" if self._observer else "polling"
+        self._snapshot = self._scan() if self._observer is None else {}
+
+    def _matches(self, path: Path) -> bool:
+        if any(path == root for root in self.roots):
+            return True
+        if not any(root in path.parents for root in self.roots if root.is_dir()):
+            return False
+        return any(fnmatch.fnmatch(path.name, pattern) for pattern in self.patterns)
+
+    def _start_native(self):
+        try:
+            from watchdog.events import FileSystemEventHandler  # type: ignore
+            from watchdog.observers import Observer  # type: ignore
+        except ImportError:
+            return None
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                for attr in ("src_path", "dest_path"):
+                    raw = getattr(event, attr, None)
+                    if raw:
+                        path = Path(raw).resolve()
+                        if watcher._matches(path):
+                            watcher._events.put(path)
+
+        observer = Observer()
+        watched = set()
+        for root in self.roots:
+            directory = root if root.is_dir() else root.parent
+            if directory not in watched:
+                observer.schedule(Handler(), str(directory), recursive=root.is_dir())
+                watched.add(directory)
+        observer.start()
+        return observer
+
+    def _scan(self) -> Dict[Path, Tuple[float, int]]:
+        snapshot = {}
+        for root in self.roots:
+            if root.is_file():
+                candidates: Iterable[Path] = [root]
+            elif root.is_dir():
+                candidates = (p for pattern in self.patterns for p in root.rglob(pattern))
+            else:
+                continue
+            for path in candidates:
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                snapshot[path.resolve()] = (st.st_mtime, st.st_size)
+        return snapshot
+
+    def _poll(self) -> Set[Path]:
+        current = self._scan()
+        changed = {p for p, sig in current.items() if self._snapshot.get(p) != sig}
+        changed |= set(self._snapshot) - set(current)  # deletions
+        self._snapshot = current
+        return changed
+
+    def changes(self) -> Iterator[Set[Path]]:
+        """Block until files change and yield each debounced batch of paths."""
+        while True:
+            if self._observer is None:
+                time.sleep(self.poll_interval)
+                batch = self._poll()
+                if batch:
+                    time.sleep(self.debounce)
+                    batch |= self._poll()
+            else:
+                batch = {self._events.get()}
+                deadline = time.monotonic() + self.debounce
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.add(self._events.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            if batch:
+                yield batch
+
+    def close(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+
+def watch_loop(roots: List[Path], on_change: Callable[[Set[Path]], None], patterns: Iterable[str] = DEFAULT_PATTERNS) -> None:
+    """Run on_change for every batch of changes until interrupted with Ctrl+C."""
+    watcher = ChangeWatcher(roots, patterns)
+    print(f"Watching {', '.join(str(r) for r in watcher.roots)} ({watcher.mode}). Press Ctrl+C to stop.")
+    try:
+        for changed in watcher.changes():
+            start = time.perf_counter()
+            try:
+                on_change(changed)
+            except Exception as exc:
+                print(f"[ERROR] Rebuild failed: {exc}")
+            print(f"Rebuilt in {time.perf_counter() - start:.2f}s; waiting for changes...")
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.close()